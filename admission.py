@@ -0,0 +1,287 @@
+"""
+Transaction admission in stages, so a request only waits for the work its transaction needs:
+  - decode: parse the transaction and check what can be checked without the chain
+  - signature: verify signatures on a pool of processes, many at a time
+  - admit: check the balance and nonce and add to the mempool, one at a time, in the order
+    the transactions were submitted
+  - persist: save the admitted transactions and announce them, in batches
+Stages hand transactions over through bounded queues. Once a queue is full, submitting waits
+for room, and turns the transaction down after a timeout.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from custom_exceptions import AdmissionQueueFullError
+from transaction import SignedRawTransaction
+from verification import Verification
+from wallet import Wallet
+
+logger = logging.getLogger(__name__)
+
+# Most transactions waiting for each stage
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "10000"))
+
+# Processes verifying signatures
+SIGNATURE_WORKERS = int(os.getenv("SIGNATURE_WORKERS", str(os.cpu_count() or 1)))
+
+# Most admitted transactions saved at once
+PERSIST_BATCH = 1000
+
+STAGES = ("decode", "signature", "admit", "persist")
+
+# (transaction hash, reason it was turned down or None if it was added)
+AdmissionResult = Tuple[str, Optional[str]]
+
+
+def check_fields(tx: SignedRawTransaction) -> Optional[str]:
+    """
+    The reason a transaction is malformed, or None. Only looks at the transaction itself
+    """
+    details = tx.details
+    if details.nonce < 0:
+        return "The nonce can't be negative"
+    try:
+        public_key = bytes.fromhex(details.public_key)
+        signature = bytes.fromhex(tx.signature)
+    except ValueError:
+        return "The public key and signature must be hex encoded"
+    if len(public_key) != 64 or len(signature) != 64:
+        return "The public key and signature must be 64 bytes each"
+    return None
+
+
+def verify_signature(tx: SignedRawTransaction) -> bool:
+    """
+    Runs in the signature processes. A bad signature raises rather than returning False
+    """
+    try:
+        return Wallet.verify_signature(tx)
+    except Exception:  # pylint: disable=broad-except
+        return False
+
+
+class StageStats(BaseModel):
+    """
+    processed : <int> Transactions that went through the stage
+    rejected : <int> Transactions the stage turned down
+    queued : <int> Transactions waiting for the stage
+    average_latency : <float> Average seconds a transaction waited for and spent in the stage
+    max_latency : <float> Most seconds a transaction waited for and spent in the stage
+    """
+
+    processed: int = 0
+    rejected: int = 0
+    queued: int = 0
+    average_latency: float = 0.0
+    max_latency: float = 0.0
+
+
+class AdmissionStats(BaseModel):
+    """
+    stages : <Dict[str, StageStats]> Statistics of every stage, by name
+    """
+
+    stages: Dict[str, StageStats]
+
+
+class Admission:
+    """
+    A transaction going through the pipeline
+
+    transaction : <SignedRawTransaction> The decoded transaction
+    transaction_hash : <str> Its hash
+    result : <Future> Resolves to an AdmissionResult once it was added or turned down
+    signature : <optional Future> Resolves to whether the signature is valid
+    entered : <float> time.monotonic() when it entered its current stage
+    """
+
+    def __init__(self, transaction: SignedRawTransaction) -> None:
+        self.transaction = transaction
+        self.transaction_hash = Verification.hash_transaction(transaction)
+        self.result = Future()  # type: Future
+        self.signature = None  # type: Optional[Future]
+        self.entered = time.monotonic()
+
+
+class AdmissionPipeline:  # pylint: disable=too-many-instance-attributes
+    """
+    admit is called with a transaction whose signature is valid, and raises if it is
+    turned down. persist is called once for every batch of admitted transactions.
+    Threads and processes are started with the first submitted transaction
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        admit: Callable[[SignedRawTransaction], None],
+        persist: Callable[[], None],
+        max_queue: int = ADMISSION_QUEUE,
+        signature_workers: int = SIGNATURE_WORKERS,
+        persist_batch: int = PERSIST_BATCH,
+    ) -> None:
+        self.admit = admit
+        self.persist = persist
+        self.max_queue = max_queue
+        self.signature_workers = signature_workers
+        self.persist_batch = persist_batch
+        self.__admitting = queue.Queue(max_queue)  # type: queue.Queue
+        self.__persisting = queue.Queue(max_queue)  # type: queue.Queue
+        self.__stats = {s: StageStats() for s in STAGES}  # type: Dict[str, StageStats]
+        self.__latency = {s: 0.0 for s in STAGES}  # type: Dict[str, float]
+        # Signatures submitted to the processes and not verified yet
+        self.__verifying = 0
+        self.__lock = threading.Lock()
+        self.__pool = None  # type: Optional[ProcessPoolExecutor]
+        self.__threads = []  # type: List[threading.Thread]
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__pool is not None:
+                return
+            # Spawned rather than forked, as the node runs threads already
+            self.__pool = ProcessPoolExecutor(
+                max_workers=self.signature_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            for (name, target) in (
+                ("admission-admit", self.__run_admit),
+                ("admission-persist", self.__run_persist),
+            ):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def __record(self, stage: str, admission: Admission, rejected: bool = False) -> None:
+        now = time.monotonic()
+        latency = now - admission.entered
+        admission.entered = now
+        with self.__lock:
+            stats = self.__stats[stage]
+            stats.processed += 1
+            stats.rejected += int(rejected)
+            self.__latency[stage] += latency
+            stats.average_latency = self.__latency[stage] / stats.processed
+            stats.max_latency = max(stats.max_latency, latency)
+
+    def __reject(self, stage: str, admission: Admission, error: str) -> None:
+        logger.info("Transaction %s turned down: %s", admission.transaction_hash, error)
+        self.__record(stage, admission, rejected=True)
+        admission.result.set_result((admission.transaction_hash, error))
+
+    def submit(
+        self,
+        transaction: Union[SignedRawTransaction, bytes],
+        timeout: Optional[float] = None,
+    ) -> Future:
+        """
+        Decode and check a transaction, and queue it for the next stages. Returns a future
+        resolving to an AdmissionResult. Raises AdmissionQueueFullError if there is still
+        no room after timeout seconds
+        """
+        self.__start()
+        started = time.monotonic()
+        if isinstance(transaction, bytes):
+            transaction = SignedRawTransaction.ParseFromString(transaction)
+        admission = Admission(transaction)
+        admission.entered = started
+
+        error = check_fields(transaction)
+        if error is not None:
+            self.__reject("decode", admission, error)
+            return admission.result
+        self.__record("decode", admission)
+
+        assert self.__pool is not None
+        with self.__lock:
+            self.__verifying += 1
+        admission.signature = self.__pool.submit(verify_signature, transaction)
+        admission.signature.add_done_callback(self.__verified)
+        try:
+            # Transactions are admitted in the order they were queued, so a sender's chain
+            # of nonces stays in order while signatures are verified out of order
+            self.__admitting.put(admission, timeout=timeout)
+        except queue.Full as e:
+            admission.signature.cancel()
+            raise AdmissionQueueFullError(admission.transaction_hash, self.max_queue) from e
+        return admission.result
+
+    def __verified(self, _signature: Future) -> None:
+        with self.__lock:
+            self.__verifying -= 1
+
+    def __run_admit(self) -> None:
+        while True:
+            admission = self.__admitting.get()
+            if admission is None:
+                self.__persisting.put(None)
+                return
+            try:
+                assert admission.signature is not None
+                if not admission.signature.result():
+                    self.__reject("signature", admission, "The signature is not valid")
+                    continue
+                self.__record("signature", admission)
+
+                try:
+                    self.admit(admission.transaction)
+                except Exception as e:  # pylint: disable=broad-except
+                    self.__reject("admit", admission, str(e) or type(e).__name__)
+                    continue
+                self.__record("admit", admission)
+                self.__persisting.put(admission)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception(e)
+                admission.result.set_result((admission.transaction_hash, str(e)))
+
+    def __run_persist(self) -> None:
+        while True:
+            batch = [self.__persisting.get()]
+            while batch[-1] is not None and len(batch) < self.persist_batch:
+                try:
+                    batch.append(self.__persisting.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if not batch:
+                return
+            try:
+                self.persist()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception(e)
+            for admission in batch:
+                self.__record("persist", admission)
+                admission.result.set_result((admission.transaction_hash, None))
+            if stopping:
+                return
+
+    def shutdown(self) -> None:
+        """
+        Stop once the transactions submitted so far went through every stage
+        """
+        with self.__lock:
+            (pool, threads) = (self.__pool, self.__threads)
+            (self.__pool, self.__threads) = (None, [])
+        if pool is None:
+            return
+        self.__admitting.put(None)
+        for thread in threads:
+            thread.join()
+        pool.shutdown()
+
+    def stats(self) -> AdmissionStats:
+        with self.__lock:
+            stages = {s: stats.copy() for (s, stats) in self.__stats.items()}
+            stages["signature"].queued = self.__verifying
+        stages["admit"].queued = self.__admitting.qsize()
+        stages["persist"].queued = self.__persisting.qsize()
+        return AdmissionStats(stages=stages)
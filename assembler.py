@@ -0,0 +1,102 @@
+"""
+Block assembly: which open transactions go into the next block, within a maximum block size
+"""
+import logging
+import os
+
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Set
+
+from block import Header
+from mempool import Mempool
+from transaction import FinalTransaction
+
+logger = logging.getLogger(__name__)
+
+# Most bytes of a block: its serialized header and transactions
+MAX_BLOCK_SIZE = int(os.getenv("MAX_BLOCK_SIZE", str(1024 * 1024)))
+
+# Bytes of a block kept for its header and the mining reward
+RESERVED_SIZE = 1024
+
+# Orders the open transactions the assembler picks from. A sender's transactions must
+# come in nonce order
+SelectionPolicy = Callable[[Mempool], Iterator[FinalTransaction]]
+
+
+def fifo(mempool: Mempool) -> Iterator[FinalTransaction]:
+    """
+    The transactions in the order they were added
+    """
+    return iter(mempool.transactions())
+
+
+def sender_fair(mempool: Mempool) -> Iterator[FinalTransaction]:
+    """
+    One transaction of every sender at a time, so a sender with a long chain of nonces
+    doesn't take up the block
+    """
+    queues = [
+        deque(mempool.sender_transactions(s)) for s in mempool.senders()
+    ]  # type: List[Deque[FinalTransaction]]
+    while queues:
+        for queue in queues:
+            yield queue.popleft()
+        queues = [q for q in queues if q]
+
+
+SELECTION_POLICIES = {
+    "fifo": fifo,
+    "fair": sender_fair,
+}  # type: Dict[str, SelectionPolicy]
+BLOCK_SELECTION = os.getenv("BLOCK_SELECTION", "fifo")
+
+
+def block_size(header: Header, transactions: List[FinalTransaction]) -> int:
+    """
+    Bytes of the serialized header and transactions, which is what a block takes to send
+    and to verify
+    """
+    return len(header.SerializeToString()) + sum(
+        len(tx.signed_transaction.SerializeToString()) for tx in transactions
+    )
+
+
+class BlockAssembler:
+    """
+    max_size : <int> Most bytes of a block
+    policy : <str> One of SELECTION_POLICIES
+    """
+
+    def __init__(
+        self, max_size: int = MAX_BLOCK_SIZE, policy: str = BLOCK_SELECTION
+    ) -> None:
+        if policy not in SELECTION_POLICIES:
+            raise ValueError(f"{policy} is not a supported selection policy")
+        self.max_size = max_size
+        self.policy = policy
+
+    def assemble(self, mempool: Mempool) -> List[FinalTransaction]:
+        """
+        Pick open transactions in the policy's order while they fit. Once one of a sender's
+        transactions doesn't fit, the sender's later nonces are left out as well, and stay
+        in the mempool with it
+        """
+        budget = self.max_size - RESERVED_SIZE
+        selected = []  # type: List[FinalTransaction]
+        skipped = set()  # type: Set[str]
+        for tx in SELECTION_POLICIES[self.policy](mempool):
+            sender = tx.signed_transaction.details.sender
+            if sender in skipped:
+                continue
+            size = mempool.transaction_size(tx.transaction_hash)
+            if size > budget:
+                skipped.add(sender)
+                continue
+            selected.append(tx)
+            budget -= size
+        if len(selected) < len(mempool):
+            logger.info(
+                "Assembled %s of %s open transactions", len(selected), len(mempool)
+            )
+        return selected
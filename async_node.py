@@ -0,0 +1,350 @@
+"""
+Asynchronous node server. Connections are handled on an event loop, and every request is run
+by the routes of blockchain_node.py on an executor:
+  - requests that only read run concurrently
+  - requests that change the node run on a single executor, in the order they arrived
+  - /mine runs on its own executor, so proof of work doesn't hold up the other requests
+The blockchain's lock keeps them, mining and the admission pipeline from seeing each other's
+changes half done.
+Transactions and blocks are delivered to peers with an async HTTP client.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import aiohttp
+
+from aiohttp import web
+from flask import Flask
+from multidict import CIMultiDict
+
+from blockchain import Blockchain
+from blockchain_node import create_app as create_flask_app
+from broadcast import PROTOBUF_REPROBE, TIMEOUT, Delivery
+from sync import PROTOBUF_MIMETYPE
+
+logger = logging.getLogger(__name__)
+
+# Requests that don't change the node, and can be run concurrently
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Largest request body accepted, e.g. a batch of transactions
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+# Response headers set by the server rather than by the routes
+HOP_BY_HOP_HEADERS = ("content-length", "transfer-encoding", "connection")
+
+
+class PeerResponse(NamedTuple):
+    """
+    A peer's response, read in full. Has the attributes reply callbacks use on a
+    requests.Response
+    """
+
+    status_code: int
+    content: bytes
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(errors="replace")
+
+
+def on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class AsyncBroadcaster:  # pylint: disable=too-many-instance-attributes
+    """
+    Delivers the same deliveries as broadcast.Broadcaster from the event loop, with a shared
+    aiohttp session. Every peer has its own ordered queue, drained by its own task, and failed
+    deliveries are retried with a backoff before the rest of that peer's queue is sent.
+    submit can be called from any thread
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        session: aiohttp.ClientSession,
+        loop: asyncio.AbstractEventLoop,
+        timeout: Tuple[float, float] = TIMEOUT,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+        max_queue: int = 10000,
+        reprobe: float = PROTOBUF_REPROBE,
+    ) -> None:
+        self.session = session
+        self.reprobe = reprobe
+        self.loop = loop
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_queue = max_queue
+        self.__queues = {}  # type: Dict[str, Deque[Delivery]]
+        self.__draining = {}  # type: Dict[str, asyncio.Task]
+        # time.monotonic() until which a peer that answered 415 is only sent JSON
+        self.__json_only_until = {}  # type: Dict[str, float]
+
+    def submit(  # pylint: disable=too-many-arguments
+        self,
+        nodes: Iterable[str],
+        path: str,
+        payload: Optional[Dict],
+        data: Optional[bytes] = None,
+        reply: Optional[Callable[[Any], List[Delivery]]] = None,
+    ) -> None:
+        """
+        Queue a payload for every node and return right away. If data is given, it is sent
+        as application/x-protobuf to the peers that accept it
+        """
+        deliveries = [(node, Delivery(path, payload, data, reply)) for node in nodes]
+        if on_loop(self.loop):
+            self.__enqueue(deliveries)
+        else:
+            self.loop.call_soon_threadsafe(self.__enqueue, deliveries)
+
+    def __enqueue(self, deliveries: List[Tuple[str, Delivery]]) -> None:
+        for (node, delivery) in deliveries:
+            queue = self.__queues.setdefault(node, deque(maxlen=self.max_queue))
+            if len(queue) == queue.maxlen:
+                logger.warning("Queue for %s is full, dropping oldest delivery", node)
+            queue.append(delivery)
+            if node not in self.__draining:
+                self.__draining[node] = self.loop.create_task(self.__drain(node))
+
+    async def __drain(self, node: str) -> None:
+        queue = self.__queues[node]
+        try:
+            while queue:
+                delivery = queue[0]
+                follow_ups = await self.__send(node, delivery)
+                if follow_ups is None:
+                    if delivery.attempts < self.max_attempts:
+                        # Keep the failed delivery at the head of the queue, so ordering holds
+                        await asyncio.sleep(
+                            self.retry_delay * 2 ** (delivery.attempts - 1)
+                        )
+                        continue
+                    logger.error(
+                        "Giving up on %s%s after %s attempts",
+                        node,
+                        delivery.path,
+                        delivery.attempts,
+                    )
+                if queue and queue[0] is delivery:
+                    queue.popleft()
+                follow_ups = follow_ups or []
+                dropped = len(queue) + len(follow_ups) - self.max_queue
+                if dropped > 0:
+                    logger.warning(
+                        "Queue for %s is full, dropping %s newest deliveries", node, dropped
+                    )
+                queue.extendleft(reversed(follow_ups))
+        finally:
+            del self.__draining[node]
+
+    async def __send(self, node: str, delivery: Delivery) -> Optional[List[Delivery]]:
+        """
+        Returns the deliveries to send next, or None if the delivery should be retried
+        """
+        url = f"{node}{delivery.path}"
+        try:
+            logger.debug("Broadcasting to %s", url)
+            response = None
+            if delivery.data is not None and (
+                time.monotonic() >= self.__json_only_until.get(node, 0.0)
+                or delivery.payload is None
+            ):
+                response = await self.__post(
+                    url, data=delivery.data, headers={"Content-Type": PROTOBUF_MIMETYPE}
+                )
+                if delivery.payload is not None and response.status_code == 415:
+                    logger.info("%s doesn't accept protobuf, sending JSON", node)
+                    self.__json_only_until[node] = time.monotonic() + self.reprobe
+                    response = None
+                elif delivery.payload is not None and response.status_code == 400:
+                    # Nodes that only read JSON bodies reject it as missing data. It may
+                    # as well be this delivery that is wrong, so only it is sent as JSON
+                    response = None
+            if response is None:
+                response = await self.__post(url, json=delivery.payload)
+            if response.status_code == 400 or response.status_code == 500:
+                logger.error("%s declined, needs resolving: %s", url, response.text)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            delivery.attempts += 1
+            logger.warning("Failed to reach %s (attempt %s)", url, delivery.attempts)
+            return None
+
+        if delivery.reply is None:
+            return []
+        try:
+            # Replies look at the blockchain, so they're kept off the event loop
+            return await self.loop.run_in_executor(None, delivery.reply, response)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Failed to handle the response of %s: %s", url, e)
+            return []
+
+    async def __post(self, url: str, **kwargs: Any) -> PeerResponse:
+        async with self.session.post(url, timeout=self.timeout, **kwargs) as response:
+            return PeerResponse(response.status, await response.read())
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self.__queues.values())
+
+    async def flush(self) -> None:
+        """
+        Wait until every queued delivery was sent or given up on
+        """
+        while self.__draining:
+            await asyncio.wait(list(self.__draining.values()))
+
+    def shutdown(self) -> None:
+        for task in self.__draining.values():
+            task.cancel()
+
+
+def wsgi_environ(request: web.Request, body: bytes) -> Dict[str, Any]:
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": request.path,
+        "QUERY_STRING": request.query_string,
+        "SERVER_NAME": request.url.host or "localhost",
+        "SERVER_PORT": str(request.url.port or ""),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "CONTENT_TYPE": request.headers.get("Content-Type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }  # type: Dict[str, Any]
+    for (name, value) in request.headers.items():
+        key = "HTTP_" + name.upper().replace("-", "_")
+        if key in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+            continue
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(
+    app: Callable, environ: Dict[str, Any]
+) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """
+    Run a WSGI app to completion. Returns the status code, headers and body
+    """
+    started = {}  # type: Dict[str, Any]
+
+    def start_response(status: str, headers: List[Tuple[str, str]], _exc_info=None):
+        started["status"] = status
+        started["headers"] = headers
+
+    result = app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return int(started["status"].split()[0]), started["headers"], body
+
+
+class NodeServer:
+    """
+    flask_app : <Flask> The node's routes, from blockchain_node.create_app
+    blockchain : <Blockchain> The node's blockchain
+    readers : <ThreadPoolExecutor> Runs the requests that only read, concurrently
+    writer : <ThreadPoolExecutor> Runs the requests that change the node, in order
+    miner : <ThreadPoolExecutor> Runs /mine
+    broadcaster : <optional AsyncBroadcaster> Delivers to peers while the server is running
+    """
+
+    def __init__(self, flask_app: Flask, readers: int = 32) -> None:
+        self.flask_app = flask_app
+        self.blockchain = flask_app.extensions["blockchain"]  # type: Blockchain
+        self.readers = ThreadPoolExecutor(
+            max_workers=readers, thread_name_prefix="node-read"
+        )
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="node-write")
+        self.miner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="node-mine")
+        self.broadcaster = None  # type: Optional[AsyncBroadcaster]
+        self.__session = None  # type: Optional[aiohttp.ClientSession]
+
+    def executor(self, request: web.Request) -> ThreadPoolExecutor:
+        if request.path == "/mine":
+            return self.miner
+        if request.method in READ_METHODS:
+            return self.readers
+        return self.writer
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        environ = wsgi_environ(request, body)
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(
+            self.executor(request), call_wsgi, self.flask_app.wsgi_app, environ
+        )
+        return web.Response(
+            status=status,
+            body=content,
+            headers=CIMultiDict(
+                (name, value)
+                for (name, value) in headers
+                if name.lower() not in HOP_BY_HOP_HEADERS
+            ),
+        )
+
+    async def start(self, _app: web.Application) -> None:
+        """
+        Deliver to peers from the event loop instead of the broadcaster's threads
+        """
+        self.__session = aiohttp.ClientSession()
+        self.broadcaster = AsyncBroadcaster(
+            self.__session, asyncio.get_running_loop()
+        )
+        self.blockchain.broadcaster.shutdown()
+        self.blockchain.broadcaster = self.broadcaster
+
+    async def stop(self, _app: web.Application) -> None:
+        if self.broadcaster is not None:
+            self.broadcaster.shutdown()
+        if self.__session is not None:
+            await self.__session.close()
+        for executor in (self.readers, self.writer, self.miner):
+            executor.shutdown(wait=False)
+
+    def application(self) -> web.Application:
+        app = web.Application(client_max_size=MAX_REQUEST_BYTES)
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.stop)
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        return app
+
+
+def create_app(test: bool = False) -> web.Application:
+    readers = int(os.getenv("READ_WORKERS", "32"))
+    return NodeServer(create_flask_app(test), readers).application()
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
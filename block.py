@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import logging
+import sys
+
 from pathlib import Path
 
 from datetime import datetime
@@ -10,7 +13,12 @@ from google.protobuf.timestamp_pb2 import Timestamp
 
 from generated import block_pb2
 
-from storage import Storage
+from storage import Storage, StorageBackend, open_backend
+
+logger = logging.getLogger(__name__)
+
+# Legacy layout, with one hex encoded file per block
+LEGACY_BLOCKS = Path("blocks")
 
 
 class Header(BaseModel):
@@ -115,11 +123,11 @@ class Block(BaseModel):
     block_hash: str
     size: int
 
-    def SerializeToString(self) -> bytes:
+    def ToProtobuf(self) -> Any:
         timestamp = Timestamp()
         timestamp.FromDatetime(self.header.timestamp)
 
-        block = block_pb2.Block(
+        return block_pb2.Block(
             index=self.index,
             size=self.size,
             block_hash=self.block_hash,
@@ -135,16 +143,8 @@ class Block(BaseModel):
             transactions=self.transactions,
         )
 
-        return block.SerializeToString()
-
-    def SerializeToHex(self) -> str:
-        return self.SerializeToString().hex()
-
     @staticmethod
-    def ParseFromString(block_bytes: bytes) -> Block:
-        block = block_pb2.Block()
-        block.ParseFromString(block_bytes)
-
+    def FromProtobuf(block: Any) -> Block:
         return Block(
             index=block.index,
             size=block.size,
@@ -154,37 +154,76 @@ class Block(BaseModel):
             transactions=list(block.transactions),
         )
 
+    def SerializeToString(self) -> bytes:
+        return self.ToProtobuf().SerializeToString()
+
+    def SerializeToHex(self) -> str:
+        return self.SerializeToString().hex()
+
+    @staticmethod
+    def ParseFromString(block_bytes: bytes) -> Block:
+        block = block_pb2.Block()
+        block.ParseFromString(block_bytes)
+
+        return Block.FromProtobuf(block)
+
     @staticmethod
     def ParseFromHex(block_hex: str) -> Block:
         return Block.ParseFromString(bytes.fromhex(block_hex))
 
     @staticmethod
-    def LoadBlocks(data_location: str) -> List[Block]:
-        block_storage = Storage(Path(data_location))
-        block_files = block_storage.list_files(Path("blocks"))
-        blocks = []
-        for f in block_files:
-            b = block_storage.read_string(Path(f"blocks/{f}"))
-            if not b:
-                raise ValueError("Found a file in block folder that was not a block")
-
-            blocks.append(Block.ParseFromHex(b))
-        return blocks
+    def Backend(data_location: str) -> StorageBackend:
+        return open_backend(Path(data_location))
 
     @staticmethod
-    def DeleteBlocks(data_location) -> None:
-        block_storage = Storage(Path(data_location))
-        block_storage.delete_files(Path("blocks)"))
+    def LoadBlocks(data_location: str) -> List[Block]:
+        backend = Block.Backend(data_location)
+        blocks = [Block.ParseFromString(b) for b in backend.load_blocks()]
+        if not blocks and Storage(Path(data_location)).list_files(LEGACY_BLOCKS):
+            logger.warning(
+                "Found blocks in the legacy layout at %s. Run `make migrate-blocks`",
+                data_location,
+            )
+        return blocks
 
     @staticmethod
     def FindBlock(data_location: str, block_hash: str) -> Optional[Block]:
-        block_storage = Storage(Path(data_location))
-        block = block_storage.read_string(Path("blocks") / block_hash)
+        block = Block.Backend(data_location).find_block(block_hash)
         if block is None:
             return None
-        return Block.ParseFromHex(block)
+        return Block.ParseFromString(block)
 
     @staticmethod
     def SaveBlock(data_location: str, block: Block) -> None:
-        block_storage = Storage(Path(data_location) / "blocks")
-        block_storage.save(Path(block.block_hash), block.SerializeToHex())
+        Block.Backend(data_location).put_block(
+            block.index, block.block_hash, block.SerializeToString()
+        )
+
+    @staticmethod
+    def MigrateBlocks(data_location: str) -> int:
+        """
+        Move blocks from the legacy one-file-per-block layout into the configured
+        storage backend
+        """
+        block_storage = Storage(Path(data_location))
+        blocks = []
+        for f in block_storage.list_files(LEGACY_BLOCKS):
+            b = block_storage.read_string(LEGACY_BLOCKS / f)
+            if not b:
+                raise ValueError("Found a file in block folder that was not a block")
+            blocks.append(Block.ParseFromHex(b))
+
+        blocks.sort(key=lambda x: x.index, reverse=False)
+        for block in blocks:
+            Block.SaveBlock(data_location, block)
+
+        block_storage.delete_files(LEGACY_BLOCKS)
+        logger.info("Migrated %s blocks in %s", len(blocks), data_location)
+        return len(blocks)
+
+
+if __name__ == "__main__":
+    # Usage: python block.py data/<node_id> [data/<node_id> ...]
+    for location in sys.argv[1:]:
+        count = Block.MigrateBlocks(location)
+        print(f"Migrated {count} blocks in {location}")
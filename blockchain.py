@@ -1,21 +1,63 @@
 """
 The blockchain (Really need to add a better description of what this is)
 """
-from functools import reduce
-
 from datetime import datetime
 
+from pathlib import Path
 from urllib.parse import urlparse
 from uuid import UUID
 
-from typing import List, Optional, Set, Tuple
-
+from collections import ChainMap
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    cast,
+)
+
+import json
 import tempfile
 import shutil
 import logging
+import os
+import threading
+import time
 import requests
 
+from admission import AdmissionPipeline, check_fields
+from assembler import BlockAssembler, block_size
 from block import Block, Header
+from custom_exceptions import MempoolFullError, TooManyPendingError
+from broadcast import Broadcaster, Delivery
+from gossip import Announcer, InFlight, Inventory, RecentlySeen
+from ledger import Ledger
+from mempool import Mempool, MempoolStats
+from mining import (
+    MiningJob,
+    MiningQueue,
+    MiningResult,
+    MiningService,
+    ParallelMiner,
+)
+from relay import (
+    BlockTransactions,
+    BlockTransactionsRequest,
+    CompactBlock,
+    PrefilledTransaction,
+)
+from storage import open_backend
+from sync import (
+    BlockBundle,
+    ParallelDownloader,
+    TransactionEnvelope,
+    download_headers,
+)
 from transaction import Details, FinalTransaction, SignedRawTransaction, get_merkle_root
 from verification import Verification
 from wallet import Wallet
@@ -24,6 +66,43 @@ logger = logging.getLogger(__name__)
 
 MINING_REWARD = 10
 
+# Records the height (and block hash) up to which the chain has been persisted
+JOURNAL = "journal"
+
+# Confirmed per-address totals, as of the block recorded with them
+LEDGER = "ledger"
+
+# When every open transaction was added, so they keep expiring across restarts
+MEMPOOL_ADDED = "mempool_added"
+
+# Compact blocks kept while waiting for the transactions they are missing
+MAX_PARTIAL_BLOCKS = 16
+
+# A compact block, and its transactions matched so far
+PartialBlock = Tuple[CompactBlock, List[Optional[FinalTransaction]]]
+
+# Least seconds between refreshes of the template of the mining service with new transactions
+TEMPLATE_REFRESH = float(os.getenv("TEMPLATE_REFRESH", "5"))
+
+# Most open transactions a sender can have, as a chain of consecutive nonces
+MAX_PENDING_PER_SENDER = int(os.getenv("MAX_PENDING_PER_SENDER", "25"))
+
+
+class BlockTemplate(NamedTuple):
+    """
+    last_block : <Block> The block to mine on
+    transactions : <List[FinalTransaction]> The open transactions to include
+    merkle_root : <str> Merkle root of the transactions
+    mempool_version : <int> Version of the open transactions the template was built from
+    created : <float> When the template was built, in time.monotonic() seconds
+    """
+
+    last_block: Block
+    transactions: List[FinalTransaction]
+    merkle_root: str
+    mempool_version: int
+    created: float
+
 
 class Blockchain:  # pylint: disable=too-many-instance-attributes
     """
@@ -32,12 +111,61 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
           Unique Identifier for this particular node
       chain: <List[Block]>
           The list of blocks
-      __open_transactions (private): <List[FinalTransaction]>
-          The list of transactions that have not yet been committed in a block to the blockchain
+      __mempool (private): <Mempool>
+          The transactions that have not yet been committed in a block to the blockchain,
+          within a number of transactions and of bytes
+      __persisted_height (private): <int>
+          Height of the last block of the chain that is known to be on disk
+      __unsaved_transactions (private): <Set[str]>
+          Hashes of open transactions that have not been saved yet
+      __confirmed_transactions (private): <Set[str]>
+          Hashes of open transactions that were confirmed by a received block and
+          need to be moved to confirmed storage
+      __ledger (private): <Ledger>
+          Sent, received and pending amounts for every address
+      __partial_blocks (private): <Dict[str, PartialBlock]>
+          Compact blocks waiting for the transactions they are missing, by block hash
+      __sent_along (private): <Dict[str, List[PrefilledTransaction]]>
+          Transactions sent along with rebuilt compact blocks, by block hash. They are saved
+          once the block is added
       difficulty : <int> optional
           The difficulty for mining
       address : <str>
           Wallet address that transfers initiated from this node will be used as the recipient
+      mining_workers : <int> optional
+          Number of processes used to mine a block
+      assembler : <BlockAssembler>
+          Picks the open transactions that go into a mined block, within its maximum size
+      max_pending_per_sender : <int>
+          Most open transactions a sender can have at once
+      last_mining_result : <MiningResult> optional
+          Statistics of the last mined block
+      __lock (private): <threading.RLock>
+          Held while the chain, the open transactions or the ledger change, so transactions
+          admitted in the background don't interleave with blocks
+      __mining_cancel (private): <threading.Event> optional
+          Set when the chain tip changes, to cancel the block being mined
+      __mempool_version (private): <int>
+          Counts the transactions added to the open transactions
+      __template (private): <BlockTemplate> optional
+          The last block template, reused until the tip or the open transactions change
+      mining_service : <MiningService>
+          Mines blocks one after another in the background, once started
+      mining_queue : <MiningQueue>
+          Mines blocks in the background, one at a time
+      __mining_lock (private): <threading.Lock>
+          Held while a mining job is queued or the mining service started, so only one of
+          them mines at a time
+      broadcaster : <Broadcaster>
+          Delivers transactions and blocks to the other nodes in the background
+      recently_seen : <RecentlySeen>
+          Hashes of transactions this node has added
+      requested : <InFlight>
+          Hashes of transactions asked from a peer and not received yet
+      announcer : <Announcer>
+          Announces the hashes of new open transactions to the other nodes in batches
+      admission : <AdmissionPipeline>
+          Admits transactions in stages, verifying signatures in parallel
     """
 
     def __init__(
@@ -49,14 +177,38 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         difficulty: int = 4,
         version: int = 1,
         timestamp: Optional[datetime] = None,
+        mining_workers: int = 1,
     ) -> None:
         # Generate a globally unique UUID for this node
         self.chain_identifier = node_id
-        self.__open_transactions = []  # type: List[FinalTransaction]
+        self.__mempool = Mempool()
+        self.__chain = []  # type: List[Block]
+        self.__persisted_height = -1
+        self.__unsaved_transactions = set()  # type: Set[str]
+        self.__confirmed_transactions = set()  # type: Set[str]
+        self.__ledger = Ledger()
+        self.__partial_blocks = {}  # type: Dict[str, PartialBlock]
+        self.__sent_along = {}  # type: Dict[str, List[PrefilledTransaction]]
         self.nodes = set()  # type: Set[str]
+        self.broadcaster = Broadcaster()
+        self.recently_seen = RecentlySeen()
+        self.requested = InFlight()
+        self.announcer = Announcer(self.__announce)
+        self.admission = AdmissionPipeline(self.__admit, self.__persist_admitted)
         self.difficulty = difficulty
         self.address = address
         self.version = version
+        self.mining_workers = mining_workers
+        self.max_pending_per_sender = MAX_PENDING_PER_SENDER
+        self.assembler = BlockAssembler()
+        self.last_mining_result = None  # type: Optional[MiningResult]
+        self.__lock = threading.RLock()
+        self.__mining_cancel = None  # type: Optional[threading.Event]
+        self.__mempool_version = 0
+        self.__template = None  # type: Optional[BlockTemplate]
+        self.mining_service = MiningService(self.__mine_continuously)
+        self.mining_queue = MiningQueue(self.__mine_job)
+        self.__mining_lock = threading.Lock()
         self.data_location = (
             f"data/{node_id}"
             if not is_test
@@ -83,7 +235,7 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
             Block(
                 index=0,
                 block_hash=Verification.hash_block_header(header),
-                size=len(str(header)),
+                size=block_size(header, []),
                 header=header,
                 transaction_count=0,
                 transactions=[],
@@ -91,6 +243,7 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         ]
 
         self.load_data()
+        self.__load_ledger()
 
     @property
     def chain(self) -> List[Block]:
@@ -99,16 +252,26 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         and a setter (@chain.setter)
 
         chain[:] returns a copy so we only get a copy of the reference of the objects,
-        so we can't directly change the value
+        so we can't directly change the value. It is copied under the lock, so requests
+        reading it don't race the ones changing it
         """
-        return self.__chain[:]
+        with self.__lock:
+            return self.__chain[:]
 
     @chain.setter
     def chain(self, val: List[Block]) -> None:
         """
         Setter function to directly set the value of the chain. This is only used when
         re-aligning the chain with the rest of the network, and setting up the genesis block.
+
+        Everything from the first block that differs from the current chain must be saved again
         """
+        common = 0
+        for (old, new) in zip(self.__chain, val):
+            if old.block_hash != new.block_hash:
+                break
+            common += 1
+        self.__persisted_height = min(self.__persisted_height, common - 1)
         self.__chain = val
 
     @property
@@ -125,12 +288,27 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         """
         self.__chain.append(block)
 
+    @property
+    def mempool(self) -> Mempool:
+        """
+        The pool of open transactions, e.g. to change its limits
+        """
+        return self.__mempool
+
     @property
     def get_open_transactions(self) -> List[FinalTransaction]:
         """
         Return a copy of the list of transactions that have not yet been mined
         """
-        return self.__open_transactions[:]
+        with self.__lock:
+            return self.__mempool.transactions()
+
+    def mempool_stats(self) -> MempoolStats:
+        """
+        The size and limits of the open transactions, read under the lock
+        """
+        with self.__lock:
+            return self.__mempool.stats()
 
     @property
     def last_block(self) -> Block:
@@ -155,22 +333,188 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         return [b.block_hash for b in self.chain]
 
     def save_data(self) -> None:
+        """
+        Persist only what changed since the last save: new open transactions, open
+        transactions confirmed by a received block, and blocks above the persisted height
+        """
+        with self.__lock:
+            try:
+                unsaved = list(self.__unsaved_transactions)
+                for tx_hash in unsaved:
+                    transaction = self.__mempool.get(tx_hash)
+                    if transaction is not None:
+                        FinalTransaction.SaveTransaction(
+                            self.data_location, transaction, "open"
+                        )
+                    self.__unsaved_transactions.discard(tx_hash)
+                if unsaved:
+                    open_backend(Path(self.data_location)).save_meta(
+                        MEMPOOL_ADDED, json.dumps(self.__mempool.added_times())
+                    )
+
+                for tx_hash in list(self.__confirmed_transactions):
+                    FinalTransaction.MoveTransaction(
+                        self.data_location, tx_hash, "open", "confirmed"
+                    )
+                    self.__confirmed_transactions.discard(tx_hash)
+
+                first_unsaved = self.__persisted_height + 1
+                if first_unsaved <= self.last_block.index:
+                    for block in self.__chain[first_unsaved:]:
+                        Block.SaveBlock(self.data_location, block)
+                        self.__persisted_height = block.index
+                    self.__save_journal()
+                    self.__save_ledger()
+            except Exception as e:
+                logger.exception(e)
+
+    def __save_journal(self) -> None:
+        block = self.__chain[self.__persisted_height]
+        open_backend(Path(self.data_location)).save_meta(
+            JOURNAL, json.dumps({"height": block.index, "block_hash": block.block_hash})
+        )
+
+    def __load_journal(self) -> int:
+        """
+        Return the persisted height recorded in the journal, as long as it still
+        agrees with the loaded chain
+        """
+        raw = open_backend(Path(self.data_location)).read_meta(JOURNAL)
+        if not raw:
+            return -1
+        journal = json.loads(raw)
+        height = min(journal["height"], self.last_block.index)
+        if self.__chain[height].block_hash != journal["block_hash"]:
+            logger.warning("Journal does not match the stored chain, saving it again")
+            return -1
+        return height
+
+    def __save_ledger(self) -> None:
+        self.__sync_ledger()
+        open_backend(Path(self.data_location)).save_meta(LEDGER, self.__ledger.ToJson())
+
+    def __load_ledger(self) -> None:
+        raw = open_backend(Path(self.data_location)).read_meta(LEDGER)
         try:
-            for transaction in self.get_open_transactions:
-                FinalTransaction.SaveTransaction(
-                    self.data_location, transaction, "open"
-                )
+            self.__ledger = Ledger.FromJson(raw) if raw else Ledger()
+        except (KeyError, ValueError):
+            logger.warning("Saved ledger can't be read, rebuilding it")
+            self.__ledger = Ledger()
+        for tx in self.__mempool.values():
+            self.__ledger.add_pending(tx.transaction_hash, tx.signed_transaction)
+        self.__sync_ledger()
+
+    def rebuild_ledger(self) -> None:
+        """
+        Recompute every balance from the transactions in the chain and the open transactions
+        """
+        logger.info("Rebuilding the ledger from %s blocks", self.chain_length)
+        self.__ledger = Ledger()
+        for tx in self.__mempool.values():
+            self.__ledger.add_pending(tx.transaction_hash, tx.signed_transaction)
+        self.__sync_ledger()
+        self.__save_ledger()
+
+    def __sync_ledger(
+        self, known_transactions: Optional[List[FinalTransaction]] = None
+    ) -> None:
+        """
+        Apply the blocks above the ledger's last block. If the ledger's last block is no
+        longer part of the chain (the chain was replaced), the ledger is rebuilt
+        """
+        ledger = self.__ledger
+        if ledger.height > self.last_block.index or (
+            ledger.height >= 0
+            and self.__chain[ledger.height].block_hash != ledger.block_hash
+        ):
+            self.rebuild_ledger()
+            return
+
+        extra = {
+            tx.transaction_hash: tx for tx in known_transactions or []
+        }  # type: Dict[str, FinalTransaction]
+        known = ChainMap(self.__mempool, extra)
+
+        first_unapplied = ledger.height + 1
+        for block in self.__chain[first_unapplied:]:
+            ledger.apply_block(
+                block.index, block.block_hash, self.__block_transactions(block, known)
+            )
 
-            for block in self.chain:
-                Block.SaveBlock(self.data_location, block)
-        except Exception as e:
-            logger.exception(e)
+    def __rollback_ledger(self, height: int) -> None:
+        """
+        Revert the blocks above the given height from the ledger, newest first. If a block
+        can't be reverted, the ledger is left to be rebuilt once the chain is replaced
+        """
+        ledger = self.__ledger
+        if ledger.height > self.last_block.index or (
+            ledger.height >= 0
+            and self.__chain[ledger.height].block_hash != ledger.block_hash
+        ):
+            return
+
+        known = self.__mempool
+        while ledger.height > height:
+            block = self.__chain[ledger.height]
+            parent_hash = self.__chain[block.index - 1].block_hash if block.index else ""
+            transactions = self.__block_transactions(block, known)
+            if not ledger.revert_block(block.index - 1, parent_hash, transactions):
+                logger.warning("Can't revert block %s from the ledger", block.index)
+                return
+
+    def __block_transactions(
+        self, block: Block, known: Mapping[str, FinalTransaction]
+    ) -> Dict[str, Optional[SignedRawTransaction]]:
+        transactions = {}  # type: Dict[str, Optional[SignedRawTransaction]]
+        for tx_hash in block.transactions:
+            tx = known.get(tx_hash)
+            if tx is None:
+                packed = FinalTransaction.FindTransaction(self.data_location, tx_hash)
+                tx = packed[1] if packed else None
+            transactions[tx_hash] = tx.signed_transaction if tx else None
+        return transactions
+
+    def common_ancestor(self, chain_hashes: List[str]) -> int:
+        """
+        Index of the last block this chain shares with the chain made of the given block
+        hashes, or -1 if even the genesis blocks differ. Every block commits to its parent,
+        so walking back from the tip of the shorter chain, the first match is the ancestor
+        """
+        index = min(len(chain_hashes), self.chain_length) - 1
+        while index >= 0 and chain_hashes[index] != self.__chain[index].block_hash:
+            index -= 1
+        return index
+
+    def store_transaction(self, transaction: FinalTransaction, type_: str) -> None:
+        """
+        Save a confirmed or mining transaction received from another node. It may belong
+        to a block that was received before it
+        """
+        with self.__lock:
+            FinalTransaction.SaveTransaction(self.data_location, transaction, type_)
+            self.__ledger.resolve(
+                transaction.transaction_hash, transaction.signed_transaction
+            )
 
     def load_data(self) -> None:
         try:
             txs = FinalTransaction.LoadTransactions(self.data_location, "open")
             if txs:
-                self.__open_transactions = txs
+                raw = open_backend(Path(self.data_location)).read_meta(MEMPOOL_ADDED)
+                added = json.loads(raw) if raw else {}  # type: Dict[str, float]
+                now = time.time()
+                # Added again in the order they were first added, which is nonce order for
+                # every sender's transactions
+                txs.sort(
+                    key=lambda tx: (
+                        added.get(tx.transaction_hash, now),
+                        tx.signed_transaction.details.nonce,
+                    )
+                )
+                for tx in txs:
+                    self.__mempool.add(tx, added.get(tx.transaction_hash, now))
+                # The limits may have been lowered since they were saved
+                self.__drop_open_transactions(self.__mempool.trim())
 
             chain = Block.LoadBlocks(self.data_location)
             if chain:
@@ -178,150 +522,229 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
                 chain.sort(key=lambda x: x.index, reverse=False)
 
                 self.chain = chain
+                self.__persisted_height = self.__load_journal()
         except Exception as e:
             logger.exception(e)
 
-    def __broadcast_transaction(
-        self, transaction: SignedRawTransaction, type_: str
-    ) -> None:
+    @staticmethod
+    def __transaction_delivery(envelope: TransactionEnvelope) -> Delivery:
+        transaction = envelope.transaction.signed_transaction
+        return Delivery(
+            "/broadcast-transaction",
+            {"transaction": transaction.SerializeToHex(), "type": envelope.type},
+            envelope.SerializeToString(),
+        )
+
+    def __announce(self, transaction_hashes: List[str]) -> None:
         """
-        Broadcast the current transaction to all nodes on the network that this node
-        is aware of.
+        Announce new open transactions to all nodes on the network that this node is aware
+        of. Peers answer with the hashes they don't know, and only those transactions are
+        sent to them. Nodes without transaction gossip are sent every transaction.
 
-        This ensures synchronicity across all nodes on the network.
+        Delivery happens in the background, so this returns without waiting on the network.
         """
-        for node in self.nodes:
-            url = f"{node}/broadcast-transaction"
-            try:
-                logging.debug("Broadcasting new transaction %s to %s", transaction, url)
-                response = requests.post(
-                    url,
-                    json={"transaction": transaction.SerializeToHex(), "type": type_},
-                )
-                if response.status_code == 400 or response.status_code == 500:
-                    logger.error(
-                        "Transaction declined, needs resolving: %s", response.json()
-                    )
-            except requests.exceptions.ConnectionError:
-                continue
+        if not self.nodes:
+            return
+        logger.debug("Announcing %s transactions", len(transaction_hashes))
+
+        def deliveries(wanted: List[str]) -> List[Delivery]:
+            # Runs on a broadcaster thread, while blocks may be mined or added
+            with self.__lock:
+                found = [self.__mempool.get(h) for h in wanted]
+            return [
+                self.__transaction_delivery(TransactionEnvelope(type="open", transaction=tx))
+                for tx in found
+                if tx is not None
+            ]
+
+        def reply(response: Any) -> List[Delivery]:
+            if response.status_code == 202:
+                wanted = Inventory.ParseFromString(response.content)
+                return deliveries(wanted.transaction_hashes)
+            if response.status_code == 404:
+                return deliveries(transaction_hashes)
+            return []
+
+        inventory = Inventory(transaction_hashes=transaction_hashes)
+        self.broadcaster.submit(
+            self.nodes, "/inventory", None, inventory.SerializeToString(), reply
+        )
+
+    def receive_inventory(self, inventory: Inventory) -> List[str]:
+        """
+        Returns the announced transactions to ask the sender for. While they are on their
+        way, they are not asked for again when other peers announce them. If they are turned
+        down, or don't arrive in time, the next peer announcing them is asked
+        """
+        return [
+            h
+            for h in inventory.transaction_hashes
+            if h not in self.recently_seen and self.requested.request(h)
+        ]
 
-    def __broadcast_block(self, block: Block) -> None:
+    def __broadcast_block(
+        self, block: Block, transactions: List[FinalTransaction]
+    ) -> None:
         """
         Broadcast the current block to all nodes on the network that this node
         is aware of.
 
-        This block has already been validated and approved
+        This block has already been validated and approved. It is sent as a compact block:
+        peers rebuild it from their open transactions and ask for the ones they don't have,
+        so only the mining reward (the last transaction) is sent along. Nodes without compact
+        block relay are sent every transaction, then the block.
 
-        This ensures synchronicity across all nodes on the network.
+        This ensures synchronicity across all nodes on the network. Delivery happens in the
+        background, so this returns without waiting on the network.
         """
         logger.debug("Broadcasting blocks to following nodes: %s", self.nodes)
-        for node in self.nodes:
-            url = f"{node}/broadcast-block"
-            logger.debug("Broadcasting new block %s to %s", block, url)
-            try:
-                response = requests.post(url, json={"block": block.SerializeToHex()})
-                if response.status_code == 400 or response.status_code == 500:
-                    logger.error("Block declined, needs resolving: %s", response.json())
-            except requests.exceptions.ConnectionError:
-                continue
+        envelopes = [
+            TransactionEnvelope(type="confirmed", transaction=tx) for tx in transactions
+        ]
+        envelopes[-1].type = "mining"
+        reward = PrefilledTransaction(index=len(envelopes) - 1, envelope=envelopes[-1])
+        compact = CompactBlock.FromBlock(block, [reward])
+
+        def reply(response: Any) -> List[Delivery]:
+            if response.status_code == 202:
+                requested = BlockTransactionsRequest.ParseFromString(response.content)
+                found = BlockTransactions(
+                    block_hash=block.block_hash,
+                    transactions=[
+                        PrefilledTransaction(index=i, envelope=envelopes[i])
+                        for i in requested.indexes
+                        if i < len(envelopes)
+                    ],
+                )
+                return [
+                    Delivery(
+                        "/broadcast-block-transactions", None, found.SerializeToString()
+                    )
+                ]
+            if response.status_code == 404:
+                serialized = block.SerializeToString()
+                return [self.__transaction_delivery(e) for e in envelopes] + [
+                    Delivery("/broadcast-block", {"block": serialized.hex()}, serialized)
+                ]
+            return []
+
+        self.broadcaster.submit(
+            self.nodes,
+            "/broadcast-compact-block",
+            None,
+            compact.SerializeToString(),
+            reply,
+        )
+
+    def receive_compact_block(
+        self, compact: CompactBlock
+    ) -> Tuple[Optional[Block], List[int]]:
+        """
+        Rebuild a compact block from the open transactions. Returns the block, or the
+        positions of the transactions to ask the sender for
+        """
+        with self.__lock:
+            matched = compact.match(self.__mempool.values())
+            missing = [i for (i, tx) in enumerate(matched) if tx is None]
+            if not missing:
+                block = compact.rebuild(matched)
+                if block is not None:
+                    self.__send_along(block, compact.prefilled)
+                    return block, []
+                # Short IDs collided, so ask for every transaction that wasn't sent along
+                prefilled = {p.index for p in compact.prefilled}
+                missing = [i for i in range(len(matched)) if i not in prefilled]
+
+            self.__partial_blocks[compact.block.block_hash] = (compact, matched)
+            while len(self.__partial_blocks) > MAX_PARTIAL_BLOCKS:
+                del self.__partial_blocks[next(iter(self.__partial_blocks))]
+            return None, missing
+
+    def receive_block_transactions(
+        self, transactions: BlockTransactions
+    ) -> Optional[Block]:
+        """
+        Complete a compact block received before with the transactions it was missing.
+        Returns None if they don't complete a known compact block
+        """
+        with self.__lock:
+            partial = self.__partial_blocks.pop(transactions.block_hash, None)
+            if partial is None:
+                return None
+            compact, matched = partial
+            for t in transactions.transactions:
+                if t.index < len(matched):
+                    matched[t.index] = t.transaction
+            if any(tx is None for tx in matched):
+                return None
+            block = compact.rebuild(cast(List[FinalTransaction], matched))
+            if block is None:
+                return None
+            self.__send_along(block, compact.prefilled + transactions.transactions)
+            return block
+
+    def __send_along(self, block: Block, transactions: List[PrefilledTransaction]) -> None:
+        """
+        Keep the transactions sent along with a rebuilt block until it is added. Nothing
+        is saved before the block was checked
+        """
+        self.__sent_along[block.block_hash] = transactions
+        while len(self.__sent_along) > MAX_PARTIAL_BLOCKS:
+            del self.__sent_along[next(iter(self.__sent_along))]
 
     def get_last_tx_nonce(
         self, tx: SignedRawTransaction, type_: str, exclude: bool
     ) -> Optional[int]:
         """
-        Get the last sender's transactions
+        Get the nonce of the sender's last transaction, either in the chain ("confirmed")
+        or in the open transactions ("open")
         """
-
-        all_transactions = FinalTransaction.LoadTransactions(self.data_location, type_)
-        participant = tx.details.sender
-
-        txns = [
-            t.signed_transaction
-            for t in all_transactions
-            if t.signed_transaction.details.sender == participant
-        ]
-        txns.sort(key=lambda t: t.details.nonce, reverse=False)
-
-        # When getting the correct nonce, exclude the current transacation when this is done via
-        # mining, since these have already been verified, so the nonce of tx will always be in
-        # txns
-        if exclude:
-            txns = list(filter(lambda t: t != tx, txns))
-
-        nonces = [t.details.nonce for t in txns]
-        return nonces[0] if nonces else None
+        with self.__lock:
+            self.__sync_ledger()
+            participant = tx.details.sender
+
+            if type_ == "open":
+                # When getting the correct nonce, exclude the current transacation when this
+                # is done via mining, since these have already been verified, so tx will
+                # always be in the open transactions. Neither can the sender's later open
+                # transactions count, as the transaction is one link of the sender's chain
+                # of nonces
+                if exclude:
+                    return self.__ledger.last_pending_nonce(
+                        participant,
+                        exclude=Verification.hash_transaction(tx),
+                        below=tx.details.nonce,
+                    )
+                return self.__ledger.last_pending_nonce(participant)
+            return self.__ledger.last_nonce(participant)
 
     # Calculate and return the balance of the user
     def get_balance(self, sender: str = None) -> Optional[float]:
         """
-        Calculate the current balance of the sender according to the amount of
-        transactions on the chain.
+        Return the current balance of the sender according to the amount of
+        transactions on the chain, minus what the sender already spent in open transactions.
         """
-        if not sender:
-            if not self.address:
-                return None
-            participant = self.address
-        else:
-            participant = sender
-
-        all_transactions = FinalTransaction.LoadAllTransactions(self.data_location)
-
-        # Fetch a list of all sent coin amounts for the given person
-        # (empty lists are returned if the person was NOT the sender)
-
-        # This fetches sent amounts of transactions that were already included in
-        # blocks of the blockchain
-        tx_sender = [
-            [
-                tx.signed_transaction.details.amount
-                for tx in all_transactions
-                if tx.signed_transaction.details.sender == participant
-            ]
-        ]
-
-        logger.debug("Sender's sent transactions on the chain: %s", tx_sender)
-
-        amount_sent = reduce(
-            lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-            if len(tx_amt) > 0.0
-            else tx_sum + 0.0,
-            tx_sender,
-            0.0,
-        )
-
-        logger.debug("Sender's total coin sent: %s", amount_sent)
-
-        # This fetches received coin amounts of transactions that were already included
-        # in blocks of the blockchain
-        #
-        # We ignore open transactions here because you shouldn't be able to spend coins
-        # before the transaction was confirmed + included in a block
-        tx_recipient = [
-            [
-                tx.signed_transaction.details.amount
-                for tx in all_transactions
-                if tx.signed_transaction.details.recipient == participant
-            ]
-        ]
-
-        logger.debug("Sender's received transactions on the chain: %s", tx_recipient)
-
-        amount_received = reduce(
-            lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-            if len(tx_amt) > 0.0
-            else tx_sum + 0.0,
-            tx_recipient,
-            0.0,
-        )
+        with self.__lock:
+            if not sender:
+                if not self.address:
+                    return None
+                participant = self.address
+            else:
+                participant = sender
 
-        logger.debug("Sender's total coin received: %s", amount_received)
-        logger.debug("Sender's balance: %s", (amount_received - amount_sent))
+            self.__sync_ledger()
+            balance = self.__ledger.balance(participant)
+            logger.debug("Sender's balance: %s", balance)
 
-        # Return the total balance
-        return amount_received - amount_sent
+            return balance
 
-    def add_transaction(
-        self, transaction: SignedRawTransaction, is_receiving: bool = False
+    def add_transaction(  # pylint: disable=unused-argument
+        self,
+        transaction: SignedRawTransaction,
+        is_receiving: bool = False,
+        *,
+        save: bool = True,
+        check_signature: bool = True,
     ) -> int:
         """
         Creates a new transaction to go into the next mined Block
@@ -329,42 +752,172 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
             A single Transaction
         :param is_receiving: Optional <bool>
             Use to determine if the transaction was created
-            by this node or another on the network
+            by this node or another on the network. Either way, it is announced
+            to the other nodes
+        :param save: Optional <bool>
+            Save the open transactions right away. Batches save once, at the end
+        :param check_signature: Optional <bool>
+            Verify the signature. The admission pipeline verifies it ahead, in parallel
         :return: <int>
             The index of the Block that will hold this transaction
         """
 
-        if Verification.verify_transaction(
-            transaction, self.get_balance, self.get_last_tx_nonce
-        ):
-            final_tx = FinalTransaction(
-                transaction_hash=Verification.hash_transaction(transaction),
-                transaction_id=Verification.hash_transaction(transaction),
-                signed_transaction=transaction,
-            )
+        transaction_hash = Verification.hash_transaction(transaction)
+        try:
+            # The same checks as the admission pipeline's, whichever way it came in
+            error = check_fields(transaction)
+            if error is not None:
+                raise ValueError(error)
+
+            with self.__lock:
+                self.__drop_open_transactions(self.__mempool.expire())
+
+                sender = transaction.details.sender
+                pending = self.__mempool.pending_count(sender)
+                if pending >= self.max_pending_per_sender:
+                    raise TooManyPendingError(sender, pending, self.max_pending_per_sender)
+
+                if Verification.verify_transaction(
+                    transaction,
+                    self.get_balance,
+                    self.get_last_tx_nonce,
+                    check_signature=check_signature,
+                ):
+                    final_tx = FinalTransaction(
+                        transaction_hash=transaction_hash,
+                        transaction_id=transaction_hash,
+                        signed_transaction=transaction,
+                    )
 
-            self.__open_transactions.append(final_tx)
-            self.save_data()
+                    self.__mempool.add(final_tx)
+                    self.__mempool_version += 1
+                    self.__unsaved_transactions.add(final_tx.transaction_hash)
+                    self.__ledger.add_pending(final_tx.transaction_hash, transaction)
+                    self.__drop_open_transactions(self.__mempool.trim())
+                    if transaction_hash not in self.__mempool:
+                        raise MempoolFullError(transaction_hash)
+                    if save:
+                        self.save_data()
+
+                    # Transactions received from peers are gossiped on as well
+                    self.recently_seen.add(final_tx.transaction_hash)
+                    self.announcer.add(final_tx.transaction_hash)
+                else:
+                    raise ValueError(
+                        "The sender does not have enough coin to make this "
+                        "transaction. We may want to change this to not raise "
+                        "an exception later, but for now, we should break."
+                    )
+                return self.last_block.index + 1
+        finally:
+            # Added or turned down, it is no longer waited for. A transaction turned down
+            # can be asked for again, from a peer announcing it once it is valid
+            self.requested.discard(transaction_hash)
 
-            if not is_receiving:
-                self.__broadcast_transaction(transaction, "open")
+    def __confirm_open_transaction(self, tx: FinalTransaction) -> None:
+        """
+        An open transaction left the mempool for a block of the chain, so its saved copy is
+        moved to the confirmed transactions
+        """
+        if tx.transaction_hash in self.__unsaved_transactions:
+            self.__unsaved_transactions.discard(tx.transaction_hash)
+            FinalTransaction.SaveTransaction(self.data_location, tx, "confirmed")
         else:
-            raise ValueError(
-                "The sender does not have enough coin to make this "
-                "transaction. We may want to change this to not raise "
-                "an exception later, but for now, we should break."
-            )
-        return self.last_block.index + 1
+            self.__confirmed_transactions.add(tx.transaction_hash)
+
+    def __reset_open_transactions(
+        self, confirmed: Set[str], orphaned: List[FinalTransaction]
+    ) -> None:
+        """
+        Bring the open transactions in line with a replaced chain. The ones the new blocks
+        confirmed are removed, and the transactions of the blocks that left the chain are
+        open again, ahead of the others. Every transaction is verified again against the
+        new chain, and the ones no longer valid are dropped
+        """
+        previous = self.__mempool.transactions()
+        added = self.__mempool.added_times()
+        # Transactions are added back oldest first, and the orphaned ones go first
+        oldest = min(added.values(), default=time.time())
+        self.__mempool.clear()
+        self.__ledger.clear_pending()
+
+        dropped = []  # type: List[FinalTransaction]
+        candidates = [(tx, oldest, True) for tx in orphaned] + [
+            (tx, added[tx.transaction_hash], False) for tx in previous
+        ]
+        for (tx, when, was_orphaned) in candidates:
+            if tx.transaction_hash in confirmed:
+                if not was_orphaned:
+                    self.__confirm_open_transaction(tx)
+                continue
+            try:
+                valid = Verification.verify_transaction(
+                    tx.signed_transaction,
+                    self.get_balance,
+                    self.get_last_tx_nonce,
+                    check_signature=was_orphaned,
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                logger.info("Open transaction %s dropped: %s", tx.transaction_hash, e)
+                valid = False
+            if not valid or not self.__mempool.add(tx, added=when):
+                if not was_orphaned:
+                    dropped.append(tx)
+                continue
+            self.__ledger.add_pending(tx.transaction_hash, tx.signed_transaction)
+            if was_orphaned:
+                FinalTransaction.MoveTransaction(
+                    self.data_location, tx.transaction_hash, "confirmed", "open"
+                )
+                # Saved again, so the time it was added is saved along
+                self.__unsaved_transactions.add(tx.transaction_hash)
+
+        self.__drop_open_transactions(dropped)
+        self.__drop_open_transactions(self.__mempool.trim())
+        self.__mempool_version += 1
+
+    def __drop_open_transactions(self, transactions: List[FinalTransaction]) -> None:
+        """
+        Forget open transactions that were expired or evicted from the mempool, including
+        their saved copies
+        """
+        for tx in transactions:
+            self.__ledger.remove_pending(tx.transaction_hash)
+            if tx.transaction_hash in self.__unsaved_transactions:
+                self.__unsaved_transactions.discard(tx.transaction_hash)
+            else:
+                FinalTransaction.DeleteTransaction(
+                    self.data_location, tx.transaction_hash, "open"
+                )
+        if transactions:
+            self.__mempool_version += 1
+
+    def __admit(self, transaction: SignedRawTransaction) -> None:
+        """
+        Admit a transaction whose signature the admission pipeline verified
+        """
+        self.add_transaction(transaction, save=False, check_signature=False)
+
+    def __persist_admitted(self) -> None:
+        self.save_data()
+        self.announcer.flush()
 
     def mine_block(
         self,
         address: Optional[str] = None,
         difficulty: Optional[int] = None,
         version: Optional[int] = None,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[int], None]] = None,
+        refresh: Optional[float] = None,
+        stop: Optional[threading.Event] = None,
     ) -> Optional[Block]:
         """
         The current node runs the mining protocol, and depending on the difficulty, this
-        could take a lot of processing power.
+        could take a lot of processing power. progress is called with the number of nonces
+        tried so far while it runs. With refresh, mining restarts on a new template to
+        include the transactions that arrived, at most every refresh seconds. Mining gives
+        up, returning None, once stop is set.
 
         Once the nonce is discovered, or "mined", the reward transaction is created.
 
@@ -388,24 +941,60 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
 
         difficulty = difficulty if difficulty is not None else self.difficulty
         version = version if version is not None else self.version
-        last_block = self.last_block
-        transaction_merkle_root = get_merkle_root(
-            [tx.signed_transaction for tx in self.get_open_transactions]
-        )
-        previous_hash = Verification.hash_block_header(last_block.header)
+        miner = ParallelMiner(workers if workers is not None else self.mining_workers)
 
-        block_header = Header(
-            version=version,
-            difficulty=difficulty,
-            timestamp=datetime.utcnow(),
-            transaction_merkle_root=transaction_merkle_root,
-            previous_hash=previous_hash,
-            nonce=0,
-        )
+        while True:
+            # The template: the chain tip and the open transactions to include. When a
+            # competing block changes the tip, mining is cancelled and restarts on a new one
+            if stop is not None and stop.is_set():
+                self.__mining_cancel = None
+                return None
+            cancel = threading.Event()
+            self.__mining_cancel = cancel
+            template = self.__block_template()
+            last_block = template.last_block
+            copied_open_transactions = list(template.transactions)
+            block_header = Header(
+                version=version,
+                difficulty=difficulty,
+                timestamp=datetime.utcnow(),
+                transaction_merkle_root=template.merkle_root,
+                previous_hash=Verification.hash_block_header(last_block.header),
+                nonce=0,
+            )
+
+            # We run the PoW algorithm to get the next nonce and return an updated header
+            watch = self.__template_watch(template, cancel, progress, refresh, stop)
+            result = miner.mine(block_header, watch, cancel)
+            if result is not None:
+                with self.__lock:
+                    # A block received since the nonce was found makes the template stale.
+                    # Checked under the lock, so none can arrive before the block is added
+                    if self.last_block.block_hash == last_block.block_hash:
+                        self.__mining_cancel = None
+                        self.last_mining_result = result
+                        block = self.__add_mined_block(
+                            result.header, copied_open_transactions, address
+                        )
+                        break
+            logger.info("Template for block %s is stale, restarting", last_block.index + 1)
+
+        if block is None:
+            return None
+        self.__broadcast_block(block, copied_open_transactions)
 
-        # We run the PoW algorithm to get the next nonce and return an updated block_header
-        block_header = Verification.proof_of_work(block_header)
+        return block
 
+    def __add_mined_block(
+        self,
+        block_header: Header,
+        copied_open_transactions: List[FinalTransaction],
+        address: str,
+    ) -> Optional[Block]:
+        """
+        Add the block whose nonce was found, with the reward appended to its transactions.
+        Called with the lock held, on the tip the block was mined on
+        """
         # Create the transaction that will be rewarded to the miners for their work
         # The sender is "0" or "Mining" to signify that this node has mined a new coin.
         reward_signed = SignedRawTransaction(
@@ -426,10 +1015,9 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
             signed_transaction=reward_signed,
         )
 
-        # Copy transactions instead of manipulating the original open_transactions list
+        # The open transactions were copied instead of manipulating the original list
         # This ensures that if for some reason the mining should fail,
         # we don't have the reward transaction stored in the pending transactions
-        copied_open_transactions = self.get_open_transactions
         for tx in copied_open_transactions:
             if not Wallet.verify_transaction(
                 tx.signed_transaction, self.get_last_tx_nonce, exclude_from_open=True
@@ -439,38 +1027,146 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         FinalTransaction.SaveTransaction(
             self.data_location, reward_transaction, "mining"
         )
-        self.__broadcast_transaction(reward_transaction.signed_transaction, "mining")
-
-        for t in copied_open_transactions:
-            self.__broadcast_transaction(t.signed_transaction, "confirmed")
-
         copied_open_transactions.append(reward_transaction)
 
         block = Block(
             index=self.next_index,
             header=block_header,
             block_hash=Verification.hash_block_header(block_header),
-            size=len(str(block_header)),
+            size=block_size(block_header, copied_open_transactions),
             transaction_count=len(copied_open_transactions),
             transactions=[t.transaction_hash for t in copied_open_transactions],
         )
 
         # Add the block to the node's chain
         self.add_block_to_chain(block)
+        self.__sync_ledger(copied_open_transactions)
 
-        # Reset the open list of transactions
+        # Remove the mined transactions from the open list. Transactions that arrived
+        # while mining stay open for the next block
         logger.info(
             "Moving open transaction to confirmed storage at %s", self.data_location
         )
-
-        FinalTransaction.MoveOpenTransactions(self.data_location)
-        self.__open_transactions = []
+        for tx in copied_open_transactions[:-1]:
+            was_open = self.__mempool.remove(tx.transaction_hash) is not None
+            # Transactions evicted from the mempool while mining have no saved copy left
+            if tx.transaction_hash in self.__unsaved_transactions or not was_open:
+                self.__unsaved_transactions.discard(tx.transaction_hash)
+                FinalTransaction.SaveTransaction(self.data_location, tx, "confirmed")
+            else:
+                self.__confirmed_transactions.add(tx.transaction_hash)
         self.save_data()
 
-        self.__broadcast_block(block)
+        return block
+
+    def __block_template(self) -> BlockTemplate:
+        """
+        The tip and the open transactions to mine on. It is only rebuilt once one of
+        them changed
+        """
+        with self.__lock:
+            self.__drop_open_transactions(self.__mempool.expire())
+            template = self.__template
+            if (
+                template is None
+                or template.last_block.block_hash != self.last_block.block_hash
+                or template.mempool_version != self.__mempool_version
+            ):
+                transactions = self.assembler.assemble(self.__mempool)
+                template = BlockTemplate(
+                    last_block=self.last_block,
+                    transactions=transactions,
+                    merkle_root=get_merkle_root(
+                        [tx.signed_transaction for tx in transactions]
+                    ),
+                    mempool_version=self.__mempool_version,
+                    created=time.monotonic(),
+                )
+                self.__template = template
+            return template
+
+    def __template_watch(  # pylint: disable=too-many-arguments
+        self,
+        template: BlockTemplate,
+        cancel: threading.Event,
+        progress: Optional[Callable[[int], None]],
+        refresh: Optional[float],
+        stop: Optional[threading.Event],
+    ) -> Callable[[int], None]:
+        """
+        Called as mining progresses. Cancels mining once it was asked to stop, or the
+        template can be refreshed with new transactions
+        """
+
+        def watch(hashes: int) -> None:
+            if progress is not None:
+                progress(hashes)
+            if stop is not None and stop.is_set():
+                cancel.set()
+            elif (
+                refresh is not None
+                and template.mempool_version != self.__mempool_version
+                and time.monotonic() - template.created >= refresh
+            ):
+                cancel.set()
+
+        return watch
 
+    def submit_mining_job(
+        self, address: str, workers: Optional[int] = None
+    ) -> Optional[MiningJob]:
+        """
+        Queue a job mining a single block. Returns None if the mining service is running.
+        Raises MiningQueueFullError if too many jobs are waiting
+        """
+        with self.__mining_lock:
+            if self.mining_service.running:
+                return None
+            return self.mining_queue.submit(address, workers=workers)
+
+    def start_mining(self, address: str, workers: Optional[int] = None) -> bool:
+        """
+        Start the mining service. Returns False if it is running already, or a mining job
+        is queued or running
+        """
+        with self.__mining_lock:
+            if self.mining_queue.pending():
+                return False
+            return self.mining_service.start(address, workers=workers)
+
+    def __mine_job(self, job: MiningJob) -> Optional[Block]:
+        def progress(hashes: int) -> None:
+            job.hashes = hashes
+
+        block = self.mine_block(job.address, workers=job.workers, progress=progress)
+        if block is not None and self.last_mining_result is not None:
+            job.hashes = self.last_mining_result.hashes
+            job.hashes_per_second = self.last_mining_result.hashes_per_second
         return block
 
+    def __cancel_mining(self) -> None:
+        """
+        The chain tip changed, so the block being mined (if any) can't follow it anymore
+        """
+        cancel = self.__mining_cancel
+        if cancel is not None:
+            cancel.set()
+
+    def __mine_continuously(
+        self,
+        address: str,
+        workers: Optional[int],
+        progress: Callable[[int], None],
+        stop: threading.Event,
+    ) -> Optional[Block]:
+        return self.mine_block(
+            address,
+            workers=workers,
+            progress=progress,
+            refresh=TEMPLATE_REFRESH,
+            stop=stop,
+        )
+
     def add_block(self, block: Block) -> Tuple[bool, Optional[str]]:
         """
         When a new block is received via a broadcast, the receiving nodes must validate the
@@ -479,30 +1175,49 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         This also makes sure that there are not open transactions on any of the nodes
         that match a transaction in the broadcasted block.
         """
-        if not Verification.valid_nonce(block.header):
-            return False, "Nonce is not valid"
-        if (
-            not Verification.hash_block_header(self.last_block.header)
-            == block.header.previous_hash
-        ):
-            return (
-                False,
-                "Hash of last block does not equal previous hash in the current block",
+        with self.__lock:
+            sent_along = [
+                (t.transaction, t.envelope.type)
+                for t in self.__sent_along.pop(block.block_hash, [])
+            ]
+            if not Verification.valid_nonce(block.header):
+                return False, "Nonce is not valid"
+            if block.transaction_count != len(block.transactions):
+                return False, "Transaction count does not match the transactions"
+            # The declared size comes from the peer, so it is measured from the transactions
+            # this node has. The ones still to be received can only make it larger
+            extra = {tx.transaction_hash: tx for (tx, _) in sent_along}
+            bodies = self.__block_transactions(block, ChainMap(self.__mempool, extra))
+            size = len(block.header.SerializeToString()) + sum(
+                len(tx.SerializeToString()) for tx in bodies.values() if tx is not None
             )
-        self.add_block_to_chain(block)
-
-        # Always work off a copy as to not disrupt the current list of open transactions
-        stored_transactions = self.__open_transactions[:]
-        for itx in block.transactions:
-            for opentx in stored_transactions:
-                if opentx.transaction_hash == itx:
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        logger.warning("Item was already removed: %s", opentx)
+            if size > self.assembler.max_size:
+                return False, f"Block is larger than {self.assembler.max_size} bytes"
+            if None not in bodies.values() and size != block.size:
+                return False, "Block size does not match its transactions"
+            if (
+                not Verification.hash_block_header(self.last_block.header)
+                == block.header.previous_hash
+            ):
+                return (
+                    False,
+                    "Hash of last block does not equal previous hash in the current block",
+                )
+            self.add_block_to_chain(block)
+            self.__cancel_mining()
+
+            # Transactions sent along with a compact block are only saved once it is added
+            for (tx, type_) in sent_along:
+                FinalTransaction.SaveTransaction(self.data_location, tx, type_)
+            self.__sync_ledger([tx for (tx, _) in sent_along])
+            # Only the block's own transactions are looked up, however many are open
+            for tx_hash in block.transactions:
+                tx = self.__mempool.remove(tx_hash)
+                if tx is not None:
+                    self.__confirm_open_transaction(tx)
 
-        self.save_data()
-        return True, "success"
+            self.save_data()
+            return True, "success"
 
     def register_node(self, address: str) -> None:
         """
@@ -523,76 +1238,120 @@ class Blockchain:  # pylint: disable=too-many-instance-attributes
         This is our Consensus Algorithm. It resolves conflicts by replacing our chain with
         the longest one in the network.
 
+        Sync is headers first: only the headers after the last block our chain shares with
+        each neighbour's chain are downloaded and verified. Block bodies and transactions
+        are then fetched for the longest valid chain alone, and the ledger is rolled back
+        to the shared block before the new blocks are applied
+
         :return: <bool> True if our chain was replaces, False if not
         """
 
         logger.debug("Resolving conflicts between the nodes if applicable")
 
-        neighbours = self.nodes
-        new_chain = None
+        # (length, node, common ancestor, verified headers after the ancestor)
+        candidates = []  # type: List[Tuple[int, str, int, List[Header]]]
+        # Block hashes of every neighbour's chain, to know which blocks each one can serve
+        peer_hashes = {}  # type: Dict[str, List[str]]
 
         # We're only looking for chains longer than ours
         current_chain_length = len(self.chain)
 
-        # Grab and verify the chains from all the nodes in our network
-        for node in neighbours:
+        # Grab and verify the header chains from all the nodes in our network
+        for node in self.nodes:
             response = requests.get(f"{node}/chain")
 
             if response.ok:
                 length = response.json()["length"]
-                chain_hashes = response.json()["chain"]
+                peer_hashes[node] = response.json()["chain"]
+                if length < current_chain_length or length == current_chain_length > 1:
+                    logger.warning("Neighbour's chain shorter than our node")
+                    continue
 
-                chain = []
+                ancestor = self.common_ancestor(peer_hashes[node])
+                logger.debug("Common ancestor with %s is block %s", node, ancestor)
 
-                for b in chain_hashes:
-                    response = requests.get(f"{node}/block/{b}")
-                    if response.ok:
-                        parsed_block = Block.parse_raw(response.json())
-                        chain.append(parsed_block)
+                try:
+                    headers = download_headers(node, length, start=ancestor + 1)
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    logger.warning("Failed to download the headers of %s: %s", node, e)
+                    continue
+                length = ancestor + 1 + len(headers)
 
-                if (
-                    length == 1
-                    and current_chain_length == 1
-                    and Verification.verify_chain(chain)
-                ):
+                # The shared blocks were verified already, only the new ones need to be.
+                # The ancestor is kept to check that the first new block follows it
+                shared = [self.__chain[ancestor].header] if ancestor >= 0 else []
+                if length == 1 and current_chain_length == 1:
                     logger.debug("Chain's are both 1 length so preferring neighbour's")
-                    current_chain_length = length
-                    new_chain = chain
-
-                # Ensure that the chain is sorted by index
-                chain.sort(key=lambda x: x.index, reverse=False)
-
-                if length <= current_chain_length:
+                elif length <= current_chain_length:
                     logger.warning("Neighbour's chain shorter than our node")
                     continue
+                else:
+                    logger.debug("Neighbour's chain is longer than ours")
 
-                logger.debug("Neighbour's chain is longer than ours")
-                logger.debug("Verifying neighbour's chain")
-                if not Verification.verify_chain(chain):
+                logger.debug("Verifying %s headers of neighbour's chain", len(headers))
+                if not Verification.verify_headers(shared + headers):
                     logger.warning("Neighbour's chain failed verification")
                     continue
 
-                logger.debug("Neighbour's chain successfully verified")
+                logger.debug("Neighbour's headers successfully verified")
                 current_chain_length = length
-                new_chain = chain
-                for b in chain:
-                    for tx_hash in b.transactions:
-                        response = requests.get(f"{node}/transaction/{tx_hash}")
-                        if response.ok:
-                            t = FinalTransaction.parse_raw(
-                                response.json()["transaction"]
-                            )
-                            FinalTransaction.SaveTransaction(
-                                self.data_location, t, response.json()["type"]
-                            )
-
-        # Replace our chain if we discovered a new, valid chain longer than ours
-        if new_chain:
-            logger.info("Replacing our chain with neighbour's chain")
-            self.chain = new_chain
-            Block.DeleteBlocks(self.data_location)
-        else:
-            logger.info("Keeping this node's chain. Now making sure its saved")
+                candidates.append((length, node, ancestor, headers))
+
+        # Download the blocks of the longest valid chain from every neighbour that has
+        # them. If they can't all be downloaded, fall back to the next longest chain
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        for (_, node, ancestor, headers) in candidates:
+            hashes = [Verification.hash_block_header(h) for h in headers]
+            # The chain the verified headers were sent from
+            peer_hashes[node] = self.pretty_chain()[: ancestor + 1] + hashes
+            try:
+                bundles = ParallelDownloader(peer_hashes, ancestor + 1, hashes).download()
+            except ValueError as e:
+                logger.warning("Failed to download the blocks of %s: %s", node, e)
+                continue
+
+            self.__replace_chain(ancestor, bundles)
+            self.save_data()
+            return True
 
+        logger.info("Keeping this node's chain. Now making sure its saved")
         self.save_data()
-        return new_chain is not None and len(new_chain) > 0
+        return False
+
+    def __replace_chain(self, ancestor: int, bundles: List[BlockBundle]) -> None:
+        """
+        Replace the blocks after the common ancestor with the verified blocks of a
+        neighbour's chain
+        """
+        with self.__lock:
+            logger.info(
+                "Replacing our chain with neighbour's chain from block %s", ancestor + 1
+            )
+            orphaned = self.__orphaned_transactions(self.__chain[ancestor + 1:])
+            transactions = [t for b in bundles for t in b.transactions]
+            for envelope in transactions:
+                FinalTransaction.SaveTransaction(
+                    self.data_location, envelope.transaction, envelope.type
+                )
+            self.__rollback_ledger(ancestor)
+            # Only the blocks after the common prefix are written again, replacing ours
+            self.chain = self.__chain[: ancestor + 1] + [b.block for b in bundles]
+            self.__cancel_mining()
+            self.__sync_ledger([envelope.transaction for envelope in transactions])
+            self.__reset_open_transactions(
+                {tx_hash for b in bundles for tx_hash in b.block.transactions}, orphaned
+            )
+            self.save_data()
+
+    def __orphaned_transactions(self, blocks: List[Block]) -> List[FinalTransaction]:
+        """
+        The transactions of blocks leaving the chain, in chain order, without the mining
+        rewards
+        """
+        orphaned = []  # type: List[FinalTransaction]
+        for block in blocks:
+            for tx_hash in block.transactions:
+                found = FinalTransaction.FindTransaction(self.data_location, tx_hash)
+                if found is not None and found[0] == "confirmed":
+                    orphaned.append(found[1])
+        return orphaned
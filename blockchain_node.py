@@ -5,13 +5,39 @@ import logging
 import getpass
 import os
 
+from concurrent.futures import Future
+from typing import Dict, List, Optional
 from uuid import UUID, uuid4
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
+from google.protobuf.message import DecodeError
 
 from blockchain import Blockchain
+from custom_exceptions import (
+    AdmissionQueueFullError,
+    InvalidNonceError,
+    MempoolFullError,
+    MiningQueueFullError,
+    TooManyPendingError,
+)
 from block import Block
-from transaction import Details, FinalTransaction, SignedRawTransaction
+from gossip import Inventory
+from relay import BlockTransactions, BlockTransactionsRequest, CompactBlock
+from sync import (
+    DELIMITED_MIMETYPE,
+    MAX_SYNC_BLOCKS,
+    MAX_SYNC_HEADERS,
+    PROTOBUF_MIMETYPE,
+    TransactionEnvelope,
+    stream_bundles,
+    stream_headers,
+)
+from transaction import (
+    Details,
+    FinalTransaction,
+    SignedRawTransaction,
+    TransactionBatch,
+)
 from util.logging0 import configure_logging
 from verification import Verification
 from wallet import Wallet
@@ -30,6 +56,12 @@ def create_app(
     ADDRESS = "MASTERNODE"
     IS_MASTERNODE = os.getenv("MASTERNODE") is not None
     NODE_ID = UUID(os.getenv("NODE_ID", str(uuid4())))
+    MAX_TRANSACTION_BATCH = int(os.getenv("MAX_TRANSACTION_BATCH", "10000"))
+    # Seconds a batch waits for room in the admission pipeline before a transaction is turned
+    # down
+    ADMISSION_TIMEOUT = float(os.getenv("ADMISSION_TIMEOUT", "30"))
+    # Most processes a request can mine with
+    MAX_MINING_WORKERS = int(os.getenv("MAX_MINING_WORKERS", str(os.cpu_count() or 1)))
     WALLET = Wallet()
 
     blockchain = None
@@ -49,10 +81,17 @@ def create_app(
     timestamp = None if not test else 0
 
     logging.info("Initializing blockchain with id: %s", NODE_ID)
-    blockchain = Blockchain(ADDRESS, NODE_ID, is_test=test, timestamp=timestamp)
+    blockchain = Blockchain(
+        ADDRESS,
+        NODE_ID,
+        is_test=test,
+        timestamp=timestamp,
+        mining_workers=int(os.getenv("MINING_WORKERS", "1")),
+    )
 
     if not blockchain:
         raise ValueError("Unabled to initialize blockchain")
+    app.extensions["blockchain"] = blockchain
 
     if not test and not IS_MASTERNODE:
         logging.info("Connecting to MASTERNODE")
@@ -67,26 +106,201 @@ def create_app(
     #                 ENDPOINTS                      #
     #                                                #
 
+    def sent_protobuf() -> bool:
+        return request.mimetype == PROTOBUF_MIMETYPE
+
+    def wants_protobuf() -> bool:
+        best = request.accept_mimetypes.best_match(["application/json", PROTOBUF_MIMETYPE])
+        return best == PROTOBUF_MIMETYPE
+
+    def invalid_workers(values: Dict) -> Optional[str]:
+        """
+        The reason the requested number of mining processes can't be used, or None
+        """
+        workers = values.get("workers")
+        if workers is None:
+            return None
+        if (
+            isinstance(workers, bool)
+            or not isinstance(workers, int)
+            or not 1 <= workers <= MAX_MINING_WORKERS
+        ):
+            return f"workers must be a whole number from 1 to {MAX_MINING_WORKERS}"
+        return None
+
+    def accept_block(block: Block):
+        if block.index == blockchain.last_block.index + 1:
+            added, message = blockchain.add_block(block)
+            if added:
+                response = {"message": "Block added"}
+                return jsonify(response), 201
+            response = {"message": "Block seems invalid: " + message}
+            return jsonify(response), 500
+        if block.index > blockchain.last_block.index:
+            response = {
+                "message": "Incoming block index higher than last block on current chain"
+            }
+            return jsonify(response), 500
+        response = {"message": "Blockchain seems to be shorter, block not added"}
+        return jsonify(response), 409
+
     @app.route("/mine", methods=["POST"])
     def mine():  # pylint: disable=unused-variable
+        """
+        Queues a mining job. Jobs run one at a time in the background
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        miner_address : str Address the mining reward goes to
+        workers : optional int Number of processes to mine with
+        wait : optional bool Wait for the block to be mined, and respond with it
+
+        Returns application/json
+        -----
+        Return code : 202, 400, 409, 429, or with wait 200, 500
+        Response :
+        job_id : str
+        status : str
+        """
         values = request.get_json()
 
         # Check for required fields
         required = ["miner_address"]
         if not values or not all(k in values for k in required):
             return "Missing values", 400
+        error = invalid_workers(values)
+        if error is not None:
+            return jsonify({"message": error}), 400
 
-        blockchain.mine_block(values["miner_address"])
-
-        block = blockchain.last_block
+        try:
+            job = blockchain.submit_mining_job(
+                values["miner_address"], workers=values.get("workers")
+            )
+        except MiningQueueFullError as e:
+            return jsonify({"message": str(e)}), 429
+        if job is None:
+            response = {"message": "The mining service is running"}
+            return jsonify(response), 409
+        if not values.get("wait"):
+            response = {"job_id": job.job_id, "status": job.status}
+            return jsonify(response), 202
+
+        blockchain.mining_queue.wait(job.job_id)
+        if job.block is None:
+            response = {"message": "Mining failed", "error": job.error}
+            return jsonify(response), 500
 
         response = {
             "message": "New Block Forged",
-            "block": block.json(),
+            "job_id": job.job_id,
+            "block": job.block.json(),
+            "hashes_per_second": job.hashes_per_second,
         }
 
         return jsonify(response), 200
 
+    @app.route("/mine/<job_id>", methods=["GET"])
+    def mining_job(job_id):  # pylint: disable=unused-variable
+        """
+        Returns the progress of a mining job
+
+        Methods
+        -----
+        GET
+
+        Returns application/json
+        -----
+        Return code : 200, 404
+        Response :
+        A MiningJob, with its status, the nonces tried so far and the mined block
+        """
+        job = blockchain.mining_queue.job(job_id)
+        if job is None:
+            response = {"message": f"Mining job {job_id} not found"}
+            return jsonify(response), 404
+        return Response(job.json(), status=200, content_type="application/json")
+
+    @app.route("/mining/start", methods=["POST"])
+    def start_mining():  # pylint: disable=unused-variable
+        """
+        Starts mining blocks one after another in the background. The block template is
+        refreshed when the chain tip or the open transactions change
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        miner_address : str Address the mining rewards go to
+        workers : optional int Number of processes to mine with
+
+        Returns application/json
+        -----
+        Return code : 200, 400, 409
+        Response :
+        message : str
+        """
+        values = request.get_json()
+        if not values or "miner_address" not in values:
+            return "Missing values", 400
+        error = invalid_workers(values)
+        if error is not None:
+            return jsonify({"message": error}), 400
+        if not blockchain.start_mining(
+            values["miner_address"], workers=values.get("workers")
+        ):
+            if blockchain.mining_service.running:
+                response = {"message": "The mining service is running already"}
+            else:
+                response = {"message": "A mining job is running"}
+            return jsonify(response), 409
+        response = {"message": "Mining started"}
+        return jsonify(response), 200
+
+    @app.route("/mining/stop", methods=["POST"])
+    def stop_mining():  # pylint: disable=unused-variable
+        """
+        Stops the mining service, giving up on the block being mined
+
+        Methods
+        -----
+        POST
+
+        Returns application/json
+        -----
+        Return code : 200, 409
+        Response :
+        message : str
+        """
+        if not blockchain.mining_service.stop(timeout=10):
+            response = {"message": "The mining service is not running"}
+            return jsonify(response), 409
+        response = {"message": "Mining stopped"}
+        return jsonify(response), 200
+
+    @app.route("/mining/stats", methods=["GET"])
+    def mining_stats():  # pylint: disable=unused-variable
+        """
+        Returns statistics of the mining service
+
+        Methods
+        -----
+        GET
+
+        Returns application/json
+        -----
+        Return code : 200
+        Response :
+        MiningStats, with the blocks and hashes since the service was started
+        """
+        stats = blockchain.mining_service.stats()
+        return Response(stats.json(), status=200, content_type="application/json")
+
     @app.route("/transactions/new", methods=["POST"])
     def new_transaction():  # pylint: disable=unused-variable
         values = request.get_json()
@@ -99,24 +313,98 @@ def create_app(
         details = values["transaction"]["details"]
         # Create a new Transaction
 
-        index = blockchain.add_transaction(
-            SignedRawTransaction(
-                details=Details(
-                    sender=details["sender"],
-                    recipient=details["recipient"],
-                    amount=details["amount"],
-                    nonce=details["nonce"],
-                    timestamp=details["timestamp"],
-                    public_key=details["public_key"],
+        try:
+            index = blockchain.add_transaction(
+                SignedRawTransaction(
+                    details=Details(
+                        sender=details["sender"],
+                        recipient=details["recipient"],
+                        amount=details["amount"],
+                        nonce=details["nonce"],
+                        timestamp=details["timestamp"],
+                        public_key=details["public_key"],
+                    ),
+                    signature=values["transaction"]["signature"],
                 ),
-                signature=values["transaction"]["signature"],
-            ),
-            "open",
-        )
+                "open",
+            )
+        except (TooManyPendingError, MempoolFullError) as e:
+            response = {"message": "Creating a transaction failed.", "error": str(e)}
+            return jsonify(response), 429
+        except (InvalidNonceError, ValueError) as e:
+            response = {"message": "Creating a transaction failed.", "error": str(e)}
+            return jsonify(response), 400
 
         response = {"message": f"Transaction will be added to Block {index}"}
         return jsonify(response), 201
 
+    @app.route("/transactions/batch", methods=["POST"])
+    def new_transactions():  # pylint: disable=unused-variable
+        """
+        Adds many signed transactions at once, through the admission pipeline. Signatures
+        are verified in parallel, and transactions are added in order, saved together and
+        announced to the other nodes in batches
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        A serialized TransactionBatch as application/x-protobuf, or
+        transactions : List[str] Serialized transactions, as hex
+
+        Returns application/json
+        -----
+        Return code : 201, 400, 413
+        Response :
+        results : List[Dict] The hash of every transaction, whether it was added and if
+                             not, the error
+        block : int Index of the block that will hold the added transactions
+        """
+        try:
+            if sent_protobuf():
+                batch = TransactionBatch.ParseFromString(request.get_data())
+            else:
+                values = request.get_json()
+                if not values or "transactions" not in values:
+                    return jsonify({"message": "Some data is missing."}), 400
+                batch = TransactionBatch(
+                    transactions=[
+                        SignedRawTransaction.ParseFromHex(t)
+                        for t in values["transactions"]
+                    ]
+                )
+        except (DecodeError, ValueError, TypeError):
+            response = {"message": "Transactions can't be parsed."}
+            return jsonify(response), 400
+        if not batch.transactions:
+            return jsonify({"message": "No transactions found."}), 400
+        if len(batch.transactions) > MAX_TRANSACTION_BATCH:
+            response = {
+                "message": f"At most {MAX_TRANSACTION_BATCH} transactions per batch."
+            }
+            return jsonify(response), 413
+
+        futures = []  # type: List[Future]
+        for transaction in batch.transactions:
+            try:
+                future = blockchain.admission.submit(transaction, timeout=ADMISSION_TIMEOUT)
+            except AdmissionQueueFullError as e:
+                future = Future()
+                future.set_result((e.transaction_hash, e.message))
+            futures.append(future)
+        results = [future.result() for future in futures]
+        response = {
+            "results": [
+                {"transaction": h, "added": error is None, "error": error}
+                for (h, error) in results
+            ],
+            "block": blockchain.next_index,
+        }
+        added = any(error is None for (_, error) in results)
+        return jsonify(response), 201 if added else 400
+
     @app.route("/transactions/pending", methods=["GET"])
     def pending_transaction():  # pylint: disable=unused-variable
         """
@@ -136,6 +424,43 @@ def create_app(
         pending = [t.transaction_hash for t in blockchain.get_open_transactions]
         return jsonify(pending), 201
 
+    @app.route("/mempool/stats", methods=["GET"])
+    def mempool_stats():  # pylint: disable=unused-variable
+        """
+        Returns the size and limits of the pool of open transactions
+
+        Methods
+        -----
+        GET
+
+        Returns application/json
+        -----
+        Return code : 200
+        Response :
+        MempoolStats, with the transactions evicted and expired so far
+        """
+        stats = blockchain.mempool_stats()
+        return Response(stats.json(), status=200, content_type="application/json")
+
+    @app.route("/admission/stats", methods=["GET"])
+    def admission_stats():  # pylint: disable=unused-variable
+        """
+        Returns how many transactions went through every stage of the admission pipeline,
+        how many are waiting, and how long they took
+
+        Methods
+        -----
+        GET
+
+        Returns application/json
+        -----
+        Return code : 200
+        Response :
+        AdmissionStats, with the latencies in seconds
+        """
+        stats = blockchain.admission.stats()
+        return Response(stats.json(), status=200, content_type="application/json")
+
     @app.route("/chain", methods=["GET"])
     def full_chain():  # pylint: disable=unused-variable
         """
@@ -155,6 +480,77 @@ def create_app(
         response = {"chain": blockchain.pretty_chain(), "length": len(blockchain.chain)}
         return jsonify(response), 200
 
+    @app.route("/blocks", methods=["GET"])
+    def block_range():  # pylint: disable=unused-variable
+        """
+        Returns a range of blocks, with their transactions, for nodes syncing the chain
+
+        Methods
+        -----
+        GET
+
+        Parameters
+        -----
+        from : int   -- index of the first block (defaults to 0)
+        count : int  -- number of blocks, at most MAX_SYNC_BLOCKS (defaults to the maximum)
+
+        Returns application/x-protobuf; delimited=true
+        -----
+        Return code : 200, 400
+        Response :
+        Length-delimited BlockBundle messages, in block order
+        """
+        try:
+            start = int(request.args.get("from", 0))
+            count = min(
+                int(request.args.get("count", MAX_SYNC_BLOCKS)), MAX_SYNC_BLOCKS
+            )
+        except ValueError:
+            return jsonify({"error": "from and count must be integers"}), 400
+        if start < 0 or count < 1:
+            return jsonify({"error": "from must be >= 0 and count >= 1"}), 400
+
+        end = start + count
+        blocks = blockchain.chain[start:end]
+        return Response(
+            stream_bundles(blockchain.data_location, blocks),
+            content_type=DELIMITED_MIMETYPE,
+        )
+
+    @app.route("/headers", methods=["GET"])
+    def header_range():  # pylint: disable=unused-variable
+        """
+        Returns a range of block headers, for nodes verifying a chain before downloading it
+
+        Methods
+        -----
+        GET
+
+        Parameters
+        -----
+        from : int   -- index of the first block (defaults to 0)
+        count : int  -- number of headers, at most MAX_SYNC_HEADERS (defaults to the maximum)
+
+        Returns application/x-protobuf; delimited=true
+        -----
+        Return code : 200, 400
+        Response :
+        Length-delimited Header messages, in block order
+        """
+        try:
+            start = int(request.args.get("from", 0))
+            count = min(
+                int(request.args.get("count", MAX_SYNC_HEADERS)), MAX_SYNC_HEADERS
+            )
+        except ValueError:
+            return jsonify({"error": "from and count must be integers"}), 400
+        if start < 0 or count < 1:
+            return jsonify({"error": "from must be >= 0 and count >= 1"}), 400
+
+        end = start + count
+        blocks = blockchain.chain[start:end]
+        return Response(stream_headers(blocks), content_type=DELIMITED_MIMETYPE)
+
     @app.route("/block/<block_hash>", methods=["GET"])
     def block_by_hash(block_hash):  # pylint: disable=unused-variable
         """
@@ -164,7 +560,7 @@ def create_app(
         -----
         GET
 
-        Returns application/json
+        Returns application/json, or application/x-protobuf if accepted
         -----
         Return code : 200
         Response :
@@ -172,6 +568,10 @@ def create_app(
         """
         solved_block = Block.FindBlock(blockchain.data_location, block_hash)
         if solved_block:
+            if wants_protobuf():
+                return Response(
+                    solved_block.SerializeToString(), content_type=PROTOBUF_MIMETYPE
+                )
             return jsonify(solved_block.json()), 200
         return jsonify({"error": f"No block found with hash {block_hash}"}), 404
 
@@ -184,7 +584,8 @@ def create_app(
         -----
         GET
 
-        Returns application/json
+        Returns application/json, or a TransactionEnvelope as application/x-protobuf
+        if accepted
         -----
         Return code : 200
         Response :
@@ -199,6 +600,11 @@ def create_app(
         )
         if packed:
             type_, transaction = packed
+            if wants_protobuf():
+                envelope = TransactionEnvelope(type=type_, transaction=transaction)
+                return Response(
+                    envelope.SerializeToString(), content_type=PROTOBUF_MIMETYPE
+                )
             return jsonify({"type": type_, "transaction": transaction.json()}), 200
         return (
             jsonify({"error": f"No transaction found with hash {transaction_hash}"}),
@@ -279,6 +685,8 @@ def create_app(
         Parameters
         -----
         block : Block as hex
+          or
+        A serialized Block as application/x-protobuf
 
         Returns application/json
         -----
@@ -286,28 +694,133 @@ def create_app(
         Response :
         message : str
         """
-        values = request.get_json()
-        if not values:
-            response = {"message": "No data found."}
+        if sent_protobuf():
+            try:
+                block = Block.ParseFromString(request.get_data())
+            except DecodeError:
+                response = {"message": "Block can't be parsed."}
+                return jsonify(response), 400
+        else:
+            values = request.get_json()
+            if not values:
+                response = {"message": "No data found."}
+                return jsonify(response), 400
+            if "block" not in values:
+                response = {"message": "Some data is missing."}
+                return jsonify(response), 400
+            block = Block.ParseFromHex(values["block"])
+        return accept_block(block)
+
+    # POST - Broadcast Mined Block Information to Peer Nodes, as a Compact Block
+    @app.route("/broadcast-compact-block", methods=["POST"])
+    def broadcast_compact_block():  # pylint: disable=unused-variable
+        """
+        Receives a new block with short IDs of its transactions, and rebuilds it from the
+        open transactions
+        Returns a status message, or the transactions that are missing to rebuild it
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        A serialized CompactBlock as application/x-protobuf
+
+        Returns application/json, or a BlockTransactionsRequest as application/x-protobuf
+        -----
+        Return code : 201, 202, 400, 409, 500
+        Response :
+        message : str
+        """
+        try:
+            compact = CompactBlock.ParseFromString(request.get_data())
+        except (DecodeError, ValueError):
+            response = {"message": "Compact block can't be parsed."}
             return jsonify(response), 400
-        if "block" not in values:
-            response = {"message": "Some data is missing."}
+        if compact.block.index != blockchain.last_block.index + 1:
+            return accept_block(compact.block)
+
+        block, missing = blockchain.receive_compact_block(compact)
+        if block is None:
+            requested = BlockTransactionsRequest(
+                block_hash=compact.block.block_hash, indexes=missing
+            )
+            return Response(
+                requested.SerializeToString(),
+                status=202,
+                content_type=PROTOBUF_MIMETYPE,
+            )
+        return accept_block(block)
+
+    # POST - Transactions Missing from a Compact Block
+    @app.route("/broadcast-block-transactions", methods=["POST"])
+    def broadcast_block_transactions():  # pylint: disable=unused-variable
+        """
+        Receives the transactions a compact block was missing, and adds the block
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        A serialized BlockTransactions as application/x-protobuf
+
+        Returns application/json
+        -----
+        Return code : 201, 400, 409, 500
+        Response :
+        message : str
+        """
+        try:
+            transactions = BlockTransactions.ParseFromString(request.get_data())
+        except (DecodeError, ValueError):
+            response = {"message": "Transactions can't be parsed."}
             return jsonify(response), 400
-        block = Block.ParseFromHex(values["block"])
-        if block.index == blockchain.last_block.index + 1:
-            added, message = blockchain.add_block(block)
-            if added:
-                response = {"message": "Block added"}
-                return jsonify(response), 201
-            response = {"message": "Block seems invalid: " + message}
-            return jsonify(response), 500
-        if block.index > blockchain.last_block.index:
-            response = {
-                "message": "Incoming block index higher than last block on current chain"
-            }
-            return jsonify(response), 500
-        response = {"message": "Blockchain seems to be shorter, block not added"}
-        return jsonify(response), 409
+        block = blockchain.receive_block_transactions(transactions)
+        if block is None:
+            response = {"message": "Transactions don't complete a known compact block."}
+            return jsonify(response), 400
+        return accept_block(block)
+
+    # POST - Announcement of New Transactions by a Peer Node
+    @app.route("/inventory", methods=["POST"])
+    def inventory():  # pylint: disable=unused-variable
+        """
+        Receives the hashes of transactions a peer has, and asks for the ones this node
+        hasn't seen yet
+
+        Methods
+        -----
+        POST
+
+        Parameters
+        -----
+        A serialized Inventory as application/x-protobuf
+
+        Returns application/json, or an Inventory of the wanted transactions as
+        application/x-protobuf
+        -----
+        Return code : 200, 202, 400
+        Response :
+        message : str
+        """
+        try:
+            announced = Inventory.ParseFromString(request.get_data())
+        except (DecodeError, ValueError):
+            response = {"message": "Inventory can't be parsed."}
+            return jsonify(response), 400
+
+        wanted = blockchain.receive_inventory(announced)
+        if wanted:
+            return Response(
+                Inventory(transaction_hashes=wanted).SerializeToString(),
+                status=202,
+                content_type=PROTOBUF_MIMETYPE,
+            )
+        response = {"message": "No new transactions."}
+        return jsonify(response), 200
 
     # POST - Broadcast Transaction Information to Peer Nodes
     @app.route("/broadcast-transaction", methods=["POST"])
@@ -323,23 +836,35 @@ def create_app(
         Parameters
         -----
         transaction : SignedRawTransaction as hex
+        type : str
+          or
+        A serialized TransactionEnvelope as application/x-protobuf
 
         Returns application/json
         -----
-        Return code : 201, 400, 500
+        Return code : 201, 400, 429, 500
         Response :
         message : str
         transaction : optional Transaction as Dict
         """
-        values = request.get_json()
-        if not values:
-            response = {"message": "No data found."}
-            return jsonify(response), 400
-        required = ["transaction", "type"]
-        if not all(key in values for key in required):
-            response = {"message": "Some data is missing."}
-            return jsonify(response), 400
-        t = SignedRawTransaction.ParseFromHex(values["transaction"])
+        if sent_protobuf():
+            try:
+                envelope = TransactionEnvelope.ParseFromString(request.get_data())
+            except (DecodeError, ValueError):
+                response = {"message": "Transaction can't be parsed."}
+                return jsonify(response), 400
+            t = envelope.transaction.signed_transaction
+            values = {"transaction": t.SerializeToHex(), "type": envelope.type}
+        else:
+            values = request.get_json()
+            if not values:
+                response = {"message": "No data found."}
+                return jsonify(response), 400
+            required = ["transaction", "type"]
+            if not all(key in values for key in required):
+                response = {"message": "Some data is missing."}
+                return jsonify(response), 400
+            t = SignedRawTransaction.ParseFromHex(values["transaction"])
         try:
             if values["type"] == "mining" or values["type"] == "confirmed":
                 tx = FinalTransaction(
@@ -347,9 +872,7 @@ def create_app(
                     transaction_id=Verification.hash_transaction(t),
                     signed_transaction=t,
                 )
-                FinalTransaction.SaveTransaction(
-                    blockchain.data_location, tx, values["type"]
-                )
+                blockchain.store_transaction(tx, values["type"])
                 response = {
                     "message": f"Successfully saved {values['type']} transaction.",
                     "transaction": values["transaction"],
@@ -362,6 +885,12 @@ def create_app(
                 "block": block_index,
             }
             return jsonify(response), 201
+        except (TooManyPendingError, MempoolFullError) as e:
+            response = {"message": "Creating a transaction failed.", "error": str(e)}
+            return jsonify(response), 429
+        except InvalidNonceError as e:
+            response = {"message": "Creating a transaction failed.", "error": str(e)}
+            return jsonify(response), 400
         except ValueError as e:
             response = {"message": "Creating a transaction failed.", "error": str(e)}
         return jsonify(response), 500
@@ -0,0 +1,269 @@
+"""
+Fire-and-forget delivery of transactions and blocks to the other nodes on the network
+"""
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from sync import PROTOBUF_MIMETYPE
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds for a single delivery to a peer
+TIMEOUT = (3.05, 10.0)
+
+# Seconds a peer that answered 415 to a protobuf body is only sent JSON, before protobuf is
+# tried again
+PROTOBUF_REPROBE = 600.0
+
+
+class Delivery:
+    """
+    path : <str> Endpoint of the peer to post to, e.g. '/broadcast-block'
+    payload : <optional Dict> JSON body. Without one, data is always sent
+    data : <optional bytes> Serialized protobuf body, sent instead of the JSON body to
+                            peers that accept it
+    reply : <optional Callable> Called with the peer's response. Returns deliveries to
+                                send to that peer right after this one
+    attempts : <int> How many times this delivery failed so far
+    """
+
+    def __init__(
+        self,
+        path: str,
+        payload: Optional[Dict],
+        data: Optional[bytes] = None,
+        reply: Optional[Callable[[Any], List["Delivery"]]] = None,
+    ) -> None:
+        self.path = path
+        self.payload = payload
+        self.data = data
+        self.reply = reply
+        self.attempts = 0
+
+
+class Peer:
+    """
+    A peer's connection pool and its queue of deliveries. Deliveries to a peer are sent in
+    order, one at a time, so a block is never received before the transactions sent ahead
+    of it
+    """
+
+    def __init__(self, url: str, session: requests.Session, max_queue: int) -> None:
+        self.url = url
+        self.session = session
+        self.queue = deque(maxlen=max_queue)  # type: Deque[Delivery]
+        self.busy = False
+        # time.monotonic() until which the peer is only sent JSON, after it answered 415
+        self.json_only_until = 0.0
+
+    def accepts_protobuf(self) -> bool:
+        return time.monotonic() >= self.json_only_until
+
+
+class Broadcaster:  # pylint: disable=too-many-instance-attributes
+    """
+    Sends payloads to peers in the background.
+      - every peer has a persistent session (connection pool) and its own ordered queue
+      - a bounded pool of worker threads drains the queues, so a slow peer only holds up
+        its own deliveries
+      - deliveries time out, and failed deliveries are retried with a backoff before the
+        rest of that peer's queue is sent
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        workers: int = 8,
+        timeout: Tuple[float, float] = TIMEOUT,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+        max_queue: int = 10000,
+        session_factory: Callable[[], Any] = requests.Session,
+        reprobe: float = PROTOBUF_REPROBE,
+    ) -> None:
+        self.timeout = timeout
+        self.reprobe = reprobe
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_queue = max_queue
+        self.session_factory = session_factory
+        self.__executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="broadcast"
+        )
+        self.__peers = {}  # type: Dict[str, Peer]
+        self.__lock = threading.Lock()
+        self.__idle = threading.Condition(self.__lock)
+
+    def __peer(self, url: str) -> Peer:
+        peer = self.__peers.get(url)
+        if peer is None:
+            session = self.session_factory()
+            if isinstance(session, requests.Session):
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+            peer = Peer(url, session, self.max_queue)
+            self.__peers[url] = peer
+        return peer
+
+    def submit(  # pylint: disable=too-many-arguments
+        self,
+        nodes: Iterable[str],
+        path: str,
+        payload: Optional[Dict],
+        data: Optional[bytes] = None,
+        reply: Optional[Callable[[Any], List[Delivery]]] = None,
+    ) -> None:
+        """
+        Queue a payload for every node and return right away. If data is given, it is sent
+        as application/x-protobuf to the peers that accept it
+        """
+        with self.__lock:
+            for node in nodes:
+                peer = self.__peer(node)
+                if len(peer.queue) == peer.queue.maxlen:
+                    logger.warning("Queue for %s is full, dropping oldest delivery", node)
+                peer.queue.append(Delivery(path, payload, data, reply))
+                self.__schedule(peer)
+
+    def __schedule(self, peer: Peer, delay: float = 0.0) -> None:
+        if peer.busy or not peer.queue:
+            return
+        peer.busy = True
+        if delay > 0:
+            timer = threading.Timer(delay, self.__executor.submit, (self.__drain, peer))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.__executor.submit(self.__drain, peer)
+
+    def __drain(self, peer: Peer) -> None:
+        released = False
+        try:
+            released = self.__drain_queue(peer)
+        finally:
+            # Even if draining failed unexpectedly, the peer can be scheduled again and
+            # flush doesn't wait on it forever
+            if not released:
+                with self.__lock:
+                    peer.busy = False
+                    self.__idle.notify_all()
+
+    def __drain_queue(self, peer: Peer) -> bool:
+        """
+        Send the peer's deliveries until its queue is empty, or a failed one is scheduled
+        to be retried. Returns True once the peer was released either way
+        """
+        while True:
+            with self.__lock:
+                if not peer.queue:
+                    peer.busy = False
+                    self.__idle.notify_all()
+                    return True
+                delivery = peer.queue[0]
+
+            try:
+                follow_ups = self.__send(peer, delivery)
+            except Exception as e:  # pylint: disable=broad-except
+                delivery.attempts += 1
+                logger.exception(e)
+                follow_ups = None
+            delivered = follow_ups is not None
+
+            with self.__lock:
+                if delivered or delivery.attempts >= self.max_attempts:
+                    if not delivered:
+                        logger.error(
+                            "Giving up on %s%s after %s attempts",
+                            peer.url,
+                            delivery.path,
+                            delivery.attempts,
+                        )
+                    if peer.queue and peer.queue[0] is delivery:
+                        peer.queue.popleft()
+                    follow_ups = follow_ups or []
+                    dropped = len(peer.queue) + len(follow_ups) - self.max_queue
+                    if dropped > 0:
+                        logger.warning(
+                            "Queue for %s is full, dropping %s newest deliveries",
+                            peer.url,
+                            dropped,
+                        )
+                    peer.queue.extendleft(reversed(follow_ups))
+                    continue
+
+                # Keep the failed delivery at the head of the queue, so ordering holds
+                peer.busy = False
+                self.__schedule(peer, self.retry_delay * 2 ** (delivery.attempts - 1))
+                return True
+
+    def __send(self, peer: Peer, delivery: Delivery) -> Optional[List[Delivery]]:
+        """
+        Returns the deliveries to send next, or None if the delivery should be retried
+        """
+        url = f"{peer.url}{delivery.path}"
+        try:
+            logger.debug("Broadcasting to %s", url)
+            response = None
+            if delivery.data is not None and (
+                peer.accepts_protobuf() or delivery.payload is None
+            ):
+                response = peer.session.post(
+                    url,
+                    data=delivery.data,
+                    headers={"Content-Type": PROTOBUF_MIMETYPE},
+                    timeout=self.timeout,
+                )
+                if delivery.payload is not None and response.status_code == 415:
+                    logger.info("%s doesn't accept protobuf, sending JSON", peer.url)
+                    peer.json_only_until = time.monotonic() + self.reprobe
+                    response = None
+                elif delivery.payload is not None and response.status_code == 400:
+                    # Nodes that only read JSON bodies reject it as missing data. It may
+                    # as well be this delivery that is wrong, so only it is sent as JSON
+                    response = None
+            if response is None:
+                response = peer.session.post(
+                    url, json=delivery.payload, timeout=self.timeout
+                )
+            if response.status_code == 400 or response.status_code == 500:
+                logger.error("%s declined, needs resolving: %s", url, response.text)
+        except requests.exceptions.RequestException as e:
+            delivery.attempts += 1
+            logger.warning(
+                "Failed to reach %s (attempt %s): %s", url, delivery.attempts, e
+            )
+            return None
+
+        if delivery.reply is None:
+            return []
+        try:
+            return delivery.reply(response)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Failed to handle the response of %s: %s", url, e)
+            return []
+
+    def pending(self) -> int:
+        with self.__lock:
+            return sum(len(p.queue) for p in self.__peers.values())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued delivery was sent or given up on
+        """
+        with self.__idle:
+            return self.__idle.wait_for(
+                lambda: not any(p.busy or p.queue for p in self.__peers.values()),
+                timeout,
+            )
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=False)
@@ -99,11 +99,9 @@ class Window(
         self.registerAndSyncNode()
 
     def format_label(self) -> None:
-        balance = (
-            0.0
-            if self.blockchain.get_balance() is None
-            else self.blockchain.get_balance()
-        )
+        balance = self.blockchain.get_balance()
+        if balance is None:
+            balance = 0.0
         self.label.setText(
             "Address: {}\nBalance: {:6.2f}".format(self.wallet.address, balance)
         )
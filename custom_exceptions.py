@@ -54,3 +54,95 @@ class InvalidNonceError(Exception):
             f"Sender: {self.sender} -> Transaction nonce: {self.nonce} -> "
             f"Expected nonce: {self.expected_nonce} -> {self.message}"
         )
+
+
+class TooManyPendingError(Exception):
+    """
+    Attributes:
+        sender   -- sender
+        pending  -- number of the sender's open transactions
+        limit    -- most open transactions a sender can have
+        message  -- explanation of the error
+    """
+
+    def __init__(
+        self,
+        sender: str,
+        pending: int,
+        limit: int,
+        message="Sender has too many open transactions",
+    ) -> None:
+        self.sender = sender
+        self.pending = pending
+        self.limit = limit
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self) -> str:
+        return (
+            f"Sender: {self.sender} -> Open transactions: {self.pending} -> "
+            f"Limit: {self.limit} -> {self.message}"
+        )
+
+
+class MempoolFullError(Exception):
+    """
+    Attributes:
+        transaction_hash -- hash of the transaction
+        message          -- explanation of the error
+    """
+
+    def __init__(
+        self,
+        transaction_hash: str,
+        message="The pool of open transactions is full",
+    ) -> None:
+        self.transaction_hash = transaction_hash
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self) -> str:
+        return f"Transaction: {self.transaction_hash} -> {self.message}"
+
+
+class AdmissionQueueFullError(Exception):
+    """
+    Attributes:
+        transaction_hash -- hash of the transaction
+        limit            -- most transactions waiting to be admitted
+        message          -- explanation of the error
+    """
+
+    def __init__(
+        self,
+        transaction_hash: str,
+        limit: int,
+        message="Too many transactions are waiting to be admitted",
+    ) -> None:
+        self.transaction_hash = transaction_hash
+        self.limit = limit
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self) -> str:
+        return f"Transaction: {self.transaction_hash} -> {self.message} ({self.limit})"
+
+
+class MiningQueueFullError(Exception):
+    """
+    Attributes:
+        limit    -- most mining jobs waiting or running
+        message  -- explanation of the error
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        message="Too many mining jobs are waiting",
+    ) -> None:
+        self.limit = limit
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self) -> str:
+        return f"{self.message} ({self.limit})"
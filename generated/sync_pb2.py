@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: generated/sync.proto
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import symbol_database as _symbol_database
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from generated import block_pb2 as generated_dot_block__pb2
+from generated import transaction_pb2 as generated_dot_transaction__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14generated/sync.proto\x12\x04sync\x1a\x15generated/block.proto\x1a\x1bgenerated/transaction.proto\"\xb2\x01\n\x13TransactionEnvelope\x12\x1d\n\x10transaction_hash\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x11\n\x04type\x18\x02 \x01(\tH\x01\x88\x01\x01\x12;\n\x0btransaction\x18\x03 \x01(\x0b\x32!.transaction.SignedRawTransactionH\x02\x88\x01\x01\x42\x13\n\x11_transaction_hashB\x07\n\x05_typeB\x0e\n\x0c_transaction\"j\n\x0b\x42lockBundle\x12 \n\x05\x62lock\x18\x01 \x01(\x0b\x32\x0c.block.BlockH\x00\x88\x01\x01\x12/\n\x0ctransactions\x18\x02 \x03(\x0b\x32\x19.sync.TransactionEnvelopeB\x08\n\x06_block\"y\n\x14PrefilledTransaction\x12\x12\n\x05index\x18\x01 \x01(\rH\x00\x88\x01\x01\x12\x33\n\x0btransaction\x18\x02 \x01(\x0b\x32\x19.sync.TransactionEnvelopeH\x01\x88\x01\x01\x42\x08\n\x06_indexB\x0e\n\x0c_transaction\"|\n\x0c\x43ompactBlock\x12 \n\x05\x62lock\x18\x01 \x01(\x0b\x32\x0c.block.BlockH\x00\x88\x01\x01\x12\x11\n\tshort_ids\x18\x02 \x03(\x0c\x12-\n\tprefilled\x18\x03 \x03(\x0b\x32\x1a.sync.PrefilledTransactionB\x08\n\x06_block\"S\n\x18\x42lockTransactionsRequest\x12\x17\n\nblock_hash\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x0f\n\x07indexes\x18\x02 \x03(\rB\r\n\x0b_block_hash\"m\n\x11\x42lockTransactions\x12\x17\n\nblock_hash\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x30\n\x0ctransactions\x18\x02 \x03(\x0b\x32\x1a.sync.PrefilledTransactionB\r\n\x0b_block_hash\"\'\n\tInventory\x12\x1a\n\x12transaction_hashes\x18\x01 \x03(\tb\x06proto3')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'generated.sync_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _TRANSACTIONENVELOPE._serialized_start=83
+  _TRANSACTIONENVELOPE._serialized_end=261
+  _BLOCKBUNDLE._serialized_start=263
+  _BLOCKBUNDLE._serialized_end=369
+  _PREFILLEDTRANSACTION._serialized_start=371
+  _PREFILLEDTRANSACTION._serialized_end=492
+  _COMPACTBLOCK._serialized_start=494
+  _COMPACTBLOCK._serialized_end=618
+  _BLOCKTRANSACTIONSREQUEST._serialized_start=620
+  _BLOCKTRANSACTIONSREQUEST._serialized_end=703
+  _BLOCKTRANSACTIONS._serialized_start=705
+  _BLOCKTRANSACTIONS._serialized_end=814
+  _INVENTORY._serialized_start=816
+  _INVENTORY._serialized_end=855
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,171 @@
+"""
+Transaction gossip: nodes announce the hashes of new transactions in batches, and peers fetch
+only the transactions they haven't seen yet
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from pydantic import BaseModel
+
+from generated import sync_pb2
+
+logger = logging.getLogger(__name__)
+
+# Most transaction hashes sent in a single announcement
+MAX_INVENTORY = 1000
+
+# Seconds new transactions are collected for before they are announced
+ANNOUNCE_DELAY = 0.1
+
+# Transaction hashes remembered to suppress duplicate announcements and requests
+MAX_RECENTLY_SEEN = 50000
+
+# Seconds a transaction asked from a peer is waited for before it is asked from another
+REQUEST_TIMEOUT = 30.0
+
+
+class Inventory(BaseModel):
+    """
+    transaction_hashes : <List[str]> Hashes of the announced (or requested) transactions
+    """
+
+    transaction_hashes: List[str]
+
+    def SerializeToString(self) -> bytes:
+        return sync_pb2.Inventory(
+            transaction_hashes=self.transaction_hashes
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(inventory_bytes: bytes) -> Inventory:
+        inventory = sync_pb2.Inventory()
+        inventory.ParseFromString(inventory_bytes)
+
+        return Inventory(transaction_hashes=list(inventory.transaction_hashes))
+
+
+class RecentlySeen:
+    """
+    A set of transaction hashes that forgets the oldest ones past max_size
+    """
+
+    def __init__(self, max_size: int = MAX_RECENTLY_SEEN) -> None:
+        self.max_size = max_size
+        self.__hashes = OrderedDict()  # type: OrderedDict[str, None]
+        self.__lock = threading.Lock()
+
+    def add(self, transaction_hash: str) -> bool:
+        """
+        Returns False if the hash was seen already
+        """
+        with self.__lock:
+            if transaction_hash in self.__hashes:
+                return False
+            self.__hashes[transaction_hash] = None
+            while len(self.__hashes) > self.max_size:
+                self.__hashes.popitem(last=False)
+            return True
+
+    def __contains__(self, transaction_hash: object) -> bool:
+        with self.__lock:
+            return transaction_hash in self.__hashes
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__hashes)
+
+
+class InFlight:
+    """
+    Transaction hashes asked from a peer and not received yet. A hash can be asked for
+    again once it was discarded, or once timeout seconds passed, so a peer that never
+    delivers doesn't keep the transaction from this node
+    """
+
+    def __init__(
+        self, timeout: float = REQUEST_TIMEOUT, max_size: int = MAX_RECENTLY_SEEN
+    ) -> None:
+        self.timeout = timeout
+        self.max_size = max_size
+        self.__deadlines = OrderedDict()  # type: OrderedDict[str, float]
+        self.__lock = threading.Lock()
+
+    def request(self, transaction_hash: str, now: Optional[float] = None) -> bool:
+        """
+        Returns False if the hash is being asked for already
+        """
+        now = time.monotonic() if now is None else now
+        with self.__lock:
+            # Deadlines are in the order hashes were asked for, so the expired ones come first
+            while self.__deadlines and (
+                next(iter(self.__deadlines.values())) <= now
+                or len(self.__deadlines) >= self.max_size
+            ):
+                self.__deadlines.popitem(last=False)
+            if transaction_hash in self.__deadlines:
+                return False
+            self.__deadlines[transaction_hash] = now + self.timeout
+            return True
+
+    def discard(self, transaction_hash: str) -> None:
+        with self.__lock:
+            self.__deadlines.pop(transaction_hash, None)
+
+    def __contains__(self, transaction_hash: object) -> bool:
+        with self.__lock:
+            return transaction_hash in self.__deadlines
+
+
+class Announcer:
+    """
+    Collects transaction hashes and hands them to announce in batches, once delay seconds
+    passed since the first one or max_batch of them were collected
+    """
+
+    def __init__(
+        self,
+        announce: Callable[[List[str]], None],
+        delay: float = ANNOUNCE_DELAY,
+        max_batch: int = MAX_INVENTORY,
+    ) -> None:
+        self.announce = announce
+        self.delay = delay
+        self.max_batch = max_batch
+        self.__batch = []  # type: List[str]
+        self.__timer = None  # type: Optional[threading.Timer]
+        self.__lock = threading.Lock()
+
+    def add(self, transaction_hash: str) -> None:
+        with self.__lock:
+            self.__batch.append(transaction_hash)
+            full = len(self.__batch) >= self.max_batch
+            if not full and self.__timer is None:
+                self.__timer = threading.Timer(self.delay, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Announce the collected hashes right away
+        """
+        with self.__lock:
+            batch, self.__batch = self.__batch, []
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+        while batch:
+            announced = batch[: self.max_batch]
+            del batch[: self.max_batch]
+            try:
+                self.announce(announced)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Failed to announce transactions: %s", e)
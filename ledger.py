@@ -0,0 +1,214 @@
+"""
+Per-address balances and per-sender nonces, maintained incrementally as blocks are connected
+and transactions enter or leave the pool of open transactions
+"""
+from __future__ import annotations
+
+import json
+import logging
+
+from typing import Dict, Optional, Set
+
+from pydantic import BaseModel
+
+from transaction import SignedRawTransaction
+
+logger = logging.getLogger(__name__)
+
+
+class Account(BaseModel):
+    """
+    sent : <float> Coin sent in transactions included in the chain
+    received : <float> Coin received in transactions included in the chain
+    pending_sent : <float> Coin sent in open transactions
+    pending_received : <float> Coin received in open transactions
+    """
+
+    sent: float = 0.0
+    received: float = 0.0
+    pending_sent: float = 0.0
+    pending_received: float = 0.0
+
+    @property
+    def balance(self) -> float:
+        """
+        Coin received in open transactions can't be spent until it is included in a block,
+        but coin sent in open transactions is already spoken for
+        """
+        return self.received - self.sent - self.pending_sent
+
+
+class Ledger:
+    """
+    accounts : <Dict[str, Account]> Totals for every address seen so far
+    nonces : <Dict[str, int]> Last nonce of every sender in the chain
+    height : <int> Index of the last block applied to the ledger
+    block_hash : <str> Hash of the last block applied to the ledger
+    missing : <Set[str]> Hashes of transactions in applied blocks that were not known yet
+    """
+
+    def __init__(self) -> None:
+        self.accounts = {}  # type: Dict[str, Account]
+        self.nonces = {}  # type: Dict[str, int]
+        self.height = -1
+        self.block_hash = ""
+        self.missing = set()  # type: Set[str]
+        self.__pending = {}  # type: Dict[str, SignedRawTransaction]
+        self.__pending_nonces = {}  # type: Dict[str, Dict[str, int]]
+
+    def account(self, address: str) -> Account:
+        if address not in self.accounts:
+            self.accounts[address] = Account()
+        return self.accounts[address]
+
+    def balance(self, address: str) -> float:
+        account = self.accounts.get(address)
+        return account.balance if account is not None else 0.0
+
+    def last_nonce(self, sender: str) -> Optional[int]:
+        """
+        Nonce of the sender's last transaction included in the chain
+        """
+        return self.nonces.get(sender)
+
+    def last_pending_nonce(
+        self, sender: str, exclude: Optional[str] = None, below: Optional[int] = None
+    ) -> Optional[int]:
+        """
+        Highest nonce of the sender's open transactions, ignoring the transaction with
+        the hash given in exclude, and if below is given, the nonces from below up
+        """
+        nonces = [
+            nonce
+            for (transaction_hash, nonce) in self.__pending_nonces.get(sender, {}).items()
+            if transaction_hash != exclude and (below is None or nonce < below)
+        ]
+        return max(nonces) if nonces else None
+
+    def add_pending(self, transaction_hash: str, tx: SignedRawTransaction) -> None:
+        if transaction_hash in self.__pending:
+            return
+        self.__pending[transaction_hash] = tx
+        self.__pending_nonces.setdefault(tx.details.sender, {})[
+            transaction_hash
+        ] = tx.details.nonce
+        self.account(tx.details.sender).pending_sent += tx.details.amount
+        self.account(tx.details.recipient).pending_received += tx.details.amount
+
+    def remove_pending(self, transaction_hash: str) -> None:
+        tx = self.__pending.pop(transaction_hash, None)
+        if tx is None:
+            return
+        sender_nonces = self.__pending_nonces[tx.details.sender]
+        del sender_nonces[transaction_hash]
+        if not sender_nonces:
+            del self.__pending_nonces[tx.details.sender]
+        self.account(tx.details.sender).pending_sent -= tx.details.amount
+        self.account(tx.details.recipient).pending_received -= tx.details.amount
+
+    def clear_pending(self) -> None:
+        for transaction_hash in list(self.__pending):
+            self.remove_pending(transaction_hash)
+
+    def apply_transaction(
+        self, transaction_hash: str, tx: SignedRawTransaction, sign: int = 1
+    ) -> None:
+        """
+        Apply (or with sign=-1, revert) a transaction that is included in the chain
+        """
+        self.remove_pending(transaction_hash)
+        self.account(tx.details.sender).sent += sign * tx.details.amount
+        self.account(tx.details.recipient).received += sign * tx.details.amount
+
+        sender, nonce = tx.details.sender, tx.details.nonce
+        if sign > 0:
+            self.nonces[sender] = max(nonce, self.nonces.get(sender, nonce))
+        elif self.nonces.get(sender) == nonce:
+            # Nonces of a sender are consecutive, so the previous one is the last one again
+            if nonce > 0:
+                self.nonces[sender] = nonce - 1
+            else:
+                del self.nonces[sender]
+
+    def apply_block(
+        self,
+        height: int,
+        block_hash: str,
+        transactions: Dict[str, Optional[SignedRawTransaction]],
+    ) -> None:
+        """
+        Apply every transaction of the block at the given height. Transactions that are
+        not known yet are recorded as missing, to be applied with resolve
+        """
+        for (transaction_hash, tx) in transactions.items():
+            if tx is None:
+                logger.debug("Transaction %s is not known yet", transaction_hash)
+                self.missing.add(transaction_hash)
+                continue
+            self.apply_transaction(transaction_hash, tx)
+        self.height = height
+        self.block_hash = block_hash
+
+    def revert_block(
+        self,
+        height: int,
+        block_hash: str,
+        transactions: Dict[str, Optional[SignedRawTransaction]],
+    ) -> bool:
+        """
+        Revert every transaction of the last applied block, making its parent (at the given
+        height) the last block again. Returns False, leaving the ledger untouched, if one
+        of the applied transactions is not known
+        """
+        if any(
+            tx is None and transaction_hash not in self.missing
+            for (transaction_hash, tx) in transactions.items()
+        ):
+            return False
+
+        for (transaction_hash, tx) in reversed(list(transactions.items())):
+            if transaction_hash in self.missing:
+                # Never applied, so there is nothing to revert
+                self.missing.discard(transaction_hash)
+            elif tx is not None:
+                self.apply_transaction(transaction_hash, tx, sign=-1)
+        self.height = height
+        self.block_hash = block_hash
+        return True
+
+    def resolve(self, transaction_hash: str, tx: SignedRawTransaction) -> None:
+        if transaction_hash in self.missing:
+            self.missing.discard(transaction_hash)
+            self.apply_transaction(transaction_hash, tx)
+
+    def ToJson(self) -> str:
+        return json.dumps(
+            {
+                "height": self.height,
+                "block_hash": self.block_hash,
+                "missing": sorted(self.missing),
+                "nonces": self.nonces,
+                "accounts": {
+                    address: [a.sent, a.received]
+                    for (address, a) in self.accounts.items()
+                },
+            }
+        )
+
+    @staticmethod
+    def FromJson(raw: str) -> Ledger:
+        """
+        Only the confirmed part of the ledger is saved. Pending amounts are added again
+        from the open transactions
+        """
+        data = json.loads(raw)
+        ledger = Ledger()
+        ledger.height = data["height"]
+        ledger.block_hash = data["block_hash"]
+        ledger.missing = set(data["missing"])
+        ledger.nonces = data["nonces"]
+        ledger.accounts = {
+            address: Account(sent=sent, received=received)
+            for (address, (sent, received)) in data["accounts"].items()
+        }
+        return ledger
@@ -0,0 +1,275 @@
+"""
+The pool of open transactions: indexed by hash, and by sender in nonce order
+"""
+import heapq
+import logging
+import os
+import time
+
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel
+
+from transaction import FinalTransaction
+
+logger = logging.getLogger(__name__)
+
+# Most open transactions kept, and most bytes they can add up to, serialized
+MAX_TRANSACTIONS = int(os.getenv("MEMPOOL_MAX_TRANSACTIONS", "200000"))
+MAX_BYTES = int(os.getenv("MEMPOOL_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Seconds an open transaction is kept before it expires
+EXPIRY = float(os.getenv("MEMPOOL_EXPIRY", str(14 * 24 * 60 * 60)))
+
+# Which transactions make room once the pool is full:
+#   - oldest: the ones added first
+#   - largest: the ones taking up the most bytes
+EVICTION_POLICIES = ("oldest", "largest")
+EVICTION = os.getenv("MEMPOOL_EVICTION", "oldest")
+
+
+class MempoolEntry(NamedTuple):
+    """
+    transaction : <FinalTransaction> The open transaction
+    size : <int> Bytes of the serialized transaction
+    added : <float> time.time() when it was added. Wall clock time, so it can be saved and
+                    keeps counting across restarts
+    seq : <int> Order it was added in
+    """
+
+    transaction: FinalTransaction
+    size: int
+    added: float
+    seq: int
+
+
+class MempoolStats(BaseModel):
+    """
+    transactions : <int> Open transactions in the pool
+    bytes : <int> Bytes they add up to, serialized
+    max_transactions : <int> Most open transactions kept
+    max_bytes : <int> Most bytes kept
+    expiry : <float> Seconds an open transaction is kept
+    eviction : <str> Policy choosing the transactions that make room
+    evicted : <int> Transactions evicted to make room so far
+    expired : <int> Transactions expired so far
+    """
+
+    transactions: int
+    bytes: int
+    max_transactions: int
+    max_bytes: int
+    expiry: float
+    eviction: str
+    evicted: int
+    expired: int
+
+
+class Mempool(Mapping):  # pylint: disable=too-many-instance-attributes
+    """
+    Open transactions by hash, in the order they were added. Adding, looking up and removing
+    a transaction take constant time, so connecting a block only costs as much as the
+    transactions in it
+
+    The pool is bounded by a number of transactions and of bytes, and transactions expire.
+    A sender's transactions are a chain of nonces, so whenever one leaves the pool without
+    being mined, the sender's later ones leave with it
+
+    max_transactions : <int> Most open transactions kept
+    max_bytes : <int> Most bytes kept
+    expiry : <float> Seconds an open transaction is kept
+    eviction : <str> One of EVICTION_POLICIES
+    evicted : <int> Transactions evicted to make room so far
+    expired : <int> Transactions expired so far
+    __entries (private): <Dict[str, MempoolEntry]> Transactions by hash
+    __senders (private): <Dict[str, Dict[int, str]]> Hashes of every sender's transactions,
+                                                       by nonce
+    __largest (private): <List[Tuple[int, int, str]]> Heap of (-size, seq, hash), with
+                                                        entries left behind by removals
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        transactions: Iterable[FinalTransaction] = (),
+        *,
+        max_transactions: int = MAX_TRANSACTIONS,
+        max_bytes: int = MAX_BYTES,
+        expiry: float = EXPIRY,
+        eviction: str = EVICTION,
+    ) -> None:
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"{eviction} is not a supported eviction policy")
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.eviction = eviction
+        self.evicted = 0
+        self.expired = 0
+        self.__entries = {}  # type: Dict[str, MempoolEntry]
+        self.__senders = {}  # type: Dict[str, Dict[int, str]]
+        self.__largest = []  # type: List[Tuple[int, int, str]]
+        self.__bytes = 0
+        self.__seq = 0
+        for tx in transactions:
+            self.add(tx)
+
+    def __getitem__(self, transaction_hash: str) -> FinalTransaction:
+        return self.__entries[transaction_hash].transaction
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__entries)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes of every transaction, serialized
+        """
+        return self.__bytes
+
+    def add(self, tx: FinalTransaction, added: Optional[float] = None) -> bool:
+        """
+        Returns False if the transaction, or another one of its sender with the same nonce,
+        is in the pool already. The pool can go over its limits until trim is called.
+        added is when the transaction was first added, for transactions loaded again.
+        Transactions must be added in that order
+        """
+        details = tx.signed_transaction.details
+        nonces = self.__senders.setdefault(details.sender, {})
+        if tx.transaction_hash in self.__entries or details.nonce in nonces:
+            return False
+        self.__seq += 1
+        entry = MempoolEntry(
+            transaction=tx,
+            size=len(tx.signed_transaction.SerializeToString()),
+            added=time.time() if added is None else added,
+            seq=self.__seq,
+        )
+        self.__entries[tx.transaction_hash] = entry
+        nonces[details.nonce] = tx.transaction_hash
+        self.__bytes += entry.size
+        heapq.heappush(self.__largest, (-entry.size, entry.seq, tx.transaction_hash))
+        return True
+
+    def remove(self, transaction_hash: str) -> Optional[FinalTransaction]:
+        """
+        Returns the removed transaction, or None if it was not in the pool
+        """
+        entry = self.__entries.pop(transaction_hash, None)
+        if entry is None:
+            return None
+        details = entry.transaction.signed_transaction.details
+        nonces = self.__senders[details.sender]
+        del nonces[details.nonce]
+        if not nonces:
+            del self.__senders[details.sender]
+        self.__bytes -= entry.size
+        if len(self.__largest) > 2 * len(self.__entries) + 64:
+            # Removed transactions are left on the heap until it is rebuilt
+            self.__largest = [(-e.size, e.seq, h) for (h, e) in self.__entries.items()]
+            heapq.heapify(self.__largest)
+        return entry.transaction
+
+    def __remove_chain(self, transaction_hash: str) -> List[FinalTransaction]:
+        """
+        Remove a transaction and the later ones of its sender, which can't be mined without it
+        """
+        details = self[transaction_hash].signed_transaction.details
+        nonces = self.__senders[details.sender]
+        later = [nonces[n] for n in sorted(nonces) if n > details.nonce]
+        return [
+            tx for tx in map(self.remove, [transaction_hash] + later) if tx is not None
+        ]
+
+    def expire(self, now: Optional[float] = None) -> List[FinalTransaction]:
+        """
+        Remove the transactions older than expiry. Returns the removed transactions
+        """
+        now = time.time() if now is None else now
+        removed = []  # type: List[FinalTransaction]
+        while self.__entries:
+            oldest = next(iter(self.__entries.values()))
+            if oldest.added + self.expiry > now:
+                break
+            removed.extend(self.__remove_chain(oldest.transaction.transaction_hash))
+        if removed:
+            logger.info("Expired %s open transactions", len(removed))
+            self.expired += len(removed)
+        return removed
+
+    def trim(self) -> List[FinalTransaction]:
+        """
+        Evict transactions, by the eviction policy, until the pool is within its limits.
+        Returns the evicted transactions
+        """
+        removed = []  # type: List[FinalTransaction]
+        while self.__entries and (
+            len(self.__entries) > self.max_transactions or self.__bytes > self.max_bytes
+        ):
+            removed.extend(self.__remove_chain(self.__victim()))
+        if removed:
+            logger.info("Evicted %s open transactions", len(removed))
+            self.evicted += len(removed)
+        return removed
+
+    def __victim(self) -> str:
+        if self.eviction == "oldest":
+            return next(iter(self.__entries))
+        while True:
+            (_, seq, transaction_hash) = heapq.heappop(self.__largest)
+            entry = self.__entries.get(transaction_hash)
+            if entry is not None and entry.seq == seq:
+                return transaction_hash
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.__senders.clear()
+        self.__largest.clear()
+        self.__bytes = 0
+
+    def transactions(self) -> List[FinalTransaction]:
+        """
+        Every transaction, in the order they were added. A sender's transactions can only
+        be added in nonce order, so they keep it
+        """
+        return [e.transaction for e in self.__entries.values()]
+
+    def senders(self) -> List[str]:
+        return list(self.__senders)
+
+    def added_times(self) -> Dict[str, float]:
+        """
+        When every transaction was added, by hash
+        """
+        return {h: e.added for (h, e) in self.__entries.items()}
+
+    def transaction_size(self, transaction_hash: str) -> int:
+        """
+        Bytes of the serialized transaction
+        """
+        return self.__entries[transaction_hash].size
+
+    def pending_count(self, sender: str) -> int:
+        return len(self.__senders.get(sender, {}))
+
+    def sender_transactions(self, sender: str) -> List[FinalTransaction]:
+        """
+        The sender's transactions, by nonce
+        """
+        nonces = self.__senders.get(sender, {})
+        return [self[nonces[n]] for n in sorted(nonces)]
+
+    def stats(self) -> MempoolStats:
+        return MempoolStats(
+            transactions=len(self.__entries),
+            bytes=self.__bytes,
+            max_transactions=self.max_transactions,
+            max_bytes=self.max_bytes,
+            expiry=self.expiry,
+            eviction=self.eviction,
+            evicted=self.evicted,
+            expired=self.expired,
+        )
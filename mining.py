@@ -0,0 +1,467 @@
+"""
+Proof of work over a pool of processes, each searching its own ranges of the nonce space
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+from block import Block, Header
+from custom_exceptions import MiningQueueFullError
+from verification import Verification
+
+logger = logging.getLogger(__name__)
+
+# Number of nonces a worker claims at a time. Workers check for cancellation between chunks
+CHUNK_SIZE = 5000
+
+# Seconds a worker has to finish its chunk once a nonce was found, before it is killed
+WORKER_JOIN_TIMEOUT = 5.0
+
+# Mining jobs kept for status lookups, including finished ones
+MAX_MINING_JOBS = 100
+
+# Most mining jobs queued or running at once
+MAX_PENDING_MINING_JOBS = int(os.getenv("MAX_PENDING_MINING_JOBS", "10"))
+
+# Seconds the mining service waits after an error, doubled after every error in a row
+ERROR_BACKOFF = 1.0
+MAX_ERROR_BACKOFF = 60.0
+
+
+class MiningResult(BaseModel):
+    """
+    header : <Header> The header with a valid nonce
+    hashes : <int> Number of nonces tried by all the workers
+    seconds : <float> Time it took to find the nonce
+    workers : <int> Number of processes used
+    """
+
+    header: Header
+    hashes: int
+    seconds: float
+    workers: int
+
+    @property
+    def hashes_per_second(self) -> float:
+        return self.hashes / self.seconds if self.seconds > 0 else 0.0
+
+
+def search(  # pylint: disable=too-many-arguments
+    header: Header,
+    next_nonce: Any,
+    chunk_size: int,
+    found: Any,
+    results: Any,
+    hashes: Any,
+    progress: Optional[Callable[[int], None]] = None,
+    cancel: Optional[Any] = None,
+) -> Optional[int]:
+    """
+    Claim chunks of nonces from the shared counter until one of them is valid, another
+    worker found one or cancel is set. progress is called with the number of nonces tried
+    after every chunk. Returns the nonce this worker found, if any
+    """
+    while not found.is_set() and not (cancel is not None and cancel.is_set()):
+        with next_nonce.get_lock():
+            start = next_nonce.value
+            next_nonce.value += chunk_size
+
+        nonce = Verification.find_nonce(header, start, start + chunk_size)
+        with hashes.get_lock():
+            hashes.value += chunk_size if nonce is None else nonce - start + 1
+        if progress is not None:
+            progress(hashes.value)
+        if nonce is not None:
+            found.set()
+            results.put(nonce)
+            return nonce
+    return None
+
+
+class ParallelMiner:
+    """
+    workers : <int> Number of processes to mine with. With 1, mining runs in this process
+    chunk_size : <int> Number of nonces a worker claims at a time
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> None:
+        self.workers = max(1, workers if workers is not None else os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+
+    def mine(
+        self,
+        header: Header,
+        progress: Optional[Callable[[int], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Optional[MiningResult]:
+        """
+        Find a valid nonce for the header, starting from its current nonce. The first
+        worker to find one stops all the others. progress is called with the number of
+        nonces tried so far, every now and then.
+        Returns None if cancel was set before a nonce was found
+        """
+        logger.info(
+            "Mining block for %s version and %s difficulty on %s workers",
+            header.version,
+            header.difficulty,
+            self.workers,
+        )
+        started = time.monotonic()
+        next_nonce = multiprocessing.Value("q", header.nonce)
+        hashes = multiprocessing.Value("q", 0)
+        found = multiprocessing.Event()
+        results = multiprocessing.Queue()  # type: Any
+
+        if self.workers == 1:
+            nonce = search(
+                header,
+                next_nonce,
+                self.chunk_size,
+                found,
+                results,
+                hashes,
+                progress,
+                cancel,
+            )
+        else:
+            processes = [
+                multiprocessing.Process(
+                    target=search,
+                    args=(header, next_nonce, self.chunk_size, found, results, hashes),
+                    daemon=True,
+                )
+                for _ in range(self.workers)
+            ]
+            for p in processes:
+                p.start()
+            try:
+                nonce = self.__wait_for_nonce(
+                    results, processes, hashes, progress, cancel
+                )
+            finally:
+                # Killing a worker that holds the lock of a shared value would leave it
+                # locked, so workers are given the time to stop on their own first
+                found.set()
+                deadline = time.monotonic() + WORKER_JOIN_TIMEOUT
+                for p in processes:
+                    p.join(max(deadline - time.monotonic(), 0))
+                for p in processes:
+                    if p.is_alive():
+                        logger.warning("Mining worker %s did not stop, killing it", p.pid)
+                        p.terminate()
+                        p.join()
+
+        if nonce is None:
+            logger.info("Mining cancelled after %s hashes", hashes.value)
+            return None
+        mined = header.copy()
+        mined.nonce = nonce
+        result = MiningResult(
+            header=mined,
+            hashes=hashes.value,
+            seconds=time.monotonic() - started,
+            workers=self.workers,
+        )
+        logger.info(
+            "Found nonce %s after %s hashes (%.0f hashes/s)",
+            nonce,
+            result.hashes,
+            result.hashes_per_second,
+        )
+        return result
+
+    @staticmethod
+    def __wait_for_nonce(
+        results: Any,
+        processes: Any,
+        hashes: Any,
+        progress: Optional[Callable[[int], None]],
+        cancel: Optional[threading.Event],
+    ) -> Optional[int]:
+        while True:
+            # Checked before waiting, so a nonce sent by a worker right before it exited
+            # is still picked up
+            alive = any(p.is_alive() for p in processes)
+            try:
+                return results.get(timeout=0.1)
+            except queue.Empty:
+                if not alive:
+                    raise RuntimeError("All mining workers exited without a nonce")
+                if cancel is not None and cancel.is_set():
+                    return None
+                if progress is not None:
+                    progress(hashes.value)
+
+
+class MiningJob(BaseModel):
+    """
+    job_id : <str> Identifies the job in status lookups
+    address : <str> Address the mining reward goes to
+    workers : <optional int> Number of processes to mine with, or the node's default
+    status : <str> queued, running, done or failed
+    hashes : <int> Number of nonces tried so far
+    hashes_per_second : <optional float> Mining speed, once the job is done
+    block : <optional Block> The mined block, once the job is done
+    error : <optional str> Why the job failed
+    created : <datetime> When the job was queued
+    started : <optional datetime> When mining started
+    finished : <optional datetime> When the job was done or failed
+    """
+
+    job_id: str
+    address: str
+    workers: Optional[int] = None
+    status: str = "queued"
+    hashes: int = 0
+    hashes_per_second: Optional[float] = None
+    block: Optional[Block] = None
+    error: Optional[str] = None
+    created: datetime
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+
+class MiningQueue:
+    """
+    Runs mining jobs one at a time on a background thread, so callers only wait for a job to
+    be queued. The last max_jobs jobs are kept for status lookups, and at most max_pending
+    jobs are queued or running at once
+    """
+
+    def __init__(
+        self,
+        mine: Callable[[MiningJob], Optional[Block]],
+        max_jobs: int = MAX_MINING_JOBS,
+        max_pending: int = MAX_PENDING_MINING_JOBS,
+    ) -> None:
+        self.mine = mine
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self.__jobs = OrderedDict()  # type: OrderedDict[str, MiningJob]
+        self.__futures = {}  # type: Dict[str, Future]
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mining")
+
+    def submit(self, address: str, workers: Optional[int] = None) -> MiningJob:
+        """
+        Queue a mining job. Raises MiningQueueFullError if max_pending jobs are queued or
+        running already
+        """
+        job = MiningJob(
+            job_id=uuid4().hex,
+            address=address,
+            workers=workers,
+            created=datetime.utcnow(),
+        )
+        with self.__lock:
+            if self.__pending() >= self.max_pending:
+                raise MiningQueueFullError(self.max_pending)
+            self.__jobs[job.job_id] = job
+            self.__futures[job.job_id] = self.__executor.submit(self.__run, job)
+            self.__forget_finished()
+        return job
+
+    def __forget_finished(self) -> None:
+        for job_id in list(self.__jobs):
+            if len(self.__jobs) <= self.max_jobs:
+                return
+            if self.__jobs[job_id].is_finished:
+                del self.__jobs[job_id]
+                del self.__futures[job_id]
+
+    def __run(self, job: MiningJob) -> None:
+        job.status = "running"
+        job.started = datetime.utcnow()
+        try:
+            job.block = self.mine(job)
+            if job.block is None:
+                job.error = "No block was mined"
+            job.status = "done" if job.block is not None else "failed"
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = datetime.utcnow()
+            logger.info("Mining job %s %s", job.job_id, job.status)
+
+    def job(self, job_id: str) -> Optional[MiningJob]:
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[MiningJob]:
+        """
+        Wait for a job to finish. Returns None if the job is not known
+        """
+        with self.__lock:
+            future = self.__futures.get(job_id)
+            job = self.__jobs.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return job
+
+    def pending(self) -> int:
+        """
+        Number of jobs queued or running
+        """
+        with self.__lock:
+            return self.__pending()
+
+    def __pending(self) -> int:
+        return sum(1 for job in self.__jobs.values() if not job.is_finished)
+
+
+class MiningStats(BaseModel):
+    """
+    running : <bool> Whether the service is mining
+    address : <optional str> Address the mining rewards go to
+    workers : <optional int> Number of processes mining, or the node's default
+    started : <optional datetime> When the service was last started
+    blocks : <int> Blocks mined since then
+    hashes : <int> Nonces tried since then
+    hashes_per_second : <float> Average mining speed since then
+    last_block : <optional Block> The last block mined
+    errors : <int> Times mining failed since then
+    last_error : <optional str> Why mining last failed
+    """
+
+    running: bool = False
+    address: Optional[str] = None
+    workers: Optional[int] = None
+    started: Optional[datetime] = None
+    blocks: int = 0
+    hashes: int = 0
+    hashes_per_second: float = 0.0
+    last_block: Optional[Block] = None
+    errors: int = 0
+    last_error: Optional[str] = None
+
+
+class MiningService:
+    """
+    Mines blocks one after another on a background thread, until stopped. mine is called
+    with the reward address, the number of workers, a progress callback and the stop event,
+    and returns the mined block, or None if it was stopped. If it fails, the error is
+    recorded and mining goes on after a backoff
+    """
+
+    def __init__(
+        self,
+        mine: Callable[
+            [str, Optional[int], Callable[[int], None], threading.Event], Optional[Block]
+        ],
+        error_backoff: float = ERROR_BACKOFF,
+    ) -> None:
+        self.mine = mine
+        self.error_backoff = error_backoff
+        self.__stats = MiningStats()
+        self.__stop = threading.Event()
+        self.__thread = None  # type: Optional[threading.Thread]
+        self.__lock = threading.Lock()
+        self.__started_at = 0.0
+        self.__stopped_at = 0.0
+        # Nonces tried for the current template, as last reported
+        self.__template_hashes = 0
+
+    @property
+    def running(self) -> bool:
+        with self.__lock:
+            return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self, address: str, workers: Optional[int] = None) -> bool:
+        """
+        Returns False if the service is running already
+        """
+        with self.__lock:
+            if self.__thread is not None and self.__thread.is_alive():
+                return False
+            self.__stop = threading.Event()
+            self.__stats = MiningStats(
+                running=True, address=address, workers=workers, started=datetime.utcnow()
+            )
+            self.__started_at = time.monotonic()
+            self.__template_hashes = 0
+            self.__thread = threading.Thread(
+                target=self.__run,
+                args=(address, workers, self.__stop),
+                name="mining-service",
+                daemon=True,
+            )
+            self.__thread.start()
+        logger.info("Mining service started for %s", address)
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop mining, and wait up to timeout seconds for the block being mined to be given
+        up on. Returns False if the service was not running
+        """
+        with self.__lock:
+            thread = self.__thread
+            self.__stop.set()
+        if thread is None or not thread.is_alive():
+            return False
+        thread.join(timeout)
+        logger.info("Mining service stopped")
+        return True
+
+    def stats(self) -> MiningStats:
+        with self.__lock:
+            stats = self.__stats.copy()
+            stats.running = self.__thread is not None and self.__thread.is_alive()
+            stopped = time.monotonic() if stats.running else self.__stopped_at
+            if stopped > self.__started_at:
+                stats.hashes_per_second = stats.hashes / (stopped - self.__started_at)
+            return stats
+
+    def __progress(self, hashes: int) -> None:
+        """
+        Hashes are reported per template, and start over when mining restarts
+        """
+        with self.__lock:
+            if hashes >= self.__template_hashes:
+                self.__stats.hashes += hashes - self.__template_hashes
+            else:
+                self.__stats.hashes += hashes
+            self.__template_hashes = hashes
+
+    def __run(self, address: str, workers: Optional[int], stop: threading.Event) -> None:
+        backoff = self.error_backoff
+        try:
+            while not stop.is_set():
+                try:
+                    block = self.mine(address, workers, self.__progress, stop)
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.exception(e)
+                    with self.__lock:
+                        self.__template_hashes = 0
+                        self.__stats.errors += 1
+                        self.__stats.last_error = str(e) or type(e).__name__
+                    stop.wait(backoff)
+                    backoff = min(backoff * 2, MAX_ERROR_BACKOFF)
+                    continue
+                backoff = self.error_backoff
+                with self.__lock:
+                    self.__template_hashes = 0
+                    if block is not None:
+                        self.__stats.blocks += 1
+                        self.__stats.last_block = block
+        finally:
+            with self.__lock:
+                self.__stats.running = False
+                self.__stopped_at = time.monotonic()
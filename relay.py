@@ -0,0 +1,202 @@
+"""
+Compact block relay: a new block is announced with short IDs of its transactions instead of
+the transactions themselves. Receivers rebuild it from their open transactions, and ask the
+sender for the ones they don't have in a single round trip
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from pydantic import BaseModel
+
+from generated import sync_pb2
+
+from block import Block
+from sync import TransactionEnvelope
+from transaction import FinalTransaction, get_merkle_root
+from verification import Verification
+
+logger = logging.getLogger(__name__)
+
+# Bytes of a short transaction ID. Collisions within a block are caught by the merkle root
+SHORT_ID_BYTES = 6
+
+
+def short_id(block_hash: str, transaction_hash: str) -> bytes:
+    """
+    Short IDs are salted with the block hash, so colliding transactions can't be crafted
+    ahead of the block
+    """
+    digest = hashlib.sha256(
+        bytes.fromhex(block_hash) + bytes.fromhex(transaction_hash)
+    ).digest()
+    return digest[:SHORT_ID_BYTES]
+
+
+class PrefilledTransaction(BaseModel):
+    """
+    index : <int> Position of the transaction in the block
+    envelope : <TransactionEnvelope> The transaction and its type
+    """
+
+    index: int
+    envelope: TransactionEnvelope
+
+    @property
+    def transaction(self) -> FinalTransaction:
+        """
+        The transaction, with its hash computed here rather than taken from the sender
+        """
+        signed = self.envelope.transaction.signed_transaction
+        transaction_hash = Verification.hash_transaction(signed)
+        return FinalTransaction(
+            transaction_hash=transaction_hash,
+            transaction_id=transaction_hash,
+            signed_transaction=signed,
+        )
+
+    def ToProtobuf(self) -> Any:
+        return sync_pb2.PrefilledTransaction(
+            index=self.index, transaction=self.envelope.ToProtobuf()
+        )
+
+    @staticmethod
+    def FromProtobuf(prefilled: Any) -> PrefilledTransaction:
+        return PrefilledTransaction(
+            index=prefilled.index,
+            envelope=TransactionEnvelope.FromProtobuf(prefilled.transaction),
+        )
+
+
+class CompactBlock(BaseModel):
+    """
+    block : <Block> The block, without the hashes of its transactions
+    short_ids : <List[bytes]> Short ID of every transaction of the block, in order
+    prefilled : <List[PrefilledTransaction]> Transactions receivers can't have yet, such
+                                             as the mining reward
+    """
+
+    block: Block
+    short_ids: List[bytes]
+    prefilled: List[PrefilledTransaction] = []
+
+    @staticmethod
+    def FromBlock(
+        block: Block, prefilled: Optional[List[PrefilledTransaction]] = None
+    ) -> CompactBlock:
+        return CompactBlock(
+            block=block.copy(update={"transactions": []}),
+            short_ids=[short_id(block.block_hash, h) for h in block.transactions],
+            prefilled=prefilled or [],
+        )
+
+    def SerializeToString(self) -> bytes:
+        return sync_pb2.CompactBlock(
+            block=self.block.ToProtobuf(),
+            short_ids=self.short_ids,
+            prefilled=[p.ToProtobuf() for p in self.prefilled],
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(compact_bytes: bytes) -> CompactBlock:
+        compact = sync_pb2.CompactBlock()
+        compact.ParseFromString(compact_bytes)
+        try:
+            bytes.fromhex(compact.block.block_hash)
+        except ValueError as e:
+            raise ValueError("Short IDs can't be salted with the block hash") from e
+
+        return CompactBlock(
+            block=Block.FromProtobuf(compact.block),
+            short_ids=list(compact.short_ids),
+            prefilled=[PrefilledTransaction.FromProtobuf(p) for p in compact.prefilled],
+        )
+
+    def match(
+        self, transactions: Iterable[FinalTransaction]
+    ) -> List[Optional[FinalTransaction]]:
+        """
+        Fill the positions of the block with the prefilled transactions and the given
+        transactions whose short ID matches. Positions left empty are None
+        """
+        known = {
+            short_id(self.block.block_hash, tx.transaction_hash): tx
+            for tx in transactions
+        }  # type: Dict[bytes, FinalTransaction]
+        matched = [known.get(s) for s in self.short_ids]
+        for p in self.prefilled:
+            if p.index < len(matched):
+                matched[p.index] = p.transaction
+        return matched
+
+    def rebuild(self, transactions: List[FinalTransaction]) -> Optional[Block]:
+        """
+        Return the full block, or None if the transactions are not the block's. The mining
+        reward is the last transaction, and isn't part of the merkle root
+        """
+        if len(transactions) != len(self.short_ids):
+            return None
+        merkle_root = get_merkle_root(
+            [tx.signed_transaction for tx in transactions[:-1]]
+        )
+        if merkle_root != self.block.header.transaction_merkle_root:
+            logger.warning("Transactions don't match block %s", self.block.block_hash)
+            return None
+        return self.block.copy(
+            update={"transactions": [tx.transaction_hash for tx in transactions]}
+        )
+
+
+class BlockTransactionsRequest(BaseModel):
+    """
+    block_hash : <str> Block the transactions belong to
+    indexes : <List[int]> Positions of the missing transactions in the block
+    """
+
+    block_hash: str
+    indexes: List[int]
+
+    def SerializeToString(self) -> bytes:
+        return sync_pb2.BlockTransactionsRequest(
+            block_hash=self.block_hash, indexes=self.indexes
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(request_bytes: bytes) -> BlockTransactionsRequest:
+        request = sync_pb2.BlockTransactionsRequest()
+        request.ParseFromString(request_bytes)
+
+        return BlockTransactionsRequest(
+            block_hash=request.block_hash, indexes=list(request.indexes)
+        )
+
+
+class BlockTransactions(BaseModel):
+    """
+    block_hash : <str> Block the transactions belong to
+    transactions : <List[PrefilledTransaction]> The requested transactions
+    """
+
+    block_hash: str
+    transactions: List[PrefilledTransaction]
+
+    def SerializeToString(self) -> bytes:
+        return sync_pb2.BlockTransactions(
+            block_hash=self.block_hash,
+            transactions=[t.ToProtobuf() for t in self.transactions],
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(transactions_bytes: bytes) -> BlockTransactions:
+        transactions = sync_pb2.BlockTransactions()
+        transactions.ParseFromString(transactions_bytes)
+
+        return BlockTransactions(
+            block_hash=transactions.block_hash,
+            transactions=[
+                PrefilledTransaction.FromProtobuf(t) for t in transactions.transactions
+            ],
+        )
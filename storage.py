@@ -1,17 +1,36 @@
 """
 Data Storage class
 """
+from __future__ import annotations
+
 import os
 import logging
 import json
 import shutil
+import sqlite3
+import struct
+import threading
+import zlib
 
+from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 
 logger = logging.getLogger(__name__)
 
+# Segments are rolled over once they grow past this many bytes
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+# Each record in a segment is prefixed with its payload length and crc32
+RECORD_HEADER = struct.Struct(">II")
+
+# Each index entry is height, segment, offset, payload length and the record key
+INDEX_ENTRY = struct.Struct(">QIQI64s")
+
+# Transactions are either waiting to be mined, included in a block or mining rewards
+TRANSACTION_STATUSES = ["open", "confirmed", "mining"]
+
 
 class Storage:
     def __init__(self, base_path: Path) -> None:
@@ -21,6 +40,9 @@ class Storage:
         Path(new_path.parent).mkdir(parents=True, exist_ok=True)
         shutil.move(str(old_path.resolve()), str(new_path.resolve()))
 
+    def open_log(self, suffix: Path) -> SegmentedLog:
+        return SegmentedLog.Open(self.base_path / suffix)
+
     def list_files(self, suffix: Path) -> List[str]:
         full_path = self.base_path / suffix
         p = full_path.glob("**/*")
@@ -73,8 +95,8 @@ class Storage:
         return False
 
     def save(self, suffix: Path, content: Union[bytes, str, int, dict]) -> bool:
-        self.base_path.mkdir(parents=True, exist_ok=True)
         full_path = self.base_path / suffix
+        full_path.parent.mkdir(parents=True, exist_ok=True)
 
         result = False
         if isinstance(content, bytes):
@@ -128,3 +150,615 @@ class Storage:
             logger.error("Failed to read string from %s", full_path)
             logger.exception(e)
         return None
+
+
+class SegmentedLog:
+    """
+    Append-only log of length-prefixed binary records, split over segment files, with a
+    small index so any record can be read with a single seek.
+
+      <path>/index        : fixed width entries (height, segment, offset, length, key)
+      <path>/<n>.segment  : records (4 byte length, 4 byte crc32, payload)
+
+    Records are addressed by height (their position in the log) or by key. Writing at an
+    existing height with a different key truncates the log at that height first, which is
+    how a replaced chain overwrites the old one.
+    """
+
+    __logs = {}  # type: Dict[str, SegmentedLog]
+    __logs_lock = threading.Lock()
+
+    def __init__(self, path: Path, segment_size: int = SEGMENT_SIZE) -> None:
+        self.path = path
+        self.segment_size = segment_size
+        self.lock = threading.RLock()
+        self.__entries = []  # type: List[Tuple[int, int, int, str]]
+        self.__keys = {}  # type: Dict[str, int]
+        self.__stat = None  # type: Optional[Tuple[int, int]]
+
+    @classmethod
+    def Open(cls, path: Path) -> SegmentedLog:
+        """
+        Return the shared log for a path, so the index is only read from disk once
+        """
+        key = str(path.resolve())
+        with cls.__logs_lock:
+            if key not in cls.__logs:
+                cls.__logs[key] = cls(path)
+            return cls.__logs[key]
+
+    @property
+    def index_path(self) -> Path:
+        return self.path / "index"
+
+    def segment_path(self, segment: int) -> Path:
+        return self.path / f"{segment:08d}.segment"
+
+    def __index_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_size
+
+    def __refresh(self) -> None:
+        """
+        Reload the index if it was changed or removed behind our back
+        """
+        stat = self.__index_stat()
+        if stat is not None and stat == self.__stat:
+            return
+
+        self.__entries = []
+        self.__keys = {}
+        if stat is not None:
+            with open(self.index_path, mode="rb") as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % INDEX_ENTRY.size
+            for (_, segment, offset, length, key) in INDEX_ENTRY.iter_unpack(
+                raw[:usable]
+            ):
+                decoded = key.rstrip(b"\0").decode("ascii")
+                self.__keys[decoded] = len(self.__entries)
+                self.__entries.append((segment, offset, length, decoded))
+            self.__drop_torn_entries()
+        self.__stat = self.__index_stat()
+
+    def __drop_torn_entries(self) -> None:
+        """
+        A record may be indexed but not fully on disk if the node died mid-write
+        """
+        dropped = False
+        while self.__entries:
+            segment, offset, length, _ = self.__entries[-1]
+            path = self.segment_path(segment)
+            if (
+                path.exists()
+                and os.path.getsize(path) >= offset + RECORD_HEADER.size + length
+            ):
+                break
+            logger.warning("Dropping torn record at height %s", len(self.__entries) - 1)
+            self.__entries.pop()
+            dropped = True
+        if dropped:
+            self.__keys = {e[3]: h for (h, e) in enumerate(self.__entries)}
+            self.__write_index()
+
+    def __write_index(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.index_path, mode="wb") as f:
+            for (height, (segment, offset, length, key)) in enumerate(self.__entries):
+                f.write(
+                    INDEX_ENTRY.pack(
+                        height, segment, offset, length, key.encode("ascii")
+                    )
+                )
+        self.__stat = self.__index_stat()
+
+    def __len__(self) -> int:
+        with self.lock:
+            self.__refresh()
+            return len(self.__entries)
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            self.__refresh()
+            return [e[3] for e in self.__entries]
+
+    def append(self, key: str, payload: bytes) -> int:
+        """
+        Append a record to the end of the log and return its height
+        """
+        with self.lock:
+            self.__refresh()
+            self.path.mkdir(parents=True, exist_ok=True)
+
+            segment, offset = 0, 0
+            if self.__entries:
+                last_segment, last_offset, last_length, _ = self.__entries[-1]
+                segment = last_segment
+                offset = last_offset + RECORD_HEADER.size + last_length
+                if offset + RECORD_HEADER.size + len(payload) > self.segment_size:
+                    segment, offset = segment + 1, 0
+
+            path = self.segment_path(segment)
+            with open(path, mode="r+b" if path.exists() else "wb") as f:
+                f.seek(offset)
+                f.truncate()
+                f.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                f.write(payload)
+
+            height = len(self.__entries)
+            with open(self.index_path, mode="ab") as f:
+                f.write(
+                    INDEX_ENTRY.pack(
+                        height, segment, offset, len(payload), key.encode("ascii")
+                    )
+                )
+            self.__entries.append((segment, offset, len(payload), key))
+            self.__keys[key] = height
+            self.__stat = self.__index_stat()
+            return height
+
+    def put(self, height: int, key: str, payload: bytes) -> bool:
+        """
+        Idempotently write a record at the given height. Returns True if anything was written
+        """
+        with self.lock:
+            self.__refresh()
+            if height > len(self.__entries):
+                raise ValueError(
+                    f"Cannot write height {height} to a log of {len(self.__entries)} records"
+                )
+            if height < len(self.__entries):
+                if self.__entries[height][3] == key:
+                    return False
+                self.truncate(height)
+            self.append(key, payload)
+            return True
+
+    def truncate(self, height: int) -> None:
+        """
+        Drop every record at or above the given height
+        """
+        with self.lock:
+            self.__refresh()
+            if height >= len(self.__entries):
+                return
+            segment, offset, _, _ = self.__entries[height]
+            path = self.segment_path(segment)
+            if path.exists():
+                with open(path, mode="r+b") as f:
+                    f.truncate(offset)
+            for later in {e[0] for e in self.__entries[height:] if e[0] > segment}:
+                self.segment_path(later).unlink()
+
+            self.__entries = self.__entries[:height]
+            self.__keys = {e[3]: h for (h, e) in enumerate(self.__entries)}
+            self.__write_index()
+
+    def __read_entry(self, f, entry: Tuple[int, int, int, str]) -> bytes:
+        _, offset, length, key = entry
+        f.seek(offset)
+        stored_length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        payload = f.read(stored_length)
+        if stored_length != length or zlib.crc32(payload) != crc:
+            raise ValueError(f"Record {key} in {self.path} is corrupt")
+        return payload
+
+    def read(self, height: int) -> Optional[bytes]:
+        with self.lock:
+            self.__refresh()
+            if not 0 <= height < len(self.__entries):
+                return None
+            entry = self.__entries[height]
+            with open(self.segment_path(entry[0]), mode="rb") as f:
+                return self.__read_entry(f, entry)
+
+    def find(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            self.__refresh()
+            height = self.__keys.get(key)
+            return self.read(height) if height is not None else None
+
+    def read_range(self, start: int = 0, count: Optional[int] = None) -> List[bytes]:
+        """
+        Read records [start, start + count) in order, opening each segment only once
+        """
+        with self.lock:
+            self.__refresh()
+            first = max(start, 0)
+            end = len(self.__entries) if count is None else first + count
+            records = []
+            f = None
+            current = None
+            try:
+                for entry in self.__entries[first:end]:
+                    if entry[0] != current:
+                        if f is not None:
+                            f.close()
+                        current = entry[0]
+                        f = open(self.segment_path(current), mode="rb")
+                    records.append(self.__read_entry(f, entry))
+            finally:
+                if f is not None:
+                    f.close()
+            return records
+
+
+class StoredTransaction(NamedTuple):
+    transaction_hash: str
+    status: str
+    content: bytes
+
+
+class StorageBackend(ABC):
+    """
+    Everything a node persists: its blocks, its transactions (by status) and small
+    metadata values such as wallet keys or journals.
+
+    Lookups by sender or address are allowed to return a superset of the matching
+    transactions, so callers should always filter the decoded results again.
+    """
+
+    @abstractmethod
+    def put_block(self, height: int, block_hash: str, content: bytes) -> bool:
+        """
+        Idempotently write a block at a height, replacing anything at or above it if the
+        hash is different. Returns True if anything was written
+        """
+
+    @abstractmethod
+    def load_blocks(self, start: int = 0, count: Optional[int] = None) -> List[bytes]:
+        pass
+
+    @abstractmethod
+    def find_block(self, block_hash: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def truncate_blocks(self, height: int) -> None:
+        pass
+
+    @abstractmethod
+    def save_transaction(  # pylint: disable=too-many-arguments
+        self,
+        transaction_hash: str,
+        status: str,
+        content: bytes,
+        sender: str = "",
+        recipient: str = "",
+        amount: float = 0.0,
+        nonce: int = 0,
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    def load_transactions(
+        self,
+        status: Optional[str] = None,
+        sender: Optional[str] = None,
+        address: Optional[str] = None,
+    ) -> List[StoredTransaction]:
+        pass
+
+    @abstractmethod
+    def find_transaction(self, transaction_hash: str) -> Optional[StoredTransaction]:
+        pass
+
+    @abstractmethod
+    def move_transaction(
+        self, transaction_hash: str, from_status: str, to_status: str
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def delete_transaction(self, transaction_hash: str, status: str) -> None:
+        pass
+
+    @abstractmethod
+    def save_meta(self, key: str, value: str) -> bool:
+        pass
+
+    @abstractmethod
+    def read_meta(self, key: str) -> Optional[str]:
+        pass
+
+
+class FileSystemStorage(StorageBackend):
+    """
+    One hex encoded file per transaction under <status>_transactions/, blocks in a
+    SegmentedLog under block_log/ and one file per metadata key
+    """
+
+    BLOCK_LOG = Path("block_log")
+
+    def __init__(self, base_path: Path) -> None:
+        self.storage = Storage(base_path)
+        self.blocks = self.storage.open_log(FileSystemStorage.BLOCK_LOG)
+
+    def put_block(self, height: int, block_hash: str, content: bytes) -> bool:
+        return self.blocks.put(height, block_hash, content)
+
+    def load_blocks(self, start: int = 0, count: Optional[int] = None) -> List[bytes]:
+        return self.blocks.read_range(start, count)
+
+    def find_block(self, block_hash: str) -> Optional[bytes]:
+        return self.blocks.find(block_hash)
+
+    def truncate_blocks(self, height: int) -> None:
+        self.blocks.truncate(height)
+
+    def save_transaction(  # pylint: disable=too-many-arguments
+        self,
+        transaction_hash: str,
+        status: str,
+        content: bytes,
+        sender: str = "",
+        recipient: str = "",
+        amount: float = 0.0,
+        nonce: int = 0,
+    ) -> bool:
+        return self.storage.save(
+            Path(f"{status}_transactions") / transaction_hash, content.hex()
+        )
+
+    def load_transactions(
+        self,
+        status: Optional[str] = None,
+        sender: Optional[str] = None,
+        address: Optional[str] = None,
+    ) -> List[StoredTransaction]:
+        txs = []
+        for type_ in [status] if status else TRANSACTION_STATUSES:
+            folder_name = Path(f"{type_}_transactions")
+            for f in self.storage.list_files(folder_name):
+                tx = self.storage.read_string(folder_name / f)
+                if not tx:
+                    raise ValueError(
+                        f"Found a file in {folder_name} folder that was not a transaction"
+                    )
+                txs.append(StoredTransaction(f, type_, bytes.fromhex(tx)))
+        return txs
+
+    def find_transaction(self, transaction_hash: str) -> Optional[StoredTransaction]:
+        for type_ in TRANSACTION_STATUSES:
+            path = self.storage.base_path / f"{type_}_transactions" / transaction_hash
+            if not path.exists():
+                continue
+            tx = self.storage.read_string(Path(f"{type_}_transactions") / transaction_hash)
+            if tx is not None:
+                return StoredTransaction(transaction_hash, type_, bytes.fromhex(tx))
+        return None
+
+    def move_transaction(
+        self, transaction_hash: str, from_status: str, to_status: str
+    ) -> None:
+        base_path = self.storage.base_path
+        old_path = base_path / f"{from_status}_transactions" / transaction_hash
+        if not old_path.exists():
+            return
+        self.storage.move_file(
+            old_path, base_path / f"{to_status}_transactions" / transaction_hash
+        )
+
+    def delete_transaction(self, transaction_hash: str, status: str) -> None:
+        path = self.storage.base_path / f"{status}_transactions" / transaction_hash
+        if path.exists():
+            os.remove(path)
+
+    def save_meta(self, key: str, value: str) -> bool:
+        return self.storage.save(Path(key), value)
+
+    def read_meta(self, key: str) -> Optional[str]:
+        if not (self.storage.base_path / key).exists():
+            return None
+        return self.storage.read_string(Path(key))
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Everything in a single embedded SQLite database, with indexes on block hash and
+    height, and on transaction hash, sender, recipient and status
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blocks (
+            height INTEGER PRIMARY KEY,
+            block_hash TEXT NOT NULL UNIQUE,
+            content BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS transactions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_hash TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            amount REAL NOT NULL,
+            nonce INTEGER NOT NULL,
+            content BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status);
+        CREATE INDEX IF NOT EXISTS transactions_sender
+            ON transactions (sender, status, nonce);
+        CREATE INDEX IF NOT EXISTS transactions_recipient ON transactions (recipient);
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, base_path: Path) -> None:
+        base_path.mkdir(parents=True, exist_ok=True)
+        self.path = base_path / "node.db"
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.executescript(SqliteStorage.SCHEMA)
+
+    def __query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def put_block(self, height: int, block_hash: str, content: bytes) -> bool:
+        with self.lock, self.connection:
+            rows = self.__query("SELECT block_hash FROM blocks WHERE height = ?", (height,))
+            if rows and rows[0][0] == block_hash:
+                return False
+            (count,) = self.__query("SELECT COUNT(*) FROM blocks")[0]
+            if height > count:
+                raise ValueError(
+                    f"Cannot write height {height} to a chain of {count} blocks"
+                )
+            self.connection.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+            self.connection.execute(
+                "INSERT INTO blocks (height, block_hash, content) VALUES (?, ?, ?)",
+                (height, block_hash, content),
+            )
+            return True
+
+    def load_blocks(self, start: int = 0, count: Optional[int] = None) -> List[bytes]:
+        rows = self.__query(
+            "SELECT content FROM blocks WHERE height >= ? ORDER BY height LIMIT ?",
+            (start, -1 if count is None else count),
+        )
+        return [r[0] for r in rows]
+
+    def find_block(self, block_hash: str) -> Optional[bytes]:
+        rows = self.__query(
+            "SELECT content FROM blocks WHERE block_hash = ?", (block_hash,)
+        )
+        return rows[0][0] if rows else None
+
+    def truncate_blocks(self, height: int) -> None:
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+
+    def save_transaction(  # pylint: disable=too-many-arguments
+        self,
+        transaction_hash: str,
+        status: str,
+        content: bytes,
+        sender: str = "",
+        recipient: str = "",
+        amount: float = 0.0,
+        nonce: int = 0,
+    ) -> bool:
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT INTO transactions "
+                    "(transaction_hash, status, sender, recipient, amount, nonce, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (transaction_hash) DO UPDATE SET status = excluded.status",
+                    (transaction_hash, status, sender, recipient, amount, nonce, content),
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.error("Failed to save transaction %s", transaction_hash)
+            logger.exception(e)
+        return False
+
+    def load_transactions(
+        self,
+        status: Optional[str] = None,
+        sender: Optional[str] = None,
+        address: Optional[str] = None,
+    ) -> List[StoredTransaction]:
+        clauses = []
+        params = []  # type: List[Union[str, int]]
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if sender is not None:
+            clauses.append("sender = ?")
+            params.append(sender)
+        if address is not None:
+            clauses.append(
+                "seq IN (SELECT seq FROM transactions WHERE sender = ? "
+                "UNION SELECT seq FROM transactions WHERE recipient = ?)"
+            )
+            params.extend([address, address])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.__query(
+            f"SELECT transaction_hash, status, content FROM transactions {where} "
+            "ORDER BY seq",
+            tuple(params),
+        )
+        return [StoredTransaction(*r) for r in rows]
+
+    def find_transaction(self, transaction_hash: str) -> Optional[StoredTransaction]:
+        rows = self.__query(
+            "SELECT transaction_hash, status, content FROM transactions "
+            "WHERE transaction_hash = ?",
+            (transaction_hash,),
+        )
+        return StoredTransaction(*rows[0]) if rows else None
+
+    def move_transaction(
+        self, transaction_hash: str, from_status: str, to_status: str
+    ) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE transactions SET status = ? "
+                "WHERE transaction_hash = ? AND status = ?",
+                (to_status, transaction_hash, from_status),
+            )
+
+    def delete_transaction(self, transaction_hash: str, status: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM transactions WHERE transaction_hash = ? AND status = ?",
+                (transaction_hash, status),
+            )
+
+    def save_meta(self, key: str, value: str) -> bool:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+        return True
+
+    def read_meta(self, key: str) -> Optional[str]:
+        rows = self.__query("SELECT value FROM metadata WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+
+BACKENDS = {
+    "filesystem": FileSystemStorage,
+    "sqlite": SqliteStorage,
+}  # type: Dict[str, type]
+
+_backends = {}  # type: Dict[Tuple[str, str], Tuple[StorageBackend, Optional[int]]]
+_backends_lock = threading.Lock()
+
+
+def _database_inode(backend: StorageBackend) -> Optional[int]:
+    if not isinstance(backend, SqliteStorage):
+        return None
+    try:
+        return os.stat(backend.path).st_ino
+    except FileNotFoundError:
+        return -1
+
+
+def open_backend(base_path: Path, kind: Optional[str] = None) -> StorageBackend:
+    """
+    Return the storage backend for a data location. The backend is chosen by the
+    STORAGE_BACKEND environment variable ("filesystem" by default, or "sqlite").
+
+    Backends are shared per location. A database that was deleted from under us
+    (e.g. a test wiping its data folder) is opened again.
+    """
+    kind = kind or os.getenv("STORAGE_BACKEND", "filesystem")
+    if kind not in BACKENDS:
+        raise ValueError(f"{kind} is not a supported storage backend")
+
+    key = (kind, str(base_path.resolve()))
+    with _backends_lock:
+        cached = _backends.get(key)
+        if cached is not None and _database_inode(cached[0]) == cached[1]:
+            return cached[0]
+        backend = BACKENDS[kind](base_path)
+        _backends[key] = (backend, _database_inode(backend))
+        return backend
@@ -0,0 +1,448 @@
+"""
+Bulk transfer of block headers, and of blocks together with their transactions, between nodes.
+
+Ranges are sent as a stream of length-delimited messages (Header or BlockBundle): every
+serialized message is prefixed with its length as a varint, the same framing protobuf uses
+for writeDelimitedTo/parseDelimitedFrom
+"""
+from __future__ import annotations
+
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import requests
+
+from google.protobuf.message import DecodeError
+from pydantic import BaseModel
+
+from generated import sync_pb2
+
+from block import Block, Header
+from transaction import Details, FinalTransaction, SignedRawTransaction
+from verification import Verification
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# A single serialized message, and a stream of length-delimited ones
+PROTOBUF_MIMETYPE = "application/x-protobuf"
+DELIMITED_MIMETYPE = "application/x-protobuf; delimited=true"
+
+# Most blocks a node serves in one response, and asks a peer for in one request
+MAX_SYNC_BLOCKS = 500
+
+# Most headers a node serves in one response. Headers are about 200 bytes each
+MAX_SYNC_HEADERS = 2000
+
+# (connect, read) timeout in seconds for a single range request
+TIMEOUT = (3.05, 30.0)
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0:
+        raise ValueError("Only unsigned varints are supported")
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Return the varint at pos and the position right after it
+    """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated varint")
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("Varint is too long")
+
+
+def write_delimited(message: bytes) -> bytes:
+    return encode_varint(len(message)) + message
+
+
+def read_delimited(data: bytes) -> Iterator[bytes]:
+    pos = 0
+    while pos < len(data):
+        length, pos = decode_varint(data, pos)
+        end = pos + length
+        if end > len(data):
+            raise ValueError("Truncated message")
+        yield data[pos:end]
+        pos = end
+
+
+class TransactionEnvelope(BaseModel):
+    """
+    type : <str> Status of the transaction on the node that sent it
+    transaction : <FinalTransaction> The transaction
+    """
+
+    type: str
+    transaction: FinalTransaction
+
+    def ToProtobuf(self) -> Any:
+        return sync_pb2.TransactionEnvelope(
+            transaction_hash=self.transaction.transaction_hash,
+            type=self.type,
+            transaction=self.transaction.signed_transaction.ToProtobuf(),
+        )
+
+    def SerializeToString(self) -> bytes:
+        return self.ToProtobuf().SerializeToString()
+
+    @staticmethod
+    def ParseFromString(envelope_bytes: bytes) -> TransactionEnvelope:
+        envelope = sync_pb2.TransactionEnvelope()
+        envelope.ParseFromString(envelope_bytes)
+
+        return TransactionEnvelope.FromProtobuf(envelope)
+
+    @staticmethod
+    def FromProtobuf(envelope: Any) -> TransactionEnvelope:
+        return TransactionEnvelope(
+            type=envelope.type,
+            transaction=FinalTransaction(
+                transaction_hash=envelope.transaction_hash,
+                transaction_id=envelope.transaction_hash,
+                signed_transaction=SignedRawTransaction(
+                    details=Details.FromProtobuf(envelope.transaction.details),
+                    signature=envelope.transaction.signature,
+                ),
+            ),
+        )
+
+
+class BlockBundle(BaseModel):
+    """
+    block : <Block> The block
+    transactions : <List[TransactionEnvelope]> The block's transactions known to the sender
+    """
+
+    block: Block
+    transactions: List[TransactionEnvelope] = []
+
+    def SerializeToString(self) -> bytes:
+        return sync_pb2.BlockBundle(
+            block=self.block.ToProtobuf(),
+            transactions=[t.ToProtobuf() for t in self.transactions],
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(bundle_bytes: bytes) -> BlockBundle:
+        bundle = sync_pb2.BlockBundle()
+        bundle.ParseFromString(bundle_bytes)
+
+        return BlockBundle(
+            block=Block.FromProtobuf(bundle.block),
+            transactions=[
+                TransactionEnvelope.FromProtobuf(t) for t in bundle.transactions
+            ],
+        )
+
+
+def stream_bundles(data_location: str, blocks: Iterable[Block]) -> Iterator[bytes]:
+    """
+    Serve blocks with the transactions found in this node's storage, one framed
+    BlockBundle at a time
+    """
+    for block in blocks:
+        transactions = []
+        for tx_hash in block.transactions:
+            packed = FinalTransaction.FindTransaction(data_location, tx_hash)
+            if packed is None:
+                logger.warning(
+                    "Transaction %s of block %s not found", tx_hash, block.index
+                )
+                continue
+            type_, tx = packed
+            transactions.append(TransactionEnvelope(type=type_, transaction=tx))
+        bundle = BlockBundle(block=block, transactions=transactions)
+        yield write_delimited(bundle.SerializeToString())
+
+
+def stream_headers(blocks: Iterable[Block]) -> Iterator[bytes]:
+    for block in blocks:
+        yield write_delimited(block.header.SerializeToString())
+
+
+def fetch_blocks(session: Any, node: str, start: int, count: int) -> List[BlockBundle]:
+    response = session.get(
+        f"{node}/blocks",
+        params={"from": start, "count": count},
+        timeout=TIMEOUT,
+    )
+    response.raise_for_status()
+    try:
+        return [BlockBundle.ParseFromString(m) for m in read_delimited(response.content)]
+    except DecodeError as e:
+        raise ValueError(f"Malformed response from {node}: {e}") from e
+
+
+def fetch_headers(session: Any, node: str, start: int, count: int) -> List[Header]:
+    response = session.get(
+        f"{node}/headers",
+        params={"from": start, "count": count},
+        timeout=TIMEOUT,
+    )
+    response.raise_for_status()
+    try:
+        return [Header.ParseFromString(m) for m in read_delimited(response.content)]
+    except DecodeError as e:
+        raise ValueError(f"Malformed response from {node}: {e}") from e
+
+
+def download_ranges(
+    fetch: Callable[[Any, str, int, int], List[T]],
+    node: str,
+    length: int,
+    batch_size: int,
+    start: int = 0,
+) -> List[T]:
+    """
+    Fetch the records of a peer's chain from index start up to its announced length, in
+    ranges of batch_size records over one connection. Stops early if the peer has fewer
+    records than it announced
+    """
+    records = []  # type: List[T]
+    with requests.Session() as session:
+        while start + len(records) < length:
+            count = min(batch_size, length - start - len(records))
+            received = fetch(session, node, start + len(records), count)
+            records.extend(received)
+            if len(received) < count:
+                logger.warning(
+                    "%s sent %s of %s records", node, start + len(records), length
+                )
+                break
+    return records
+
+
+def download_headers(
+    node: str, length: int, batch_size: int = MAX_SYNC_HEADERS, start: int = 0
+) -> List[Header]:
+    return download_ranges(fetch_headers, node, length, batch_size, start)
+
+
+class BlockRange(NamedTuple):
+    start: int
+    count: int
+
+    @property
+    def last(self) -> int:
+        return self.start + self.count - 1
+
+
+class ParallelDownloader:  # pylint: disable=too-many-instance-attributes
+    """
+    Downloads a run of consecutive blocks, whose hashes are already known from verified
+    headers, from every peer that has them.
+      - the blocks are split into ranges, and every peer fetches ranges it has, one at a
+        time, over its own session
+      - a range from a peer that fails, times out or sends blocks that don't match the
+        headers is given to the other peers, and that peer is not asked again
+      - once no range is left to hand out, idle peers also fetch the ranges slower peers
+        are still working on, and the first complete copy is kept
+
+    peers : <Dict[str, List[str]]> Block hashes of each peer's chain
+    start : <int> Index of the first block to download
+    hashes : <List[str]> Hashes of the blocks to download, from index start
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        peers: Dict[str, List[str]],
+        start: int,
+        hashes: List[str],
+        batch_size: int = MAX_SYNC_BLOCKS,
+        session_factory: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.peers = peers
+        self.start = start
+        self.hashes = hashes
+        self.batch_size = batch_size
+        self.session_factory = session_factory or requests.Session
+        self.__lock = threading.Lock()
+        self.__changed = threading.Condition(self.__lock)
+        self.__pending = []  # type: List[BlockRange]
+        self.__fetching = {}  # type: Dict[BlockRange, Set[str]]
+        self.__results = {}  # type: Dict[int, List[BlockBundle]]
+        self.__alive = set()  # type: Set[str]
+        self.__ranges = 0
+
+    def has_range(self, node: str, block_range: BlockRange) -> bool:
+        """
+        Every block commits to its parent, so a peer with the last block of a range has
+        all of them
+        """
+        chain_hashes = self.peers[node]
+        return (
+            len(chain_hashes) > block_range.last
+            and chain_hashes[block_range.last]
+            == self.hashes[block_range.last - self.start]
+        )
+
+    def download(self) -> List[BlockBundle]:
+        """
+        Returns the blocks in order. Raises ValueError if some of them could not be
+        downloaded from any peer
+        """
+        if not self.hashes:
+            return []
+        end = self.start + len(self.hashes)
+        sources = [n for n in self.peers if self.has_range(n, BlockRange(self.start, 1))]
+        if not sources:
+            raise ValueError("No peer has the blocks to download")
+
+        # Enough ranges to keep every peer busy, but no larger than a peer serves at once
+        batch_size = min(
+            self.batch_size, max(1, -(-len(self.hashes) // (2 * len(sources))))
+        )
+        self.__pending = [
+            BlockRange(s, min(batch_size, end - s))
+            for s in range(self.start, end, batch_size)
+        ]
+        self.__ranges = len(self.__pending)
+        self.__alive = set(sources)
+        logger.info(
+            "Downloading %s blocks in %s ranges from %s peers",
+            len(self.hashes),
+            self.__ranges,
+            len(sources),
+        )
+
+        executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="sync")
+        for node in sources:
+            executor.submit(self.__work, node)
+        with self.__changed:
+            # Peers still fetching copies of finished ranges are not waited for
+            self.__changed.wait_for(
+                lambda: len(self.__results) == self.__ranges or not self.__alive
+            )
+        executor.shutdown(wait=False)
+
+        if len(self.__results) != self.__ranges:
+            raise ValueError(
+                f"Downloaded {len(self.__results)} of {self.__ranges} block ranges"
+            )
+        return [b for s in sorted(self.__results) for b in self.__results[s]]
+
+    def __work(self, node: str) -> None:
+        with self.session_factory() as session:
+            while True:
+                with self.__changed:
+                    block_range = self.__next_range(node)
+                    if block_range is None:
+                        self.__alive.discard(node)
+                        self.__changed.notify_all()
+                        return
+
+                try:
+                    bundles = fetch_blocks(
+                        session, node, block_range.start, block_range.count
+                    )
+                    self.__check(bundles, block_range)
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.warning(
+                        "Giving up on %s for blocks %s to %s: %s",
+                        node,
+                        block_range.start,
+                        block_range.last,
+                        e,
+                    )
+                    with self.__changed:
+                        self.__finish(node, block_range)
+                        self.__alive.discard(node)
+                        if (
+                            block_range.start not in self.__results
+                            and not self.__fetching.get(block_range)
+                        ):
+                            self.__pending.insert(0, block_range)
+                        self.__changed.notify_all()
+                    return
+
+                with self.__changed:
+                    self.__finish(node, block_range)
+                    self.__results.setdefault(block_range.start, bundles)
+                    self.__changed.notify_all()
+
+    def __finish(self, node: str, block_range: BlockRange) -> None:
+        fetchers = self.__fetching[block_range]
+        fetchers.discard(node)
+        if not fetchers:
+            del self.__fetching[block_range]
+
+    def __next_range(self, node: str) -> Optional[BlockRange]:
+        """
+        Called with the lock held. Waits until there is a range for the node to fetch, and
+        returns None once there is nothing left for it to do
+        """
+        while len(self.__results) < self.__ranges:
+            for block_range in self.__pending:
+                if self.has_range(node, block_range):
+                    self.__pending.remove(block_range)
+                    self.__fetching[block_range] = {node}
+                    return block_range
+
+            # Help with the ranges other peers are still fetching
+            for block_range in sorted(self.__fetching):
+                if (
+                    block_range.start not in self.__results
+                    and node not in self.__fetching[block_range]
+                    and self.has_range(node, block_range)
+                ):
+                    self.__fetching[block_range].add(node)
+                    return block_range
+
+            if not self.__fetching and not any(
+                self.has_range(n, r)
+                for n in self.__alive
+                if n != node
+                for r in self.__pending
+            ):
+                # Nothing in flight, and no other peer can take what is left
+                return None
+            self.__changed.wait()
+        return None
+
+    def __check(self, bundles: List[BlockBundle], block_range: BlockRange) -> None:
+        if len(bundles) != block_range.count:
+            raise ValueError(f"Sent {len(bundles)} of {block_range.count} blocks")
+        for (index, bundle) in enumerate(bundles, block_range.start):
+            expected = self.hashes[index - self.start]
+            if (
+                bundle.block.index != index
+                or bundle.block.block_hash != expected
+                or Verification.hash_block_header(bundle.block.header) != expected
+            ):
+                raise ValueError(f"Block {index} does not match its header")
@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import List
+from uuid import uuid4
+
+from block import Block
+from blockchain import Blockchain
+from tests.const import TRANSACTION
+from transaction import Details, FinalTransaction, SignedRawTransaction
+from wallet import Wallet
+
+SENDER = TRANSACTION["details"]["sender"]
+SIGNED = SignedRawTransaction.parse_obj(TRANSACTION)
+
+
+class FakeBroadcaster:
+    def __init__(self) -> None:
+        self.submitted = []
+
+    def submit(self, nodes, path, payload, data=None, reply=None) -> None:
+        self.submitted.append((path, payload, data, reply))
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes = b"") -> None:
+        self.status_code = status_code
+        self.content = content
+
+
+def node() -> Blockchain:
+    chain = Blockchain("miner", uuid4(), is_test=True, difficulty=1, timestamp=0)
+    chain.broadcaster = FakeBroadcaster()
+    return chain
+
+
+def store_transactions(miner: Blockchain, follower: Blockchain, block: Block) -> None:
+    """
+    Give the follower the miner's transactions of the block
+    """
+    for tx_hash in block.transactions:
+        type_, tx = FinalTransaction.FindTransaction(miner.data_location, tx_hash)
+        follower.store_transaction(tx, type_)
+
+
+def follow(miner: Blockchain, follower: Blockchain) -> None:
+    """
+    Give the follower the miner's last block and the transactions it needs
+    """
+    store_transactions(miner, follower, miner.last_block)
+    assert follower.add_block(miner.last_block)[0]
+
+
+def transaction(sender: str, nonce: int) -> FinalTransaction:
+    """
+    An open transaction of the sender, hashed by sender and nonce. Its signature isn't valid
+    """
+    details = SIGNED.details.copy(update={"sender": sender, "nonce": nonce})
+    transaction_hash = f"{sender}-{nonce}"
+    return FinalTransaction(
+        transaction_hash=transaction_hash,
+        transaction_id=transaction_hash,
+        signed_transaction=SIGNED.copy(update={"details": details}),
+    )
+
+
+def hashes(txs: List[FinalTransaction]) -> List[str]:
+    return [t.transaction_hash for t in txs]
+
+
+def transfer(
+    wallet: Wallet, recipient: str, nonce: int, amount: float = 1.0
+) -> SignedRawTransaction:
+    """
+    A transaction from the wallet's address, signed by the wallet
+    """
+    return wallet.sign_transaction(
+        Details(
+            sender=wallet.address,
+            recipient=recipient,
+            nonce=nonce,
+            amount=amount,
+            timestamp=datetime.utcfromtimestamp(0),
+            public_key=wallet.public_key.hex(),
+        )
+    )
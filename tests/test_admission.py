@@ -0,0 +1,151 @@
+import threading
+
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from admission import AdmissionPipeline, check_fields
+from blockchain import MINING_REWARD, Blockchain
+from custom_exceptions import AdmissionQueueFullError
+from tests.const import TRANSACTION
+from transaction import Details, SignedRawTransaction
+from verification import Verification
+from wallet import Wallet
+
+SIGNED = SignedRawTransaction.parse_obj(TRANSACTION)
+
+
+def tampered(**update):
+    return SIGNED.copy(update={"details": SIGNED.details.copy(update=update)})
+
+
+class Recorder:
+    def __init__(self, reject=()):
+        self.admitted = []
+        self.persisted = 0
+        self.reject = reject
+        self.release = threading.Event()
+        self.release.set()
+
+    def admit(self, tx):
+        self.release.wait()
+        if tx.details.nonce in self.reject:
+            raise ValueError("Turned down")
+        self.admitted.append(tx)
+
+    def persist(self):
+        self.persisted += 1
+
+
+def pipeline(recorder, **kwargs):
+    return AdmissionPipeline(
+        recorder.admit, recorder.persist, signature_workers=1, **kwargs
+    )
+
+
+def test_check_fields():
+    assert check_fields(SIGNED) is None
+    assert "nonce" in check_fields(tampered(nonce=-1))
+    assert "hex" in check_fields(tampered(public_key="zz"))
+    assert "64 bytes" in check_fields(tampered(public_key="00"))
+
+
+def test_stages():
+    recorder = Recorder(reject=(7,))
+    admission = pipeline(recorder)
+    try:
+        results = [
+            admission.submit(tx).result(timeout=30)
+            for tx in [
+                SIGNED,
+                tampered(nonce=-1),
+                tampered(amount=SIGNED.details.amount + 1),
+                SIGNED.copy(update={"details": SIGNED.details.copy(update={"nonce": 7})}),
+            ]
+        ]
+        # Decoded from bytes as well
+        results.append(admission.submit(SIGNED.SerializeToString()).result(timeout=30))
+    finally:
+        admission.shutdown()
+
+    transaction_hash = Verification.hash_transaction(SIGNED)
+    assert results[0] == (transaction_hash, None)
+    assert "nonce" in results[1][1]
+    assert results[2][1] == "The signature is not valid"
+    # The signature of the nonce changed as well
+    assert results[3][1] == "The signature is not valid"
+    assert results[4] == (transaction_hash, None)
+    assert recorder.admitted == [SIGNED, SIGNED]
+    assert recorder.persisted >= 1
+
+    stats = admission.stats().stages
+    assert (stats["decode"].processed, stats["decode"].rejected) == (5, 1)
+    assert (stats["signature"].processed, stats["signature"].rejected) == (4, 2)
+    assert (stats["admit"].processed, stats["persist"].processed) == (2, 2)
+    assert stats["signature"].max_latency >= stats["signature"].average_latency > 0
+    assert stats["signature"].queued == stats["persist"].queued == 0
+
+
+def test_admit_errors():
+    recorder = Recorder(reject=(SIGNED.details.nonce,))
+    admission = pipeline(recorder)
+    try:
+        assert admission.submit(SIGNED).result(timeout=30)[1] == "Turned down"
+    finally:
+        admission.shutdown()
+    assert admission.stats().stages["admit"].rejected == 1
+
+
+def test_backpressure():
+    recorder = Recorder()
+    recorder.release.clear()
+    admission = pipeline(recorder, max_queue=1)
+    try:
+        first = admission.submit(SIGNED)
+        # The admit stage holds the first one, the queue the second one
+        while admission.stats().stages["admit"].queued:
+            pass
+        second = admission.submit(SIGNED)
+        with pytest.raises(AdmissionQueueFullError):
+            admission.submit(SIGNED, timeout=0.1)
+        recorder.release.set()
+        assert first.result(timeout=30)[1] is None
+        assert second.result(timeout=30)[1] is None
+    finally:
+        recorder.release.set()
+        admission.shutdown()
+
+
+def test_nonce_chain_is_admitted_in_order():
+    timestamp = datetime.utcfromtimestamp(0)
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, uuid4(), difficulty=1, is_test=True)
+    chain.mine_block()
+    chain.mine_block()
+
+    txs = [
+        w1.sign_transaction(
+            Details(
+                sender=w1.address,
+                recipient=w2.address,
+                nonce=nonce,
+                amount=0.5,
+                timestamp=timestamp,
+                public_key=w1.public_key.hex(),
+            )
+        )
+        for nonce in range(4)
+    ]
+    try:
+        futures = [chain.admission.submit(tx) for tx in txs]
+        results = [f.result(timeout=30) for f in futures]
+    finally:
+        chain.admission.shutdown()
+
+    assert all(error is None for (_, error) in results)
+    assert [t.transaction_hash for t in chain.get_open_transactions] == [
+        h for (h, _) in results
+    ]
+    assert chain.get_balance() == 2 * MINING_REWARD - 4 * 0.5
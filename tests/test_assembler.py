@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import pytest
+
+from assembler import RESERVED_SIZE, BlockAssembler, block_size, fifo, sender_fair
+from block import Header
+from mempool import Mempool
+from tests.helpers import hashes, transaction
+
+
+def pool():
+    return Mempool(
+        [
+            transaction("a", 0),
+            transaction("a", 1),
+            transaction("a", 2),
+            transaction("b", 0),
+            transaction("c", 0),
+            transaction("b", 1),
+        ]
+    )
+
+
+def test_fifo():
+    assert hashes(fifo(pool())) == ["a-0", "a-1", "a-2", "b-0", "c-0", "b-1"]
+
+
+def test_sender_fair():
+    assert hashes(sender_fair(pool())) == ["a-0", "b-0", "c-0", "a-1", "b-1", "a-2"]
+
+
+def test_assemble_within_the_max_size():
+    mempool = pool()
+    size = mempool.transaction_size("a-0")
+    assembler = BlockAssembler(max_size=RESERVED_SIZE + 4 * size, policy="fair")
+    assert hashes(assembler.assemble(mempool)) == ["a-0", "b-0", "c-0", "a-1"]
+
+    assembler.policy = "fifo"
+    assert hashes(assembler.assemble(mempool)) == ["a-0", "a-1", "a-2", "b-0"]
+    # Everything else stays open
+    assert len(mempool) == 6
+
+
+def test_sender_chain_stops_at_the_first_transaction_left_out():
+    mempool = pool()
+    size = mempool.transaction_size("a-0")
+    large = transaction("b", 2)
+    large = large.copy(
+        update={
+            "signed_transaction": large.signed_transaction.copy(
+                update={"signature": large.signed_transaction.signature * 4}
+            )
+        }
+    )
+    mempool.add(large)
+    mempool.add(transaction("b", 3))
+    assembler = BlockAssembler(max_size=RESERVED_SIZE + 7 * size)
+    # b-3 would fit, but can't be mined without b-2
+    assert hashes(assembler.assemble(mempool)) == hashes(fifo(pool()))
+
+
+def test_block_size():
+    header = Header(
+        version=1,
+        previous_hash="",
+        transaction_merkle_root="",
+        timestamp=datetime.utcfromtimestamp(0),
+        difficulty=1,
+        nonce=0,
+    )
+    txs = [transaction("a", 0), transaction("a", 1)]
+    assert block_size(header, []) == len(header.SerializeToString())
+    assert block_size(header, txs) == block_size(header, []) + sum(
+        len(tx.signed_transaction.SerializeToString()) for tx in txs
+    )
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BlockAssembler(policy="random")
@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+from datetime import datetime
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import test_utils, web  # noqa: E402
+
+from async_node import AsyncBroadcaster, NodeServer  # noqa: E402
+from broadcast import Delivery  # noqa: E402
+from blockchain_node import create_app  # noqa: E402
+from sync import PROTOBUF_MIMETYPE  # noqa: E402
+from tests.const import TRANSACTION  # noqa: E402
+from transaction import Details  # noqa: E402
+from wallet import Wallet  # noqa: E402
+
+
+# Mines a block, and waits for it
+MINE = {"miner_address": TRANSACTION["details"]["sender"], "wait": True}
+
+
+def serve(test):
+    """
+    Run test with a client of a test node
+    """
+
+    async def main():
+        server = NodeServer(create_app(test=True))
+        async with test_utils.TestClient(
+            test_utils.TestServer(server.application())
+        ) as client:
+            await test(client, server)
+
+    asyncio.run(main())
+
+
+def test_same_routes():
+    async def test(client, _server):
+        rv = await client.get("/chain")
+        assert rv.status == 200
+        assert (await rv.json())["length"] == 1
+
+        rv = await client.post("/mine", json=MINE)
+        assert rv.status == 200
+
+        rv = await client.get("/chain")
+        assert (await rv.json())["length"] == 2
+
+        rv = await client.get("/blocks?from=0&count=2")
+        assert rv.status == 200
+        assert rv.headers["Content-Type"].startswith("application/x-protobuf")
+
+        rv = await client.post("/transactions/new", json={})
+        assert rv.status == 400
+
+    serve(test)
+
+
+def test_concurrent_reads():
+    async def test(client, _server):
+        responses = await asyncio.gather(*[client.get("/chain") for _ in range(50)])
+        assert [r.status for r in responses] == [200] * 50
+
+    serve(test)
+
+
+def test_reads_while_the_node_changes():
+    async def test(client, server):
+        chain = server.blockchain
+        wallet = Wallet(test=True)
+        chain.max_pending_per_sender = 1000
+        chain.mine_block(wallet.address)
+        txs = [
+            wallet.sign_transaction(
+                Details(
+                    sender=wallet.address,
+                    recipient=MINE["miner_address"],
+                    nonce=nonce,
+                    amount=0.01,
+                    timestamp=datetime.utcfromtimestamp(0),
+                    public_key=wallet.public_key.hex(),
+                )
+            )
+            for nonce in range(200)
+        ]
+
+        def write():
+            for (i, tx) in enumerate(txs):
+                chain.add_transaction(tx, is_receiving=True, save=False)
+                if i % 50 == 49:
+                    chain.mine_block(wallet.address)
+
+        writer = asyncio.get_running_loop().run_in_executor(None, write)
+        statuses = []
+        while not writer.done():
+            responses = await asyncio.gather(
+                *[
+                    client.get(path)
+                    for path in ("/transactions/pending", "/chain", "/mempool/stats")
+                    for _ in range(10)
+                ]
+            )
+            statuses.extend(r.status for r in responses)
+        await writer
+        assert set(statuses) <= {200, 201}
+
+    serve(test)
+
+
+def test_broadcaster_is_async_while_serving():
+    async def test(_client, server):
+        assert server.blockchain.broadcaster is server.broadcaster
+
+    serve(test)
+
+
+def test_async_broadcaster():
+    received = []
+
+    async def protobuf_only(request):
+        received.append(("new", request.content_type, await request.read()))
+        return web.Response(status=202, body=b"wanted")
+
+    async def json_only(request):
+        if request.content_type != "application/json":
+            return web.Response(status=400)
+        received.append(("old", request.content_type, await request.read()))
+        return web.json_response({}, status=201)
+
+    async def main():
+        peers = web.Application()
+        peers.router.add_post("/new/block", protobuf_only)
+        peers.router.add_post("/new/follow-up", protobuf_only)
+        peers.router.add_post("/old/block", json_only)
+        async with test_utils.TestServer(peers) as peer:
+            async with aiohttp.ClientSession() as session:
+                broadcaster = AsyncBroadcaster(
+                    session, asyncio.get_running_loop(), retry_delay=0.01
+                )
+                replies = []
+
+                def reply(response):
+                    replies.append((response.status_code, response.content))
+                    if response.status_code == 202:
+                        return [Delivery("/follow-up", None, b"follow-up")]
+                    return []
+
+                new, old = str(peer.make_url("/new")), str(peer.make_url("/old"))
+                broadcaster.submit([new, old], "/block", {"block": "ab"}, b"\xab", reply)
+                await broadcaster.flush()
+
+                # A peer that can't be reached is given up on
+                broadcaster.submit(["http://127.0.0.1:9"], "/block", {}, b"")
+                await broadcaster.flush()
+                assert broadcaster.pending() == 0
+
+        # The follow-up is sent to the peer that asked for it, and the peer without
+        # protobuf gets JSON
+        assert sorted(received) == sorted(
+            [
+                ("new", PROTOBUF_MIMETYPE, b"\xab"),
+                ("new", PROTOBUF_MIMETYPE, b"follow-up"),
+                ("old", "application/json", json.dumps({"block": "ab"}).encode()),
+            ]
+        )
+        assert sorted(replies) == [(201, b"{}"), (202, b"wanted")]
+
+    asyncio.run(main())
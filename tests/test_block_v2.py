@@ -1,7 +1,12 @@
+import tempfile
+
 from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
 
 from block import Block
 from block import Header
+from storage import Storage
 from transaction import Details, FinalTransaction, SignedRawTransaction, get_merkle_root
 
 
@@ -135,3 +140,61 @@ def test_block_to_protobuf_and_back_with_transactions():
         transaction_count=len(transactions),
         transactions=[t.transaction_hash for t in transactions],
     )
+
+
+def test_save_load_and_find_blocks():
+    data_location = f"{tempfile.gettempdir()}/blockchain/{uuid4()}"
+    blocks = [
+        Block(
+            index=i,
+            block_hash=f"{i:064x}",
+            size=0,
+            header=Header(
+                version=1,
+                previous_hash=f"{i - 1:064x}" if i else "",
+                timestamp=datetime.utcfromtimestamp(0),
+                transaction_merkle_root="",
+                difficulty=4,
+                nonce=100,
+            ),
+            transaction_count=0,
+            transactions=[],
+        )
+        for i in range(3)
+    ]
+
+    for block in blocks:
+        Block.SaveBlock(data_location, block)
+    # Saving the chain again must not duplicate anything
+    for block in blocks:
+        Block.SaveBlock(data_location, block)
+
+    assert Block.LoadBlocks(data_location) == blocks
+    assert Block.FindBlock(data_location, blocks[1].block_hash) == blocks[1]
+    assert Block.FindBlock(data_location, "missing") is None
+
+
+def test_migrate_legacy_blocks():
+    data_location = f"{tempfile.gettempdir()}/blockchain/{uuid4()}"
+    block = Block(
+        index=0,
+        block_hash="legacy",
+        size=0,
+        header=Header(
+            version=1,
+            previous_hash="",
+            timestamp=datetime.utcfromtimestamp(0),
+            transaction_merkle_root="",
+            difficulty=4,
+            nonce=100,
+        ),
+        transaction_count=0,
+        transactions=[],
+    )
+    Storage(Path(data_location) / "blocks").save(
+        Path(block.block_hash), block.SerializeToHex()
+    )
+
+    assert Block.MigrateBlocks(data_location) == 1
+    assert Block.LoadBlocks(data_location) == [block]
+    assert Storage(Path(data_location)).list_files(Path("blocks")) == []
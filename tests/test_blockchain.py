@@ -1,8 +1,22 @@
+import threading
+
 from datetime import datetime
 from uuid import uuid4
 
-from blockchain import Blockchain
-from transaction import Details
+import pytest
+
+from assembler import RESERVED_SIZE, block_size
+from block import Block
+from blockchain import MINING_REWARD, Blockchain
+from custom_exceptions import (
+    InvalidNonceError,
+    MempoolFullError,
+    TooManyPendingError,
+)
+from mining import ParallelMiner
+from tests.const import TRANSACTION
+from tests.helpers import SENDER, follow, node, store_transactions, transfer
+from transaction import Details, FinalTransaction, SignedRawTransaction
 from verification import Verification
 from wallet import Wallet
 
@@ -134,3 +148,329 @@ def test_not_enough_coin():
         assert "This was expected to throw a ValueError exception but didn't"
     except ValueError:
         pass
+
+
+def test_save_data_only_writes_new_blocks(monkeypatch):
+    node_id = uuid4()
+    w = Wallet(test=True)
+    chain = Blockchain(w.address, node_id, difficulty=1, is_test=True)
+    chain.mine_block()
+    chain.mine_block()
+
+    saved = []
+    original = Block.SaveBlock
+    monkeypatch.setattr(
+        Block,
+        "SaveBlock",
+        staticmethod(lambda loc, block: saved.append(block) or original(loc, block)),
+    )
+
+    chain.mine_block()
+    assert [b.index for b in saved] == [3]
+
+    # Reloading from disk must not cause anything to be written again
+    saved.clear()
+    chain.load_data()
+    chain.save_data()
+    assert saved == []
+    assert Block.LoadBlocks(chain.data_location) == chain.chain
+
+
+def test_replacing_chain_rewrites_from_divergence():
+    node_id = uuid4()
+    w = Wallet(test=True)
+    chain1 = Blockchain(w.address, node_id, difficulty=1, is_test=True)
+    chain1.mine_block()
+    chain1.mine_block()
+
+    chain2 = Blockchain(w.address, uuid4(), difficulty=1, is_test=True)
+    chain2.chain = chain1.chain[:2]
+    chain2.mine_block()
+    chain2.mine_block()
+
+    chain1.chain = chain2.chain
+    chain1.save_data()
+    assert Block.LoadBlocks(chain1.data_location) == chain2.chain
+
+
+def test_balance_follows_blocks_and_open_transactions():
+    timestamp = datetime.utcfromtimestamp(0)
+    node_id = uuid4()
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, node_id, difficulty=1, is_test=True)
+
+    assert chain.get_balance() == 0
+    chain.mine_block()
+    assert chain.get_balance() == MINING_REWARD
+
+    transaction = w1.sign_transaction(
+        Details(
+            sender=w1.address,
+            recipient=w2.address,
+            nonce=0,
+            amount=2.5,
+            timestamp=timestamp,
+            public_key=w1.public_key.hex(),
+        )
+    )
+    chain.add_transaction(transaction, is_receiving=True)
+    assert chain.get_balance() == MINING_REWARD - 2.5
+    assert chain.get_balance(w2.address) == 0
+
+    chain.mine_block(w2.address)
+    assert chain.get_balance() == MINING_REWARD - 2.5
+    assert chain.get_balance(w2.address) == MINING_REWARD + 2.5
+
+    # Rebuilding from storage gives the same result as the incremental updates
+    chain.rebuild_ledger()
+    assert chain.get_balance() == MINING_REWARD - 2.5
+    assert chain.get_balance(w2.address) == MINING_REWARD + 2.5
+
+
+def test_last_nonce_comes_from_the_index(monkeypatch):
+    node_id = uuid4()
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, node_id, difficulty=1, is_test=True)
+    chain.mine_block()
+
+    def no_disk(*_args, **_kwargs):
+        raise AssertionError("Nonce lookups must not load transactions")
+
+    monkeypatch.setattr(FinalTransaction, "LoadTransactions", no_disk)
+
+    first = transfer(w1, w2.address, 0, amount=0.5)
+    chain.add_transaction(first, is_receiving=True)
+    assert chain.get_last_tx_nonce(first, "open", False) == 0
+    assert chain.get_last_tx_nonce(first, "open", True) is None
+    assert chain.get_last_tx_nonce(first, "confirmed", False) is None
+
+    chain.mine_block()
+    second = transfer(w1, w2.address, 1, amount=0.5)
+    chain.add_transaction(second, is_receiving=True)
+    chain.mine_block()
+    assert chain.get_last_tx_nonce(second, "confirmed", False) == 1
+
+
+def test_nonce_chain_of_open_transactions():
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, uuid4(), difficulty=1, is_test=True)
+    chain.max_pending_per_sender = 3
+    chain.mine_block()
+
+    chain.add_transaction(transfer(w1, w2.address, 0), is_receiving=True)
+    chain.mine_block()
+
+    # Follows the confirmed nonce with a chain of open transactions
+    txs = [transfer(w1, w2.address, nonce) for nonce in range(1, 5)]
+    chain.add_transaction(txs[0], is_receiving=True)
+    chain.add_transaction(txs[1], is_receiving=True)
+    with pytest.raises(InvalidNonceError):
+        chain.add_transaction(txs[3], is_receiving=True)
+    chain.add_transaction(txs[2], is_receiving=True)
+    with pytest.raises(TooManyPendingError):
+        chain.add_transaction(txs[3], is_receiving=True)
+
+    # The whole chain is mined in nonce order, with the reward last
+    block = chain.mine_block()
+    assert block.transactions[:-1] == [Verification.hash_transaction(t) for t in txs[:3]]
+    assert chain.get_open_transactions == []
+    assert chain.get_last_tx_nonce(txs[3], "confirmed", False) == 3
+
+
+def test_open_transactions_spend_the_balance():
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, uuid4(), difficulty=1, is_test=True)
+    chain.mine_block()
+
+    amount = MINING_REWARD * 0.6
+    chain.add_transaction(transfer(w1, w2.address, 0, amount), is_receiving=True)
+    with pytest.raises(ValueError):
+        chain.add_transaction(transfer(w1, w2.address, 1, amount), is_receiving=True)
+
+
+def test_open_transactions_keep_expiring_across_restarts(monkeypatch):
+    chain = node()
+    chain.mine_block(SENDER)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    chain.add_transaction(transaction, is_receiving=True)
+    added = chain.mempool.added_times()
+
+    restarted = node()
+    restarted.data_location = chain.data_location
+    restarted.load_data()
+    assert restarted.mempool.added_times() == added
+
+    # Expires by the time it was first added, not by the restart
+    expiry = restarted.mempool.expiry
+    monkeypatch.setattr("mempool.time.time", lambda: max(added.values()) + expiry)
+    restarted.mine_block(SENDER)
+    assert restarted.get_open_transactions == []
+    assert FinalTransaction.LoadTransactions(chain.data_location, "open") == []
+
+
+def test_evicted_transactions_are_forgotten():
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, uuid4(), difficulty=1, is_test=True)
+    chain.mine_block()
+    chain.mine_block(w2.address)
+    chain.mempool.max_transactions = 2
+
+    first, second = transfer(w1, SENDER, 0), transfer(w1, SENDER, 1)
+    chain.add_transaction(first, is_receiving=True)
+    chain.add_transaction(second, is_receiving=True)
+    assert chain.get_balance(w1.address) == MINING_REWARD - 2
+
+    # Evicts the oldest transaction, and the one following its nonce
+    other = transfer(w2, SENDER, 0)
+    chain.add_transaction(other, is_receiving=True)
+    assert chain.get_open_transactions[0].signed_transaction == other
+    assert len(chain.get_open_transactions) == 1
+    assert chain.get_balance(w1.address) == MINING_REWARD
+    assert chain.mempool.stats().evicted == 2
+    for tx in (first, second):
+        tx_hash = Verification.hash_transaction(tx)
+        assert FinalTransaction.FindTransaction(chain.data_location, tx_hash) is None
+
+    chain.mempool.max_transactions = 0
+    with pytest.raises(MempoolFullError):
+        chain.add_transaction(transfer(w2, SENDER, 1), is_receiving=True)
+
+
+def test_blocks_within_the_max_size():
+    w1 = Wallet(test=True)
+    w2 = Wallet(test=True)
+    chain = Blockchain(w1.address, uuid4(), difficulty=1, is_test=True)
+    chain.mine_block()
+    txs = [transfer(w1, w2.address, nonce) for nonce in range(3)]
+    for tx in txs:
+        chain.add_transaction(tx, is_receiving=True)
+    open_transactions = chain.get_open_transactions
+    chain.assembler.max_size = RESERVED_SIZE + 2 * len(txs[0].SerializeToString())
+
+    block = chain.mine_block()
+    assert block.transactions[:-1] == [Verification.hash_transaction(t) for t in txs[:2]]
+    assert [t.signed_transaction for t in chain.get_open_transactions] == txs[2:]
+    (_, reward) = FinalTransaction.FindTransaction(
+        chain.data_location, block.transactions[-1]
+    )
+    assert block.size == block_size(block.header, open_transactions[:2] + [reward])
+
+    block = chain.mine_block()
+    assert block.transactions[0] == Verification.hash_transaction(txs[2])
+    assert chain.get_open_transactions == []
+
+
+def test_larger_blocks_are_rejected():
+    other, chain = node(), node()
+    block = other.mine_block(SENDER)
+    store_transactions(other, chain, block)
+    chain.assembler.max_size = block.size - 1
+    assert chain.add_block(block) == (
+        False,
+        f"Block is larger than {block.size - 1} bytes",
+    )
+
+    # The size a peer declares isn't trusted
+    chain.assembler.max_size = block.size - 1
+    assert chain.add_block(block.copy(update={"size": 1})) == (
+        False,
+        f"Block is larger than {block.size - 1} bytes",
+    )
+    chain.assembler.max_size = block.size
+    assert chain.add_block(block.copy(update={"size": 1})) == (
+        False,
+        "Block size does not match its transactions",
+    )
+    assert chain.add_block(block.copy(update={"transaction_count": 5})) == (
+        False,
+        "Transaction count does not match the transactions",
+    )
+    assert chain.add_block(block)[0]
+
+
+def test_competing_block_restarts_mining():
+    # Both nodes have the transaction, and the other node mines it first
+    other, chain = node(), node()
+    other.mine_block(SENDER)
+    follow(other, chain)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    other.add_transaction(transaction, is_receiving=True)
+    chain.add_transaction(transaction, is_receiving=True)
+    chain.difficulty = 4
+
+    competing = []
+
+    def progress(_hashes):
+        if not competing:
+            competing.append(other.mine_block(SENDER))
+            follow(other, chain)
+
+    block = chain.mine_block(SENDER, progress=progress)
+
+    assert block.index == 3
+    assert block.header.previous_hash == competing[0].block_hash
+    # The transaction was in the competing block, so only the reward is left to mine
+    assert block.transaction_count == 1
+    assert chain.get_open_transactions == []
+    assert Verification.verify_chain(chain.chain)
+
+
+def test_block_received_after_the_nonce_is_found(monkeypatch):
+    other, chain = node(), node()
+    other.mine_block(SENDER)
+    follow(other, chain)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    other.add_transaction(transaction, is_receiving=True)
+    chain.add_transaction(transaction, is_receiving=True)
+
+    competing = []
+    chain_miner = []
+    mine = ParallelMiner.mine
+
+    def mine_then_receive(self, header, progress=None, cancel=None):
+        chain_miner[:] = chain_miner or [self]
+        result = mine(self, header, progress, cancel)
+        if not competing and self is chain_miner[0]:
+            # Lands between the nonce being found and the block being added
+            competing.append(other.mine_block(SENDER))
+            follow(other, chain)
+        return result
+
+    monkeypatch.setattr(ParallelMiner, "mine", mine_then_receive)
+    block = chain.mine_block(SENDER)
+
+    assert block.index == 3
+    assert block.header.previous_hash == competing[0].block_hash
+    assert block.transaction_count == 1
+    assert Verification.verify_chain(chain.chain)
+
+
+def test_template_is_refreshed_with_new_transactions():
+    chain = node()
+    chain.mine_block(SENDER)
+    # Hard enough that the first chunk of nonces hardly ever has a valid one
+    chain.difficulty = 5
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+
+    def progress(_hashes):
+        if not chain.get_open_transactions:
+            chain.add_transaction(transaction, is_receiving=True)
+
+    block = chain.mine_block(SENDER, progress=progress, refresh=0)
+
+    assert block.transactions[0] == Verification.hash_transaction(transaction)
+    assert block.transaction_count == 2
+    assert chain.get_open_transactions == []
+
+
+def test_stopped_mining_returns_nothing():
+    chain = node()
+    stop = threading.Event()
+    stop.set()
+    assert chain.mine_block(SENDER, stop=stop) is None
+    assert chain.chain_length == 1
@@ -2,12 +2,36 @@
 
 import json
 import shutil
+import time
+
+from uuid import uuid4
 
 import flask_unittest
 from flask.testing import FlaskClient
 
+from block import Block, Header
+from blockchain import Blockchain
 from blockchain_node import create_app
+from gossip import Inventory
+from relay import (
+    BlockTransactions,
+    BlockTransactionsRequest,
+    CompactBlock,
+    PrefilledTransaction,
+)
+from sync import (
+    DELIMITED_MIMETYPE,
+    PROTOBUF_MIMETYPE,
+    BlockBundle,
+    TransactionEnvelope,
+    read_delimited,
+)
 from tests.const import TRANSACTION, TRANSACTION_HASH
+from transaction import FinalTransaction, SignedRawTransaction, TransactionBatch
+from verification import Verification
+
+# Mines a block, and waits for it
+MINE = {"miner_address": TRANSACTION["details"]["sender"], "wait": True}
 
 
 class TestBase(flask_unittest.AppClientTestCase):
@@ -68,10 +92,94 @@ class TestNodeMining(TestBase):
         self.assertStatus(rv, 400)
 
     def test_mining_success(self, _, client):
-        rv = client.post(
-            "/mine", json={"miner_address": TRANSACTION["details"]["sender"]}
-        )
+        rv = client.post("/mine", json=MINE)
         self.assertStatus(rv, 200)
+        self.assertEqual(json.loads(rv.json["block"])["index"], 1)
+
+    def test_invalid_workers(self, _, client):
+        for workers in (0, 100000, "many", 1.5, True):
+            rv = client.post("/mine", json={**MINE, "workers": workers})
+            self.assertStatus(rv, 400)
+            self.assertIn("workers", rv.json["message"])
+            rv = client.post(
+                "/mining/start",
+                json={"miner_address": MINE["miner_address"], "workers": workers},
+            )
+            self.assertStatus(rv, 400)
+
+        rv = client.post("/mine", json={**MINE, "workers": 1})
+        self.assertStatus(rv, 200)
+
+    def test_mining_job(self, _, client):
+        rv = client.post("/mine", json={"miner_address": MINE["miner_address"]})
+        self.assertStatus(rv, 202)
+        job_id = rv.json["job_id"]
+
+        for _ in range(500):
+            rv = client.get(f"/mine/{job_id}")
+            self.assertStatus(rv, 200)
+            if rv.json["status"] in ("done", "failed"):
+                break
+            time.sleep(0.01)
+        self.assertEqual(rv.json["status"], "done")
+        self.assertEqual(rv.json["block"]["index"], 1)
+        self.assertGreater(rv.json["hashes"], 0)
+
+        rv = client.get("/chain")
+        self.assertEqual(rv.json["length"], 2)
+
+        rv = client.get("/mine/unknown")
+        self.assertStatus(rv, 404)
+
+    def test_mining_queue_full(self, app, client):
+        app.extensions["blockchain"].mining_queue.max_pending = 0
+        rv = client.post("/mine", json={"miner_address": MINE["miner_address"]})
+        self.assertStatus(rv, 429)
+        self.assertIn("mining jobs", rv.json["message"])
+
+
+class TestNodeMiningService(TestBase):
+    def test_start_stop_and_stats(self, _, client):
+        rv = client.post("/mining/start", json={})
+        self.assertStatus(rv, 400)
+
+        rv = client.post("/mining/start", json={"miner_address": MINE["miner_address"]})
+        self.assertStatus(rv, 200)
+        rv = client.post("/mining/start", json={"miner_address": MINE["miner_address"]})
+        self.assertStatus(rv, 409)
+        rv = client.post("/mine", json=MINE)
+        self.assertStatus(rv, 409)
+
+        for _ in range(1000):
+            rv = client.get("/mining/stats")
+            if rv.json["blocks"] >= 2:
+                break
+            time.sleep(0.01)
+        self.assertTrue(rv.json["running"])
+        self.assertGreaterEqual(rv.json["blocks"], 2)
+
+        rv = client.post("/mining/stop")
+        self.assertStatus(rv, 200)
+        rv = client.post("/mining/stop")
+        self.assertStatus(rv, 409)
+
+        stats = client.get("/mining/stats").json
+        self.assertFalse(stats["running"])
+        self.assertGreater(stats["hashes"], 0)
+        chain = client.get("/chain").json
+        self.assertEqual(chain["length"], stats["blocks"] + 1)
+        self.assertEqual(chain["chain"][-1], stats["last_block"]["block_hash"])
+
+
+class TestNodeMempool(TestBase):
+    def test_stats(self, _, client):
+        rv = client.get("/mempool/stats")
+        self.assertStatus(rv, 200)
+        self.assertEqual(rv.json["transactions"], 0)
+        self.assertEqual(rv.json["bytes"], 0)
+        self.assertEqual(rv.json["evicted"], 0)
+        self.assertEqual(rv.json["expired"], 0)
+        self.assertEqual(rv.json["eviction"], "oldest")
 
 
 class TestNodeTransaction(TestBase):
@@ -83,11 +191,11 @@ class TestNodeTransaction(TestBase):
         self.assertStatus(rv, 400)
 
     def test_new_transaction_success(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         rv = client.post("/transactions/new", json={"transaction": TRANSACTION})
 
     def test_pending_transaction(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         rv = client.post("/transactions/new", json={"transaction": TRANSACTION})
         self.assertStatus(rv, 201)
 
@@ -97,9 +205,9 @@ class TestNodeTransaction(TestBase):
         )
 
     def test_by_transaction_hash(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         client.post("/transactions/new", json={"transaction": TRANSACTION})
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
 
         rv = client.get(
             "/transaction/3e0cf83c951ffcff548e0414581ce562b626265eaa2cae5e154d2a404ce3ddee"
@@ -113,7 +221,7 @@ class TestNodeTransaction(TestBase):
         self.assertJsonEqual(rv, {"transaction": json.dumps(t), "type": "confirmed"})
 
     def test_broadcast_transaction_happy_path(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         rv = client.post(
             "/broadcast-transaction",
             json={"transaction": TRANSACTION_HASH, "type": "open"},
@@ -128,19 +236,167 @@ class TestNodeTransaction(TestBase):
             },
         )
 
+    def test_turned_down_transactions(self, app, client):
+        client.post("/mine", json=MINE)
+        blockchain = app.extensions["blockchain"]
+        blockchain.max_pending_per_sender = 0
+        for rv in (
+            client.post("/transactions/new", json={"transaction": TRANSACTION}),
+            client.post(
+                "/broadcast-transaction",
+                json={"transaction": TRANSACTION_HASH, "type": "open"},
+            ),
+        ):
+            self.assertStatus(rv, 429)
+            self.assertIn("too many open transactions", rv.json["error"])
+
+        blockchain.max_pending_per_sender = 25
+        rv = client.post("/transactions/new", json={"transaction": TRANSACTION})
+        self.assertStatus(rv, 201)
+        # The same nonce again
+        for rv in (
+            client.post("/transactions/new", json={"transaction": TRANSACTION}),
+            client.post(
+                "/broadcast-transaction",
+                json={"transaction": TRANSACTION_HASH, "type": "open"},
+            ),
+        ):
+            self.assertStatus(rv, 400)
+            self.assertIn("nonce", rv.json["error"])
+
+    def test_malformed_transactions(self, _, client):
+        client.post("/mine", json=MINE)
+        for (update, error) in (
+            ({"amount": 0}, "amount"),
+            ({"nonce": -1}, "nonce"),
+            ({"public_key": "00"}, "64 bytes"),
+        ):
+            details = {**TRANSACTION["details"], **update}
+            transaction = {**TRANSACTION, "details": details}
+            rv = client.post("/transactions/new", json={"transaction": transaction})
+            self.assertStatus(rv, 400)
+            self.assertIn(error, rv.json["error"])
+
+
+class TestNodeTransactionBatch(TestBase):
+    def test_per_transaction_results(self, _, client):
+        client.post("/mine", json=MINE)
+        transaction = SignedRawTransaction.ParseFromHex(TRANSACTION_HASH)
+        batch = TransactionBatch(transactions=[transaction, transaction])
+        rv = client.post(
+            "/transactions/batch",
+            data=batch.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 201)
+        [added, duplicate] = rv.json["results"]
+        transaction_hash = Verification.hash_transaction(transaction)
+        self.assertEqual(
+            added, {"transaction": transaction_hash, "added": True, "error": None}
+        )
+        self.assertEqual(duplicate["transaction"], transaction_hash)
+        self.assertFalse(duplicate["added"])
+        self.assertIn("nonce", duplicate["error"])
+        self.assertEqual(rv.json["block"], 2)
+
+        rv = client.get("/transactions/pending")
+        self.assertJsonEqual(rv, [transaction_hash])
+
+        # Nothing was added
+        rv = client.post("/transactions/batch", json={"transactions": [TRANSACTION_HASH]})
+        self.assertStatus(rv, 400)
+        self.assertFalse(rv.json["results"][0]["added"])
+
+        rv = client.get("/admission/stats")
+        self.assertStatus(rv, 200)
+        stages = rv.json["stages"]
+        self.assertEqual(stages["decode"]["processed"], 3)
+        self.assertEqual(stages["admit"]["processed"], 3)
+        self.assertEqual(stages["admit"]["rejected"], 2)
+        self.assertEqual(stages["persist"]["processed"], 1)
+
+    def test_invalid_batch(self, _, client):
+        rv = client.post("/transactions/batch", json={})
+        self.assertStatus(rv, 400)
+
+        rv = client.post("/transactions/batch", json={"transactions": ["zz"]})
+        self.assertStatus(rv, 400)
+
+        rv = client.post("/transactions/batch", json={"transactions": []})
+        self.assertStatus(rv, 400)
+
 
 class TestNodeBlock(TestBase):
     def test_block_by_hash(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         client.post("/transactions/new", json={"transaction": TRANSACTION})
-        rv = client.post(
-            "/mine", json={"miner_address": TRANSACTION["details"]["sender"]}
-        )
+        rv = client.post("/mine", json=MINE)
         block = rv.json["block"]
         rv = client.get("/block/" + json.loads(block)["block_hash"])
 
         self.assertJsonEqual(rv, block)
 
+    def test_block_and_transaction_as_protobuf(self, _, client):
+        client.post("/mine", json=MINE)
+        client.post("/transactions/new", json={"transaction": TRANSACTION})
+        rv = client.post("/mine", json=MINE)
+        block = Block.parse_raw(rv.json["block"])
+
+        headers = {"Accept": PROTOBUF_MIMETYPE}
+        rv = client.get("/block/" + block.block_hash, headers=headers)
+        self.assertEqual(rv.content_type, PROTOBUF_MIMETYPE)
+        self.assertEqual(Block.ParseFromString(rv.data), block)
+
+        rv = client.get(
+            "/transaction/3e0cf83c951ffcff548e0414581ce562b626265eaa2cae5e154d2a404ce3ddee",
+            headers=headers,
+        )
+        envelope = TransactionEnvelope.ParseFromString(rv.data)
+        self.assertEqual(envelope.type, "confirmed")
+        self.assertEqual(
+            envelope.transaction.signed_transaction.SerializeToHex(),
+            SignedRawTransaction.parse_obj(TRANSACTION).SerializeToHex(),
+        )
+
+
+class TestNodeBlockRange(TestBase):
+    def test_blocks_with_transactions(self, _, client):
+        client.post("/mine", json=MINE)
+        client.post("/transactions/new", json={"transaction": TRANSACTION})
+        client.post("/mine", json=MINE)
+
+        rv = client.get("/blocks?from=1&count=10")
+        self.assertStatus(rv, 200)
+        self.assertEqual(rv.content_type, DELIMITED_MIMETYPE)
+
+        bundles = [BlockBundle.ParseFromString(m) for m in read_delimited(rv.data)]
+        self.assertEqual([b.block.index for b in bundles], [1, 2])
+        hashes = [t.transaction.transaction_hash for t in bundles[1].transactions]
+        self.assertEqual(hashes, bundles[1].block.transactions)
+        self.assertIn(
+            "3e0cf83c951ffcff548e0414581ce562b626265eaa2cae5e154d2a404ce3ddee", hashes
+        )
+
+    def test_headers(self, _, client):
+        client.post("/mine", json=MINE)
+        client.post("/mine", json=MINE)
+
+        rv = client.get("/headers?from=0")
+        self.assertStatus(rv, 200)
+        headers = [Header.ParseFromString(m) for m in read_delimited(rv.data)]
+        self.assertEqual(len(headers), 3)
+        self.assertTrue(Verification.verify_headers(headers))
+
+        rv = client.get("/headers?from=-1")
+        self.assertStatus(rv, 400)
+
+    def test_invalid_range(self, _, client):
+        rv = client.get("/blocks?from=a")
+        self.assertStatus(rv, 400)
+
+        rv = client.get("/blocks?from=0&count=0")
+        self.assertStatus(rv, 400)
+
 
 class TestNodeBroadcastBlock(TestBase):
     def test_happy_path(self, _, client):
@@ -154,9 +410,131 @@ class TestNodeBroadcastBlock(TestBase):
         self.assertJsonEqual(rv, {"message": "Block added"})
 
 
+class TestNodeBroadcastProtobuf(TestBase):
+    def test_block(self, _, client):
+        rv = client.post(
+            "/broadcast-block",
+            data=bytes.fromhex(
+                "08011000225a08011240306361613265323333356136376463666261303566363463356637643965396538653161376436383937663432623565643266363831363035613366313932621a00220c0899ef97850610b0cbd7c5012804308ac8042801323a0a0130122a3078336530373165386438613433623264653661636133656138633862333163633238663734313066611900000000000024402800"
+            ),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 201)
+        self.assertJsonEqual(rv, {"message": "Block added"})
+
+        rv = client.post(
+            "/broadcast-block", data=b"not a block", content_type=PROTOBUF_MIMETYPE
+        )
+        self.assertStatus(rv, 400)
+
+    def test_transaction(self, _, client):
+        client.post("/mine", json=MINE)
+        transaction = SignedRawTransaction.ParseFromHex(TRANSACTION_HASH)
+        envelope = TransactionEnvelope(
+            type="open",
+            transaction=FinalTransaction(
+                transaction_hash="",
+                transaction_id="",
+                signed_transaction=transaction,
+            ),
+        )
+        rv = client.post(
+            "/broadcast-transaction",
+            data=envelope.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 201)
+        self.assertJsonEqual(
+            rv,
+            {
+                "message": "Successfully added transaction.",
+                "transaction": TRANSACTION_HASH,
+                "block": 2,
+            },
+        )
+
+
+class TestNodeBroadcastCompactBlock(TestBase):
+    def test_missing_transactions(self, _, client):
+        miner = Blockchain("miner", uuid4(), is_test=True, timestamp=0)
+        block = miner.mine_block()
+        compact = CompactBlock.FromBlock(block)
+
+        rv = client.post(
+            "/broadcast-compact-block",
+            data=compact.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 202)
+        self.assertEqual(rv.content_type, PROTOBUF_MIMETYPE)
+        request = BlockTransactionsRequest.ParseFromString(rv.data)
+        self.assertEqual(request.indexes, [0])
+
+        type_, reward = FinalTransaction.FindTransaction(
+            miner.data_location, block.transactions[0]
+        )
+        transactions = BlockTransactions(
+            block_hash=block.block_hash,
+            transactions=[
+                PrefilledTransaction(
+                    index=0,
+                    envelope=TransactionEnvelope(type=type_, transaction=reward),
+                )
+            ],
+        )
+        rv = client.post(
+            "/broadcast-block-transactions",
+            data=transactions.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 201)
+        self.assertJsonEqual(rv, {"message": "Block added"})
+
+        rv = client.post(
+            "/broadcast-block-transactions",
+            data=transactions.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 400)
+
+    def test_block_hash_not_hex(self, _, client):
+        miner = Blockchain("miner", uuid4(), is_test=True, timestamp=0)
+        block = miner.mine_block()
+        compact = CompactBlock(block=block.copy(update={"block_hash": "zz"}), short_ids=[])
+
+        rv = client.post(
+            "/broadcast-compact-block",
+            data=compact.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 400)
+
+
+class TestNodeInventory(TestBase):
+    def test_asks_for_unseen_transactions(self, _, client):
+        announced = Inventory(transaction_hashes=["ab", "cd"])
+        rv = client.post(
+            "/inventory",
+            data=announced.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 202)
+        self.assertEqual(Inventory.ParseFromString(rv.data), announced)
+
+        rv = client.post(
+            "/inventory",
+            data=announced.SerializeToString(),
+            content_type=PROTOBUF_MIMETYPE,
+        )
+        self.assertStatus(rv, 200)
+
+        rv = client.post("/inventory", data=b"\xff", content_type=PROTOBUF_MIMETYPE)
+        self.assertStatus(rv, 400)
+
+
 class TestNodeBroadcastBlockFailures(TestBase):
     def test_lower_index(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
         rv = client.post(
             "/broadcast-block",
             json={
@@ -182,8 +560,8 @@ class TestNodeBroadcastBlockFailures(TestBase):
         self.assertStatus(rv, 500)
 
     def test_previous_hash_mismatch(self, _, client):
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
-        client.post("/mine", json={"miner_address": TRANSACTION["details"]["sender"]})
+        client.post("/mine", json=MINE)
+        client.post("/mine", json=MINE)
         rv = client.post(
             "/broadcast-block",
             json={
@@ -0,0 +1,184 @@
+import threading
+import time
+
+from typing import Any, List, Tuple
+
+import requests
+
+from broadcast import Broadcaster, Delivery
+from sync import PROTOBUF_MIMETYPE
+
+
+class FakeResponse:
+    text = ""
+
+    def __init__(self, status_code: int = 201) -> None:
+        self.status_code = status_code
+
+
+class FakeSession:
+    """
+    Records posts. URLs starting with a host in `slow` block until released, the
+    first `failures` posts to a host in `flaky` fail to connect, posts to a host in `errors`
+    raise its exceptions in turn, and hosts in `json_only` turn down protobuf bodies
+    (recorded as None) with a 400, or with a 415 if they are in `unsupported`
+    """
+
+    def __init__(self, log: List[Tuple[str, Any]], **behaviour) -> None:
+        self.log = log
+        self.slow = behaviour.get("slow", {})
+        self.flaky = behaviour.get("flaky", {})
+        self.errors = behaviour.get("errors", {})
+        self.json_only = behaviour.get("json_only", [])
+        self.unsupported = behaviour.get("unsupported", [])
+
+    def post(
+        self, url, json=None, data=None, headers=None, timeout=None
+    ):  # pylint: disable=redefined-outer-name,too-many-arguments
+        assert timeout is not None
+        if data is not None:
+            assert headers == {"Content-Type": PROTOBUF_MIMETYPE}
+            if any(url.startswith(host) for host in self.json_only):
+                self.log.append((url, None))
+                unsupported = any(url.startswith(h) for h in self.unsupported)
+                return FakeResponse(415 if unsupported else 400)
+            json = data
+        for host, release in self.slow.items():
+            if url.startswith(host):
+                release.wait()
+        for host, errors in self.errors.items():
+            if url.startswith(host) and errors:
+                raise errors.pop(0)
+        for host in self.flaky:
+            if url.startswith(host) and self.flaky[host] > 0:
+                self.flaky[host] -= 1
+                raise requests.exceptions.ConnectionError()
+        self.log.append((url, json))
+        return FakeResponse()
+
+
+def test_submit_does_not_wait_and_keeps_order_per_peer():
+    log = []
+    release = threading.Event()
+    broadcaster = Broadcaster(
+        session_factory=lambda: FakeSession(log, slow={"http://slow": release})
+    )
+
+    started = time.monotonic()
+    for i in range(5):
+        broadcaster.submit(["http://slow", "http://fast"], "/broadcast", {"i": i})
+    assert time.monotonic() - started < 0.5
+
+    # The slow peer does not hold up the fast one
+    time.sleep(0.2)
+    assert [p["i"] for (url, p) in log if url.startswith("http://fast")] == list(
+        range(5)
+    )
+
+    release.set()
+    assert broadcaster.flush(timeout=5)
+    assert [p["i"] for (url, p) in log if url.startswith("http://slow")] == list(
+        range(5)
+    )
+
+
+def test_failed_deliveries_are_retried_in_order():
+    log = []
+    broadcaster = Broadcaster(
+        retry_delay=0.01,
+        session_factory=lambda: FakeSession(log, flaky={"http://peer": 2}),
+    )
+    broadcaster.submit(["http://peer"], "/a", {})
+    broadcaster.submit(["http://peer"], "/b", {})
+
+    assert broadcaster.flush(timeout=5)
+    assert [url for (url, _) in log] == ["http://peer/a", "http://peer/b"]
+
+
+def test_gives_up_after_max_attempts():
+    log = []
+    broadcaster = Broadcaster(
+        retry_delay=0.01,
+        max_attempts=2,
+        session_factory=lambda: FakeSession(log, flaky={"http://peer": 2}),
+    )
+    broadcaster.submit(["http://peer"], "/a", {})
+    broadcaster.submit(["http://peer"], "/b", {})
+
+    assert broadcaster.flush(timeout=5)
+    assert [url for (url, _) in log] == ["http://peer/b"]
+    assert broadcaster.pending() == 0
+
+
+def test_any_request_error_is_retried():
+    log = []
+    errors = [requests.exceptions.ChunkedEncodingError(), ValueError("unexpected")]
+    broadcaster = Broadcaster(
+        retry_delay=0.01,
+        max_attempts=2,
+        session_factory=lambda: FakeSession(log, errors={"http://peer/a": errors}),
+    )
+    broadcaster.submit(["http://peer"], "/a", {})
+    broadcaster.submit(["http://peer"], "/b", {})
+
+    # The peer's queue keeps draining, and flush doesn't wait forever
+    assert broadcaster.flush(timeout=5)
+    assert [url for (url, _) in log] == ["http://peer/b"]
+    broadcaster.submit(["http://peer"], "/a", {})
+    assert broadcaster.flush(timeout=5)
+    assert [url for (url, _) in log] == ["http://peer/b", "http://peer/a"]
+
+
+def test_follow_ups_dropping_deliveries_are_logged(caplog):
+    log = []
+    release = threading.Event()
+    broadcaster = Broadcaster(
+        max_queue=2,
+        session_factory=lambda: FakeSession(log, slow={"http://peer/a": release}),
+    )
+    follow_ups = [Delivery("/c", {}), Delivery("/d", {})]
+    broadcaster.submit(["http://peer"], "/a", {}, reply=lambda _: follow_ups)
+    broadcaster.submit(["http://peer"], "/b", {})
+
+    release.set()
+    assert broadcaster.flush(timeout=5)
+    # Follow-ups go first, and push the newest delivery out of the full queue
+    assert [url for (url, _) in log] == ["http://peer/a", "http://peer/c", "http://peer/d"]
+    assert "dropping 1 newest deliveries" in caplog.text
+
+
+def test_protobuf_bodies_fall_back_to_json():
+    log = []
+    broadcaster = Broadcaster(
+        session_factory=lambda: FakeSession(log, json_only=["http://old"])
+    )
+    for i in range(2):
+        broadcaster.submit(["http://new", "http://old"], "/a", {"i": i}, bytes([i]))
+
+    assert broadcaster.flush(timeout=5)
+    assert [p for (url, p) in log if url.startswith("http://new")] == [b"\x00", b"\x01"]
+    # A 400 may be about the delivery itself, so only that one is sent as JSON
+    old = [p for (url, p) in log if url.startswith("http://old")]
+    assert old == [None, {"i": 0}, None, {"i": 1}]
+
+
+def test_protobuf_is_tried_again_after_a_415(monkeypatch):
+    log = []
+    broadcaster = Broadcaster(
+        reprobe=60,
+        session_factory=lambda: FakeSession(
+            log, json_only=["http://old"], unsupported=["http://old"]
+        ),
+    )
+    for i in range(2):
+        broadcaster.submit(["http://old"], "/a", {"i": i}, bytes([i]))
+    assert broadcaster.flush(timeout=5)
+    # Turned down with a 415 once, then the peer is only sent JSON
+    assert [p for (_, p) in log] == [None, {"i": 0}, {"i": 1}]
+
+    later = time.monotonic() + 61
+    monkeypatch.setattr("broadcast.time.monotonic", lambda: later)
+    log.clear()
+    broadcaster.submit(["http://old"], "/a", {"i": 2}, bytes([2]))
+    assert broadcaster.flush(timeout=5)
+    assert [p for (_, p) in log] == [None, {"i": 2}]
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from gossip import Announcer, InFlight, Inventory, RecentlySeen
+from tests.const import TRANSACTION
+from tests.helpers import SENDER, FakeResponse, follow, node
+from transaction import SignedRawTransaction
+from verification import Verification
+
+
+def test_inventory_round_trip():
+    inventory = Inventory(transaction_hashes=["ab", "cd"])
+    assert Inventory.ParseFromString(inventory.SerializeToString()) == inventory
+
+
+def test_recently_seen_forgets_the_oldest():
+    seen = RecentlySeen(max_size=2)
+    assert seen.add("a")
+    assert not seen.add("a")
+    assert seen.add("b")
+    assert seen.add("c")
+    assert "a" not in seen
+    assert "b" in seen and "c" in seen
+    assert len(seen) == 2
+
+
+def test_in_flight_requests_time_out():
+    requested = InFlight(timeout=10)
+    assert requested.request("a", now=0)
+    assert not requested.request("a", now=5)
+    assert "a" in requested
+    # Not delivered in time, so it can be asked from another peer
+    assert requested.request("a", now=10)
+
+    requested.discard("a")
+    assert "a" not in requested
+    assert requested.request("a", now=11)
+
+
+def test_announcer_batches():
+    batches = []
+    announcer = Announcer(batches.append, delay=60, max_batch=2)
+    announcer.add("a")
+    assert batches == []
+    announcer.add("b")
+    assert batches == [["a", "b"]]
+
+    announcer.add("c")
+    announcer.flush()
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_announcer_waits_for_the_delay():
+    batches = []
+    announcer = Announcer(batches.append, delay=0.05)
+    announcer.add("a")
+    announcer.add("b")
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [["a", "b"]]
+
+
+def test_peers_fetch_only_unseen_transactions():
+    sender, receiver = node(), node()
+    sender.mine_block(SENDER)
+    follow(sender, receiver)
+    sender.nodes = {"http://receiver"}
+    sender.broadcaster.submitted.clear()
+
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    transaction_hash = Verification.hash_transaction(transaction)
+    sender.add_transaction(transaction)
+    sender.announcer.flush()
+
+    [(path, payload, data, reply)] = sender.broadcaster.submitted
+    assert path == "/inventory" and payload is None
+    announced = Inventory.ParseFromString(data)
+    assert announced.transaction_hashes == [transaction_hash]
+
+    wanted = receiver.receive_inventory(announced)
+    assert wanted == [transaction_hash]
+    # Announced by another peer while it is being fetched
+    assert receiver.receive_inventory(announced) == []
+
+    [delivery] = reply(
+        FakeResponse(202, Inventory(transaction_hashes=wanted).SerializeToString())
+    )
+    assert delivery.path == "/broadcast-transaction"
+    assert delivery.payload["transaction"] == transaction.SerializeToHex()
+    receiver.add_transaction(transaction, is_receiving=True)
+    assert receiver.get_open_transactions == sender.get_open_transactions
+    # Received, so no longer asked for
+    assert receiver.receive_inventory(announced) == []
+
+    assert reply(FakeResponse(200)) == []
+    # Nodes without gossip are sent the transactions
+    assert [d.path for d in reply(FakeResponse(404))] == ["/broadcast-transaction"]
+
+    # Mined before the peer answered, so there is nothing left to send
+    sender.mine_block(SENDER)
+    assert reply(FakeResponse(404)) == []
+
+
+def test_transactions_turned_down_are_asked_for_again():
+    sender, receiver = node(), node()
+    sender.mine_block(SENDER)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    transaction_hash = Verification.hash_transaction(transaction)
+    announced = Inventory(transaction_hashes=[transaction_hash])
+
+    assert receiver.receive_inventory(announced) == [transaction_hash]
+    # The receiver doesn't have the block funding it yet
+    with pytest.raises(ValueError):
+        receiver.add_transaction(transaction, is_receiving=True)
+    assert receiver.receive_inventory(announced) == [transaction_hash]
+
+    follow(sender, receiver)
+    receiver.add_transaction(transaction, is_receiving=True)
+    assert receiver.receive_inventory(announced) == []
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from ledger import Account, Ledger
+from transaction import Details, SignedRawTransaction
+
+
+def transaction(sender: str, recipient: str, amount: float) -> SignedRawTransaction:
+    return SignedRawTransaction(
+        details=Details(
+            sender=sender,
+            recipient=recipient,
+            amount=amount,
+            nonce=0,
+            timestamp=datetime.utcfromtimestamp(0),
+            public_key="pub_key",
+        ),
+        signature="sig",
+    )
+
+
+def test_pending_and_confirmed_amounts():
+    ledger = Ledger()
+    ledger.apply_block(0, "genesis", {"reward": transaction("0", "alice", 10)})
+    assert ledger.balance("alice") == 10
+
+    ledger.add_pending("t1", transaction("alice", "bob", 4))
+    assert ledger.balance("alice") == 6
+    # Open transactions can't be spent by the recipient yet
+    assert ledger.balance("bob") == 0
+    assert ledger.account("bob").pending_received == 4
+
+    ledger.apply_block(1, "b1", {"t1": transaction("alice", "bob", 4)})
+    assert ledger.balance("alice") == 6
+    assert ledger.balance("bob") == 4
+    assert ledger.account("alice") == Account(sent=4, received=10)
+
+
+def test_missing_transactions_are_resolved_later():
+    ledger = Ledger()
+    ledger.apply_block(0, "genesis", {"reward": None})
+    assert ledger.missing == {"reward"}
+    assert ledger.balance("alice") == 0
+
+    ledger.resolve("reward", transaction("0", "alice", 10))
+    assert ledger.missing == set()
+    assert ledger.balance("alice") == 10
+
+
+def test_json_round_trip_drops_pending():
+    ledger = Ledger()
+    ledger.apply_block(0, "genesis", {"reward": transaction("0", "alice", 10)})
+    ledger.add_pending("t1", transaction("alice", "bob", 4))
+
+    loaded = Ledger.FromJson(ledger.ToJson())
+    assert (loaded.height, loaded.block_hash) == (0, "genesis")
+    assert loaded.balance("alice") == 10
+    assert loaded.last_pending_nonce("alice") is None
+    assert loaded.account("bob").pending_received == 0
+
+
+def test_clear_pending():
+    ledger = Ledger()
+    ledger.apply_block(0, "genesis", {"reward": transaction("0", "alice", 10)})
+    ledger.add_pending("t1", transaction("alice", "bob", 4))
+
+    ledger.clear_pending()
+    assert ledger.last_pending_nonce("alice") is None
+    assert ledger.account("alice") == Account(received=10)
+    assert ledger.account("bob") == Account()
+
+
+def test_nonces():
+    ledger = Ledger()
+    assert ledger.last_nonce("alice") is None
+    assert ledger.last_pending_nonce("alice") is None
+
+    ledger.apply_block(0, "b0", {"t0": transaction("alice", "bob", 1)})
+    assert ledger.last_nonce("alice") == 0
+
+    t1 = transaction("alice", "bob", 1)
+    t1.details.nonce = 1
+    ledger.add_pending("t1", t1)
+    assert ledger.last_pending_nonce("alice") == 1
+    assert ledger.last_pending_nonce("alice", exclude="t1") is None
+    assert ledger.last_pending_nonce("alice", below=2) == 1
+    assert ledger.last_pending_nonce("alice", below=1) is None
+
+    ledger.apply_block(1, "b1", {"t1": t1})
+    assert ledger.last_nonce("alice") == 1
+    assert ledger.last_pending_nonce("alice") is None
+
+    ledger.apply_transaction("t1", t1, sign=-1)
+    assert ledger.last_nonce("alice") == 0
+    assert Ledger.FromJson(ledger.ToJson()).last_nonce("alice") == 0
+
+
+def test_revert_block():
+    ledger = Ledger()
+    ledger.apply_block(0, "b0", {"reward": transaction("0", "alice", 10)})
+    ledger.apply_block(
+        1, "b1", {"t1": transaction("alice", "bob", 4), "unknown": None}
+    )
+
+    # A transaction that was applied but is no longer known can't be reverted
+    assert not ledger.revert_block(0, "b0", {"t1": None, "unknown": None})
+    assert (ledger.height, ledger.balance("bob")) == (1, 4)
+
+    assert ledger.revert_block(
+        0, "b0", {"t1": transaction("alice", "bob", 4), "unknown": None}
+    )
+    assert (ledger.height, ledger.block_hash) == (0, "b0")
+    assert ledger.missing == set()
+    assert ledger.balance("alice") == 10
+    assert ledger.balance("bob") == 0
+    assert ledger.last_nonce("alice") is None
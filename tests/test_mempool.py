@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from mempool import Mempool
+from tests.helpers import hashes, transaction
+
+
+def test_transactions_keep_their_order():
+    txs = [transaction("a", 0), transaction("b", 0), transaction("a", 1)]
+    mempool = Mempool(txs)
+    assert mempool.transactions() == txs
+    assert list(mempool) == ["a-0", "b-0", "a-1"]
+    assert len(mempool) == 3
+    assert mempool["b-0"] == txs[1]
+    assert "a-1" in mempool
+    assert mempool.get("c-0") is None
+
+
+def test_sender_transactions_by_nonce():
+    mempool = Mempool([transaction("a", 2), transaction("b", 0), transaction("a", 1)])
+    assert [t.transaction_hash for t in mempool.sender_transactions("a")] == [
+        "a-1",
+        "a-2",
+    ]
+    assert mempool.sender_transactions("c") == []
+    assert sorted(mempool.senders()) == ["a", "b"]
+
+
+def test_duplicates_are_not_added():
+    mempool = Mempool([transaction("a", 0)])
+    assert not mempool.add(transaction("a", 0))
+    # Another transaction of the same sender with the same nonce
+    same_nonce = transaction("a", 0).copy(
+        update={"transaction_hash": "other", "transaction_id": "other"}
+    )
+    assert not mempool.add(same_nonce)
+    assert len(mempool) == 1
+
+
+def test_remove():
+    tx = transaction("a", 0)
+    mempool = Mempool([tx, transaction("a", 1)])
+    assert mempool.remove("a-0") == tx
+    assert mempool.remove("a-0") is None
+    assert [t.transaction_hash for t in mempool.sender_transactions("a")] == ["a-1"]
+
+    mempool.remove("a-1")
+    assert len(mempool) == 0
+    assert mempool.senders() == []
+
+
+def test_remove_from_a_large_pool():
+    mempool = Mempool(transaction(f"s{i}", 0) for i in range(100000))
+    removed = ["s0-0", "s5-0", "s99999-0"]
+    assert all(mempool.remove(h) is not None for h in removed)
+    assert len(mempool) == 100000 - len(removed)
+    assert all(h not in mempool for h in removed)
+
+
+def test_trim_evicts_the_oldest_with_later_nonces():
+    mempool = Mempool(
+        [transaction("a", 0), transaction("b", 0), transaction("a", 1)],
+        max_transactions=2,
+    )
+    # The later nonce of the sender can't be mined without the evicted one
+    assert hashes(mempool.trim()) == ["a-0", "a-1"]
+    assert list(mempool) == ["b-0"]
+    assert mempool.trim() == []
+    assert (mempool.stats().evicted, mempool.stats().transactions) == (2, 1)
+
+
+def test_trim_to_bytes_evicts_the_largest():
+    small, large = transaction("a", 0), transaction("b", 0)
+    large = large.copy(
+        update={
+            "signed_transaction": large.signed_transaction.copy(
+                update={"signature": large.signed_transaction.signature * 2}
+            )
+        }
+    )
+    mempool = Mempool([large, small], eviction="largest")
+    assert mempool.size > 2 * Mempool([small]).size
+    mempool.max_bytes = mempool.size - 1
+
+    assert hashes(mempool.trim()) == ["b-0"]
+    assert list(mempool) == ["a-0"]
+    assert mempool.size == Mempool([small]).size
+
+
+def test_expire():
+    mempool = Mempool([transaction("a", 0), transaction("a", 1)], expiry=60)
+    mempool.add(transaction("b", 0))
+    assert mempool.expire() == []
+    assert len(mempool.expire(now=time.time() + 61)) == 3
+    assert mempool.stats().expired == 3
+    assert mempool.size == 0
+
+
+def test_unknown_eviction_policy():
+    with pytest.raises(ValueError):
+        Mempool(eviction="random")
+
+
+def test_expire_by_the_time_first_added():
+    now = time.time()
+    mempool = Mempool(expiry=60)
+    mempool.add(transaction("a", 0), added=now - 61)
+    mempool.add(transaction("b", 0))
+    assert mempool.added_times()["a-0"] == now - 61
+    assert hashes(mempool.expire()) == ["a-0"]
@@ -0,0 +1,173 @@
+import multiprocessing
+import threading
+
+from datetime import datetime
+
+import pytest
+
+from block import Block, Header
+from custom_exceptions import MiningQueueFullError
+from mining import MiningQueue, MiningService, ParallelMiner
+from verification import Verification
+
+
+def header(difficulty: int) -> Header:
+    return Header(
+        version=1,
+        previous_hash="previous",
+        transaction_merkle_root="root",
+        timestamp=datetime.utcfromtimestamp(0),
+        difficulty=difficulty,
+        nonce=0,
+    )
+
+
+def test_single_worker_matches_proof_of_work():
+    result = ParallelMiner(workers=1).mine(header(2))
+
+    assert result.header == Verification.proof_of_work(header(2))
+    assert result.hashes == result.header.nonce + 1
+    assert result.hashes_per_second > 0
+
+
+def test_multiple_workers_find_a_valid_nonce(monkeypatch):
+    def terminate(_process):
+        raise AssertionError("Workers stop on their own once a nonce is found")
+
+    monkeypatch.setattr(multiprocessing.Process, "terminate", terminate)
+    result = ParallelMiner(workers=3, chunk_size=100).mine(header(3))
+
+    assert result.workers == 3
+    assert Verification.valid_nonce(result.header)
+    assert result.hashes > 0
+
+
+def test_progress_is_reported():
+    reported = []
+    result = ParallelMiner(workers=1, chunk_size=10).mine(header(2), reported.append)
+
+    assert reported == sorted(reported)
+    assert reported[-1] == result.hashes
+
+
+def test_mining_queue_runs_one_job_at_a_time():
+    running = []
+    overlapped = threading.Event()
+    release = threading.Event()
+
+    def mine(job):
+        running.append(job.job_id)
+        if len(running) > 1 and not release.is_set():
+            overlapped.set()
+        release.wait(5)
+        job.hashes = 7
+        if job.address == "nobody":
+            return None
+        return Block(
+            index=1,
+            block_hash="",
+            size=0,
+            header=header(1),
+            transaction_count=0,
+            transactions=[],
+        )
+
+    jobs = MiningQueue(mine, max_jobs=2, max_pending=2)
+    first = jobs.submit("miner")
+    second = jobs.submit("nobody")
+    assert jobs.pending() == 2
+    with pytest.raises(MiningQueueFullError):
+        jobs.submit("miner")
+    assert jobs.job(second.job_id).status == "queued"
+
+    release.set()
+    assert jobs.wait(second.job_id, timeout=5) is second
+    assert not overlapped.is_set()
+    assert running == [first.job_id, second.job_id]
+    assert (first.status, first.block.index, first.hashes) == ("done", 1, 7)
+    assert (second.status, second.block) == ("failed", None)
+    assert second.error == "No block was mined"
+    assert jobs.pending() == 0
+
+    # Finished jobs are forgotten, oldest first
+    third = jobs.submit("miner")
+    jobs.wait(third.job_id, timeout=5)
+    assert jobs.job(first.job_id) is None
+    assert jobs.job(third.job_id) is third
+    assert jobs.wait("unknown") is None
+
+
+def test_cancelled_mining_returns_nothing():
+    # No nonce makes 64 leading zeros likely, so only cancelling stops these
+    for workers in (1, 2):
+        cancel = threading.Event()
+        timer = threading.Timer(0.2, cancel.set)
+        timer.start()
+        miner = ParallelMiner(workers=workers, chunk_size=100)
+        assert miner.mine(header(64), cancel=cancel) is None
+        timer.join()
+
+
+def test_mining_service_mines_until_stopped():
+    calls = []
+
+    def mine(address, workers, progress, stop):
+        calls.append((address, workers))
+        # Hashes are reported per template, so restarting counts from 0 again
+        progress(10)
+        progress(4)
+        if len(calls) % 2:
+            return None
+        return Block(
+            index=len(calls),
+            block_hash="",
+            size=0,
+            header=header(1),
+            transaction_count=0,
+            transactions=[],
+        )
+
+    service = MiningService(mine)
+    assert not service.stop()
+    assert service.start("miner", workers=2)
+    assert not service.start("miner")
+    while service.stats().blocks < 3:
+        pass
+    assert service.stop(timeout=5)
+    assert not service.running
+
+    stats = service.stats()
+    assert not stats.running
+    assert (stats.address, stats.workers) == ("miner", 2)
+    assert stats.blocks == len(calls) // 2
+    assert stats.last_block.index == stats.blocks * 2
+    assert stats.hashes == len(calls) * 14
+    assert stats.hashes_per_second > 0
+    assert set(calls) == {("miner", 2)}
+
+
+def test_mining_service_keeps_mining_after_an_error():
+    calls = []
+
+    def mine(address, workers, progress, stop):
+        calls.append(address)
+        if len(calls) < 3:
+            raise ValueError("No template")
+        return Block(
+            index=len(calls),
+            block_hash="",
+            size=0,
+            header=header(1),
+            transaction_count=0,
+            transactions=[],
+        )
+
+    service = MiningService(mine, error_backoff=0.01)
+    assert service.start("miner")
+    while service.stats().blocks < 1:
+        pass
+    assert service.running
+    assert service.stop(timeout=5)
+
+    stats = service.stats()
+    assert (stats.errors, stats.last_error) == (2, "No template")
@@ -0,0 +1,102 @@
+from relay import (
+    BlockTransactions,
+    BlockTransactionsRequest,
+    CompactBlock,
+    short_id,
+)
+from tests.const import TRANSACTION
+from tests.helpers import SENDER, FakeResponse, follow, node
+from transaction import FinalTransaction, SignedRawTransaction
+from verification import Verification
+
+
+def mine_with_transaction():
+    """
+    Returns the miner, a node that has the transaction in its open transactions, a node
+    that doesn't, and the compact block the miner broadcast
+    """
+    miner, with_tx, without_tx = node(), node(), node()
+    miner.mine_block(SENDER)
+    follow(miner, with_tx)
+    follow(miner, without_tx)
+
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    miner.add_transaction(transaction, is_receiving=True)
+    with_tx.add_transaction(transaction, is_receiving=True)
+    miner.broadcaster.submitted.clear()
+    miner.mine_block(SENDER)
+
+    [(path, payload, data, reply)] = miner.broadcaster.submitted
+    assert path == "/broadcast-compact-block" and payload is None
+    return miner, with_tx, without_tx, CompactBlock.ParseFromString(data), reply
+
+
+def test_compact_block_round_trip():
+    miner = node()
+    block = miner.mine_block()
+    compact = CompactBlock.FromBlock(block)
+
+    assert compact.block.transactions == []
+    assert compact.short_ids == [short_id(block.block_hash, h) for h in block.transactions]
+    assert CompactBlock.ParseFromString(compact.SerializeToString()) == compact
+
+
+def test_rebuilt_from_open_transactions():
+    miner, with_tx, _, compact, _ = mine_with_transaction()
+    # Only the mining reward is sent along
+    assert [p.index for p in compact.prefilled] == [1]
+
+    block, missing = with_tx.receive_compact_block(compact)
+    assert missing == []
+    assert block == miner.last_block
+    assert with_tx.add_block(block)[0]
+    assert with_tx.get_balance(SENDER) == miner.get_balance(SENDER)
+
+
+def test_sent_along_transactions_are_saved_once_the_block_is_added():
+    miner, with_tx, _, compact, _ = mine_with_transaction()
+    reward_hash = miner.last_block.transactions[-1]
+    header = compact.block.header.copy()
+    while Verification.valid_nonce(header):
+        header.nonce += 1
+    forged = compact.copy(update={"block": compact.block.copy(update={"header": header})})
+
+    block, _ = with_tx.receive_compact_block(forged)
+    assert not with_tx.add_block(block)[0]
+    assert FinalTransaction.FindTransaction(with_tx.data_location, reward_hash) is None
+
+    block, _ = with_tx.receive_compact_block(compact)
+    assert with_tx.add_block(block)[0]
+    assert FinalTransaction.FindTransaction(with_tx.data_location, reward_hash)[0] == "mining"
+
+
+def test_missing_transactions_in_one_round_trip():
+    miner, _, without_tx, compact, reply = mine_with_transaction()
+
+    block, missing = without_tx.receive_compact_block(compact)
+    assert (block, missing) == (None, [0])
+
+    request = BlockTransactionsRequest(block_hash=compact.block.block_hash, indexes=missing)
+    [delivery] = reply(FakeResponse(202, request.SerializeToString()))
+    assert delivery.path == "/broadcast-block-transactions"
+
+    transactions = BlockTransactions.ParseFromString(delivery.data)
+    block = without_tx.receive_block_transactions(transactions)
+    assert block == miner.last_block
+    assert without_tx.add_block(block)[0]
+    assert without_tx.get_balance(SENDER) == miner.get_balance(SENDER)
+
+    # The partial block is gone once it was completed
+    assert without_tx.receive_block_transactions(transactions) is None
+
+
+def test_nodes_without_compact_blocks_get_the_full_block():
+    _, _, _, _, reply = mine_with_transaction()
+
+    deliveries = reply(FakeResponse(404))
+    assert [d.path for d in deliveries] == [
+        "/broadcast-transaction",
+        "/broadcast-transaction",
+        "/broadcast-block",
+    ]
+    assert [d.payload["type"] for d in deliveries[:2]] == ["confirmed", "mining"]
@@ -0,0 +1,153 @@
+import tempfile
+
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+from storage import (
+    FileSystemStorage,
+    SegmentedLog,
+    SqliteStorage,
+    StoredTransaction,
+    open_backend,
+)
+
+
+def new_log(segment_size: int = 1024) -> SegmentedLog:
+    return SegmentedLog(
+        Path(f"{tempfile.gettempdir()}/log/{uuid4()}"), segment_size=segment_size
+    )
+
+
+def test_append_and_read():
+    log = new_log()
+    assert log.append("a", b"first") == 0
+    assert log.append("b", b"second") == 1
+
+    assert len(log) == 2
+    assert log.read(0) == b"first"
+    assert log.find("b") == b"second"
+    assert log.find("c") is None
+    assert log.read_range() == [b"first", b"second"]
+    assert log.read_range(1, 5) == [b"second"]
+
+
+def test_rolls_over_segments():
+    log = new_log(segment_size=64)
+    payloads = [bytes([i]) * 40 for i in range(5)]
+    for (i, p) in enumerate(payloads):
+        log.append(str(i), p)
+
+    assert len(list(log.path.glob("*.segment"))) == 5
+    assert log.read_range() == payloads
+
+
+def test_put_is_idempotent_and_replaces_forks():
+    log = new_log(segment_size=64)
+    log.put(0, "genesis", b"g" * 40)
+    log.put(1, "a", b"a" * 40)
+    log.put(2, "b", b"b" * 40)
+
+    assert not log.put(1, "a", b"a" * 40)
+    assert log.put(1, "c", b"c" * 40)
+    assert log.keys() == ["genesis", "c"]
+    assert log.find("b") is None
+    assert log.read_range() == [b"g" * 40, b"c" * 40]
+
+    try:
+        log.put(5, "d", b"d")
+        assert False, "Writing past the end of the log should fail"
+    except ValueError:
+        pass
+
+
+def test_reopen_reads_index_from_disk():
+    log = new_log()
+    log.append("a", b"first")
+    log.append("b", b"second")
+
+    reopened = SegmentedLog(log.path)
+    assert reopened.keys() == ["a", "b"]
+    assert reopened.find("a") == b"first"
+
+
+def test_torn_record_is_dropped():
+    log = new_log()
+    log.append("a", b"first")
+    log.append("b", b"second")
+    with open(log.segment_path(0), mode="r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)
+
+    reopened = SegmentedLog(log.path)
+    assert reopened.keys() == ["a"]
+    reopened.append("c", b"third")
+    assert reopened.read_range() == [b"first", b"third"]
+
+
+@pytest.mark.parametrize("kind", ["filesystem", "sqlite"])
+def test_backend_blocks(kind):
+    backend = open_backend(Path(f"{tempfile.gettempdir()}/backend/{uuid4()}"), kind)
+    assert backend.put_block(0, "genesis", b"g")
+    assert backend.put_block(1, "a", b"a")
+    assert not backend.put_block(1, "a", b"a")
+    assert backend.put_block(1, "b", b"b")
+
+    assert backend.load_blocks() == [b"g", b"b"]
+    assert backend.load_blocks(1, 1) == [b"b"]
+    assert backend.find_block("b") == b"b"
+    assert backend.find_block("a") is None
+
+    backend.truncate_blocks(0)
+    assert backend.load_blocks() == []
+
+
+@pytest.mark.parametrize("kind", ["filesystem", "sqlite"])
+def test_backend_transactions(kind):
+    backend = open_backend(Path(f"{tempfile.gettempdir()}/backend/{uuid4()}"), kind)
+    backend.save_transaction("t1", "open", b"1", sender="alice", recipient="bob")
+    backend.save_transaction("t2", "open", b"2", sender="bob", recipient="carol")
+    backend.save_transaction("t3", "mining", b"3", sender="0", recipient="alice")
+
+    assert [t.transaction_hash for t in backend.load_transactions("open")] == [
+        "t1",
+        "t2",
+    ]
+    assert "t1" in [t.transaction_hash for t in backend.load_transactions(sender="alice")]
+    assert {"t1", "t3"} <= {
+        t.transaction_hash for t in backend.load_transactions(address="alice")
+    }
+    assert backend.find_transaction("t3") == StoredTransaction("t3", "mining", b"3")
+
+    backend.move_transaction("t1", "open", "confirmed")
+    assert backend.find_transaction("t1") == StoredTransaction("t1", "confirmed", b"1")
+    backend.move_transaction("t2", "open", "confirmed")
+    assert backend.load_transactions("open") == []
+    assert backend.find_transaction("missing") is None
+
+    backend.delete_transaction("t2", "open")
+    assert backend.find_transaction("t2") is not None
+    backend.delete_transaction("t2", "confirmed")
+    assert backend.find_transaction("t2") is None
+
+
+@pytest.mark.parametrize("kind", ["filesystem", "sqlite"])
+def test_backend_metadata(kind):
+    backend = open_backend(Path(f"{tempfile.gettempdir()}/backend/{uuid4()}"), kind)
+    assert backend.read_meta(".nonce") is None
+    backend.save_meta(".nonce", "1")
+    backend.save_meta(".nonce", "2")
+    assert backend.read_meta(".nonce") == "2"
+
+
+def test_backend_is_selected_by_config(monkeypatch):
+    base_path = Path(f"{tempfile.gettempdir()}/backend/{uuid4()}")
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    assert isinstance(open_backend(base_path), FileSystemStorage)
+
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    assert isinstance(open_backend(base_path), SqliteStorage)
+
+    monkeypatch.setenv("STORAGE_BACKEND", "unknown")
+    with pytest.raises(ValueError):
+        open_backend(base_path)
@@ -0,0 +1,317 @@
+import time
+
+from datetime import datetime
+from uuid import uuid4
+
+import requests
+
+import pytest
+
+import blockchain as blockchain_module
+import sync
+
+from blockchain import Blockchain
+from tests.const import TRANSACTION
+from tests.helpers import SENDER, follow, node
+from transaction import FinalTransaction, SignedRawTransaction
+from verification import Verification
+from sync import (
+    BlockBundle,
+    ParallelDownloader,
+    decode_varint,
+    encode_varint,
+    read_delimited,
+    stream_bundles,
+    stream_headers,
+    write_delimited,
+)
+
+
+class FakeResponse:
+    def __init__(self, content=b"", body=None) -> None:
+        self.content = content
+        self.body = body
+        self.ok = True
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakePeer:
+    """
+    Serves /chain, /headers and /blocks from a Blockchain, and records the ranges of
+    blocks asked for. With a forged nonce, the headers it sends don't verify
+    """
+
+    def __init__(self, chain: Blockchain, forged_nonce=None) -> None:
+        self.chain = chain
+        self.forged_nonce = forged_nonce
+        self.ranges = []
+        self.header_ranges = []
+
+    def get(self, url, params=None, timeout=None):
+        if url.endswith("/chain"):
+            return FakeResponse(
+                body={
+                    "chain": self.chain.pretty_chain(),
+                    "length": self.chain.chain_length,
+                }
+            )
+        assert timeout is not None
+        start, count = params["from"], params["count"]
+        end = start + count
+        blocks = self.chain.chain[start:end]
+        if url.endswith("/headers"):
+            self.header_ranges.append((start, count))
+            if self.forged_nonce is not None:
+                blocks[-1] = blocks[-1].copy(deep=True)
+                blocks[-1].header.nonce = self.forged_nonce
+            return FakeResponse(b"".join(stream_headers(blocks)))
+
+        assert url.endswith("/blocks")
+        self.ranges.append((start, count))
+        return FakeResponse(b"".join(stream_bundles(self.chain.data_location, blocks)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**32, 2**63 - 1])
+def test_varint_round_trip(value):
+    encoded = encode_varint(value)
+    assert decode_varint(encoded + b"\x01", 0) == (value, len(encoded))
+
+
+def test_read_delimited():
+    messages = [b"", b"a", b"x" * 300]
+    data = b"".join(write_delimited(m) for m in messages)
+    assert list(read_delimited(data)) == messages
+
+    with pytest.raises(ValueError):
+        list(read_delimited(data[:-1]))
+
+
+def test_bundle_round_trip():
+    chain = Blockchain("miner", uuid4(), is_test=True, difficulty=1)
+    chain.mine_block()
+
+    raw = next(
+        read_delimited(b"".join(stream_bundles(chain.data_location, chain.chain[1:])))
+    )
+    bundle = BlockBundle.ParseFromString(raw)
+    assert bundle.block == chain.last_block
+    assert bundle.transactions[0].type == "mining"
+    assert bundle.SerializeToString() == raw
+
+
+def test_resolve_conflicts_takes_longer_chain(monkeypatch):
+    longer = Blockchain("miner", uuid4(), is_test=True, difficulty=1)
+    for _ in range(3):
+        longer.mine_block()
+    shorter = Blockchain("other", uuid4(), is_test=True, difficulty=1)
+    shorter.mine_block()
+
+    peer = FakePeer(longer)
+    monkeypatch.setattr(sync.requests, "Session", lambda: peer)
+    monkeypatch.setattr(blockchain_module.requests, "get", peer.get)
+
+    shorter.register_node("http://peer")
+    assert shorter.resolve_conflicts()
+    assert shorter.chain == longer.chain
+    assert peer.ranges == [(0, 2), (2, 2)]
+    assert shorter.get_balance("miner") == longer.get_balance("miner")
+
+
+def test_resolve_conflicts_only_fetches_the_fork(monkeypatch):
+    genesis = datetime.utcfromtimestamp(0)
+    longer = Blockchain("miner", uuid4(), is_test=True, difficulty=1, timestamp=genesis)
+    shorter = Blockchain("other", uuid4(), is_test=True, difficulty=1, timestamp=genesis)
+
+    shared = longer.mine_block()
+    for tx_hash in shared.transactions:
+        shorter.store_transaction(
+            FinalTransaction.FindTransaction(longer.data_location, tx_hash)[1], "mining"
+        )
+    assert shorter.add_block(shared)[0]
+    for _ in range(3):
+        longer.mine_block()
+    shorter.mine_block()
+    assert shorter.get_balance("other") == 10
+
+    peer = FakePeer(longer)
+    monkeypatch.setattr(sync.requests, "Session", lambda: peer)
+    monkeypatch.setattr(blockchain_module.requests, "get", peer.get)
+
+    def rebuild():
+        raise AssertionError("The ledger should be rolled back, not rebuilt")
+
+    monkeypatch.setattr(shorter, "rebuild_ledger", rebuild)
+
+    shorter.register_node("http://peer")
+    assert shorter.common_ancestor(longer.pretty_chain()) == 1
+    assert shorter.resolve_conflicts()
+    assert shorter.chain == longer.chain
+    assert peer.header_ranges == [(2, 3)]
+    assert peer.ranges == [(2, 2), (4, 1)]
+    assert shorter.get_balance("other") == 0
+    assert shorter.get_balance("miner") == longer.get_balance("miner") == 40
+
+
+def test_resolve_conflicts_checks_headers_before_blocks(monkeypatch):
+    longer = Blockchain("miner", uuid4(), is_test=True, difficulty=2)
+    for _ in range(3):
+        longer.mine_block()
+    shorter = Blockchain("other", uuid4(), is_test=True, difficulty=2)
+    chain = shorter.chain
+
+    # A nonce that doesn't meet the difficulty for the tip's header
+    tip = longer.last_block.header.copy()
+    while Verification.valid_nonce(tip):
+        tip.nonce += 1
+    peer = FakePeer(longer, forged_nonce=tip.nonce)
+    monkeypatch.setattr(sync.requests, "Session", lambda: peer)
+    monkeypatch.setattr(blockchain_module.requests, "get", peer.get)
+
+    shorter.register_node("http://peer")
+    assert not shorter.resolve_conflicts()
+    assert shorter.chain == chain
+    assert peer.header_ranges == [(0, 4)]
+    assert peer.ranges == []
+
+
+def resolve_from(chain: Blockchain, peer_chain: Blockchain, monkeypatch) -> bool:
+    peer = FakePeer(peer_chain)
+    monkeypatch.setattr(sync.requests, "Session", lambda: peer)
+    monkeypatch.setattr(blockchain_module.requests, "get", peer.get)
+    chain.register_node("http://peer")
+    return chain.resolve_conflicts()
+
+
+def test_reorg_removes_confirmed_open_transactions(monkeypatch):
+    longer, shorter = node(), node()
+    longer.mine_block(SENDER)
+    follow(longer, shorter)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    longer.add_transaction(transaction, is_receiving=True)
+    shorter.add_transaction(transaction, is_receiving=True)
+
+    confirming = longer.mine_block(SENDER)
+    longer.mine_block(SENDER)
+    assert resolve_from(shorter, longer, monkeypatch)
+    assert shorter.get_open_transactions == []
+    assert FinalTransaction.FindTransaction(
+        shorter.data_location, confirming.transactions[0]
+    )[0] == "confirmed"
+
+    # The node keeps on mining, on top of the new chain
+    block = shorter.mine_block(SENDER)
+    assert block.header.previous_hash == Verification.hash_block_header(
+        longer.last_block.header
+    )
+    assert block.transactions[:-1] == []
+
+
+def test_reorg_opens_orphaned_transactions_again(monkeypatch):
+    longer, shorter = node(), node()
+    longer.mine_block(SENDER)
+    follow(longer, shorter)
+    transaction = SignedRawTransaction.parse_obj(TRANSACTION)
+    shorter.add_transaction(transaction, is_receiving=True)
+    orphaned = shorter.mine_block(SENDER)
+    for _ in range(2):
+        longer.mine_block(SENDER)
+
+    assert resolve_from(shorter, longer, monkeypatch)
+    [open_transaction] = shorter.get_open_transactions
+    assert open_transaction.transaction_hash == orphaned.transactions[0]
+    assert FinalTransaction.FindTransaction(
+        shorter.data_location, open_transaction.transaction_hash
+    )[0] == "open"
+    balance = longer.get_balance(SENDER)
+    assert shorter.get_balance(SENDER) == balance - transaction.details.amount
+
+    block = shorter.mine_block(SENDER)
+    assert block.transactions[0] == open_transaction.transaction_hash
+    assert shorter.get_open_transactions == []
+
+
+class FakeNetwork:
+    """
+    Serves the same chain from several hosts: "down" hosts fail to connect, "liar" hosts
+    send another chain's blocks and "slow" hosts take a while to answer
+    """
+
+    def __init__(self, chain: Blockchain, other: Blockchain) -> None:
+        self.peers = {"good": FakePeer(chain), "liar": FakePeer(other)}
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        host = url.split("/")[2]
+        self.requests.append((host, params["from"]))
+        if host.startswith("down"):
+            raise requests.exceptions.ConnectionError()
+        if host.startswith("slow"):
+            time.sleep(0.3)
+        return self.peers["liar" if host == "liar" else "good"].get(url, params, timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+def test_parallel_download_reassigns_ranges():
+    chain = Blockchain("miner", uuid4(), is_test=True, difficulty=1)
+    other = Blockchain("other", uuid4(), is_test=True, difficulty=1)
+    for _ in range(8):
+        chain.mine_block()
+        other.mine_block()
+
+    hashes = chain.pretty_chain()
+    network = FakeNetwork(chain, other)
+    peers = {
+        "http://good": hashes,
+        "http://slow": hashes,
+        "http://down": hashes,
+        "http://liar": hashes,
+        "http://short": hashes[:4],
+    }
+    downloader = ParallelDownloader(
+        peers, 1, hashes[1:], batch_size=2, session_factory=lambda: network
+    )
+
+    started = time.monotonic()
+    assert [b.block for b in downloader.download()] == chain.chain[1:]
+    # Failing peers are asked once, and the slow peer's range was fetched by another too
+    assert [h for (h, _) in network.requests].count("down") == 1
+    assert [h for (h, _) in network.requests].count("liar") == 1
+    slow = [s for (h, s) in network.requests if h == "slow"]
+    assert len(slow) == 1
+    assert [h for (h, s) in network.requests if s == slow[0]].count("slow") == 1
+    assert len([h for (h, s) in network.requests if s == slow[0]]) > 1
+    assert len(network.requests) < 2 * len(hashes)
+    assert time.monotonic() - started < 5
+
+
+def test_parallel_download_fails_without_a_good_peer():
+    chain = Blockchain("miner", uuid4(), is_test=True, difficulty=1)
+    chain.mine_block()
+    hashes = chain.pretty_chain()
+
+    network = FakeNetwork(chain, chain)
+    downloader = ParallelDownloader(
+        {"http://down": hashes, "http://elsewhere": ["x"]},
+        0,
+        hashes,
+        session_factory=lambda: network,
+    )
+    with pytest.raises(ValueError):
+        downloader.download()
+    assert network.requests == [("down", 0)]
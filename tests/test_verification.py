@@ -1,6 +1,9 @@
 from datetime import datetime
 
+import pytest
+
 from block import Block, Header
+from tests.const import TRANSACTION
 from transaction import Details, SignedRawTransaction, get_merkle_root
 from verification import Verification
 
@@ -169,3 +172,57 @@ def test_correct_nonce():
     )
 
     assert Verification.valid_nonce(block_two.header)
+
+
+def test_nonce_checker_matches_hex_digest_prefix():
+    timestamp = datetime.utcfromtimestamp(0)
+    for difficulty in range(0, 5):
+        header = Header(
+            timestamp=timestamp,
+            transaction_merkle_root="root",
+            nonce=0,
+            previous_hash="previous",
+            difficulty=difficulty,
+            version=1,
+        )
+        check = Verification.nonce_checker(header)
+        for nonce in range(5000):
+            guess = f"rootprevious{nonce}1".encode()
+            expected = Verification.hash_bytes_256(guess)[:difficulty] == "0" * difficulty
+            assert check(nonce) == expected
+
+
+def test_nonce_checker_impossible_difficulty():
+    header = Header(
+        timestamp=datetime.utcfromtimestamp(0),
+        transaction_merkle_root="root",
+        nonce=0,
+        previous_hash="previous",
+        difficulty=65,
+        version=1,
+    )
+    assert not Verification.valid_nonce(header)
+
+
+def test_find_nonce_returns_first_valid_nonce():
+    header = Header(
+        timestamp=datetime.utcfromtimestamp(0),
+        transaction_merkle_root="root",
+        nonce=0,
+        previous_hash="previous",
+        difficulty=2,
+        version=1,
+    )
+    check = Verification.nonce_checker(header)
+    expected = next(n for n in range(100000) if check(n))
+
+    assert Verification.find_nonce(header, 0, 100000) == expected
+    assert Verification.find_nonce(header, 0, expected) is None
+
+
+def test_amount_must_be_positive():
+    tx = SignedRawTransaction.parse_obj(TRANSACTION)
+    for amount in (0, -1):
+        tampered = tx.copy(update={"details": tx.details.copy(update={"amount": amount})})
+        with pytest.raises(ValueError, match="amount"):
+            Verification.verify_transaction(tampered, lambda _: 10, lambda _: -1)
@@ -12,7 +12,7 @@ import merkletools
 from google.protobuf.timestamp_pb2 import Timestamp
 
 from generated import transaction_pb2
-from storage import Storage
+from storage import TRANSACTION_STATUSES, StoredTransaction, open_backend
 
 logger = logging.getLogger(__name__)
 
@@ -146,6 +146,35 @@ class SignedRawTransaction(BaseModel):
         return SignedRawTransaction.ParseFromString(bytes.fromhex(transaction_hex))
 
 
+class TransactionBatch(BaseModel):
+    """
+    Many signed transactions, submitted together
+
+    transactions : <List[SignedRawTransaction]> The transactions, in the order to add them
+    """
+
+    transactions: List[SignedRawTransaction]
+
+    def SerializeToString(self) -> bytes:
+        return transaction_pb2.TransactionBatch(
+            transactions=[t.ToProtobuf() for t in self.transactions]
+        ).SerializeToString()
+
+    @staticmethod
+    def ParseFromString(batch_bytes: bytes) -> TransactionBatch:
+        batch = transaction_pb2.TransactionBatch()
+        batch.ParseFromString(batch_bytes)
+
+        return TransactionBatch(
+            transactions=[
+                SignedRawTransaction(
+                    details=Details.FromProtobuf(t.details), signature=t.signature
+                )
+                for t in batch.transactions
+            ]
+        )
+
+
 class FinalTransaction(BaseModel):
     """
     A final version of a SignedRawTransaction, with transaction hash and id, ready to be
@@ -165,77 +194,63 @@ class FinalTransaction(BaseModel):
     signed_transaction: SignedRawTransaction
 
     @staticmethod
-    def LoadTransactions(data_location: str, type_: str) -> List[FinalTransaction]:
-        accepted_types = ["open", "confirmed", "mining"]
-        if type_ not in accepted_types:
-            raise ValueError(f"{type_} is not a supported transaction type")
+    def FromStored(stored: StoredTransaction) -> FinalTransaction:
+        return FinalTransaction(
+            transaction_hash=stored.transaction_hash,
+            transaction_id=stored.transaction_hash,
+            signed_transaction=SignedRawTransaction.ParseFromString(stored.content),
+        )
 
-        folder_name = f"{type_}_transactions"
-        storage = Storage(Path(data_location))
-        tx_files = storage.list_files(Path(folder_name))
-        logger.debug("Found transactions: %s", tx_files)
-        txs = []
-        for f in tx_files:
-            tx = storage.read_string(Path(folder_name) / f)
-            if not tx:
-                raise ValueError(
-                    f"Found a file in {folder_name} folder that was not a transaction"
-                )
+    @staticmethod
+    def LoadTransactions(
+        data_location: str, type_: str, sender: Optional[str] = None
+    ) -> List[FinalTransaction]:
+        if type_ not in TRANSACTION_STATUSES:
+            raise ValueError(f"{type_} is not a supported transaction type")
 
-            logger.debug("Found transaction: %s", f)
-            txs.append(
-                FinalTransaction(
-                    transaction_hash=f,
-                    transaction_id=f,
-                    signed_transaction=SignedRawTransaction.ParseFromHex(tx),
-                )
-            )
+        backend = open_backend(Path(data_location))
+        stored = backend.load_transactions(type_, sender=sender)
+        logger.debug("Found transactions: %s", [t.transaction_hash for t in stored])
+        txs = [FinalTransaction.FromStored(t) for t in stored]
+        if sender is not None:
+            txs = [t for t in txs if t.signed_transaction.details.sender == sender]
         return txs
 
-    @staticmethod
-    def LoadAllTransactions(data_location: str) -> List[FinalTransaction]:
-        all_txs = []
-        for type_ in ["open", "confirmed", "mining"]:
-            for tx in FinalTransaction.LoadTransactions(data_location, type_):
-                all_txs.append(tx)
-        return all_txs
-
     @staticmethod
     def FindTransaction(
         data_location: str, transaction_hash: str
     ) -> Optional[Tuple[str, FinalTransaction]]:
-        storage = Storage(Path(data_location))
-        for type_ in ["open", "confirmed", "mining"]:
-            tx = storage.read_string(Path(f"{type_}_transactions") / transaction_hash)
-            if tx is None:
-                continue
-            return type_, FinalTransaction(
-                transaction_hash=transaction_hash,
-                transaction_id=transaction_hash,
-                signed_transaction=SignedRawTransaction.ParseFromHex(tx),
-            )
-        return None
+        stored = open_backend(Path(data_location)).find_transaction(transaction_hash)
+        if stored is None:
+            return None
+        return stored.status, FinalTransaction.FromStored(stored)
 
     @staticmethod
     def SaveTransaction(
         data_location: str, transaction: FinalTransaction, type_: str
     ) -> None:
-        accepted_types = ["open", "confirmed", "mining"]
-        if type_ not in accepted_types:
+        if type_ not in TRANSACTION_STATUSES:
             raise ValueError(f"{type_} is not a supported transaction type")
 
-        storage = Storage(Path(data_location) / f"{type_}_transactions")
-        storage.save(
-            Path(transaction.transaction_hash),
-            transaction.signed_transaction.SerializeToHex(),
+        details = transaction.signed_transaction.details
+        open_backend(Path(data_location)).save_transaction(
+            transaction.transaction_hash,
+            type_,
+            transaction.signed_transaction.SerializeToString(),
+            sender=details.sender,
+            recipient=details.recipient,
+            amount=details.amount,
+            nonce=details.nonce,
         )
 
     @staticmethod
-    def MoveOpenTransactions(data_location: str) -> None:
-        storage = Storage(Path(data_location))
-        open_tx = storage.list_files(Path("open_transactions"))
-        for tx in open_tx:
-            storage.move_file(
-                Path(data_location) / "open_transactions" / tx,
-                Path(data_location) / "confirmed_transactions" / tx,
-            )
+    def MoveTransaction(
+        data_location: str, transaction_hash: str, from_type: str, to_type: str
+    ) -> None:
+        open_backend(Path(data_location)).move_transaction(
+            transaction_hash, from_type, to_type
+        )
+
+    @staticmethod
+    def DeleteTransaction(data_location: str, transaction_hash: str, type_: str) -> None:
+        open_backend(Path(data_location)).delete_transaction(transaction_hash, type_)
@@ -1,7 +1,7 @@
 import logging
 import hashlib
 
-from typing import Callable, List
+from typing import Any, Callable, List, Optional, Tuple
 
 from block import Block, Header
 
@@ -37,6 +37,70 @@ class Verification:
         hashable_transaction = transaction.SerializeToString()
         return Verification.hash_bytes_256(hashable_transaction)
 
+    @staticmethod
+    def nonce_midstate(header: Header) -> Tuple[Any, bytes, int, bool]:
+        """
+        The hash being checked for a nonce is
+          sha256(transaction_merkle_root + previous_hash + nonce + version)
+
+        The merkle root and previous hash never change while mining, so they are hashed once
+        and the hash state is copied for every nonce. Instead of comparing the hex digest,
+        <difficulty> leading hex zeros are checked on the raw digest: difficulty // 2 zero
+        bytes, and if difficulty is odd, a next byte below 0x10.
+
+        Returns the hash state, the version suffix, the number of zero bytes and whether a
+        zero half byte follows them
+        """
+        prefix = hashlib.sha256(
+            (str(header.transaction_merkle_root) + str(header.previous_hash)).encode()
+        )
+        zero_bytes, half_byte = divmod(header.difficulty, 2)
+        return prefix, str(header.version).encode(), zero_bytes, bool(half_byte)
+
+    @staticmethod
+    def nonce_checker(header: Header) -> Callable[[int], bool]:
+        """
+        Build a function that validates nonces for the header
+        """
+        if not 0 <= header.difficulty <= 64:
+            # A sha256 hex digest can never start with more zeros than it has characters
+            return lambda nonce: False
+
+        prefix, suffix, zero_bytes, half_byte = Verification.nonce_midstate(header)
+        zeros = bytes(zero_bytes)
+
+        def check(nonce: int) -> bool:
+            guess = prefix.copy()
+            guess.update(b"%d%s" % (nonce, suffix))
+            digest = guess.digest()
+            if digest[:zero_bytes] != zeros:
+                return False
+            return not half_byte or digest[zero_bytes] < 0x10
+
+        return check
+
+    @staticmethod
+    def find_nonce(header: Header, start: int, stop: int) -> Optional[int]:
+        """
+        Return the first valid nonce in [start, stop) for the header, if any. This is the
+        mining hot loop, so the check is inlined
+        """
+        if not 0 <= header.difficulty <= 64:
+            return None
+
+        prefix, suffix, zero_bytes, half_byte = Verification.nonce_midstate(header)
+        zeros = bytes(zero_bytes)
+        copy = prefix.copy
+        for nonce in range(start, stop):
+            guess = copy()
+            guess.update(b"%d%s" % (nonce, suffix))
+            digest = guess.digest()
+            if digest[:zero_bytes] == zeros and (
+                not half_byte or digest[zero_bytes] < 0x10
+            ):
+                return nonce
+        return None
+
     @staticmethod
     def valid_nonce(header: Header) -> bool:
         """
@@ -44,14 +108,7 @@ class Verification:
         :param header: <Header> Block header
         :return: <bool> True if correct, False if not
         """
-        guess = (
-            str(header.transaction_merkle_root)
-            + str(header.previous_hash)
-            + str(header.nonce)
-            + str(header.version)
-        ).encode()
-        guess_hash = Verification.hash_bytes_256(guess)
-        return guess_hash[: header.difficulty] == "0" * header.difficulty
+        return Verification.nonce_checker(header)(header.nonce)
 
     @staticmethod
     def proof_of_work(header: Header) -> Header:
@@ -72,17 +129,19 @@ class Verification:
             I.E. If the difficulty is 4, then a valid nonce will only be found when the SHA256
                  hash contains 4 leading 0's.
         :param difficulty: <int>
-        :return: <int>
+        :return: <Header> The header with a valid nonce
         """
         logger.info(
             "Mining block for %s version and %s difficulty",
             header.version,
             header.difficulty,
         )
-        while not Verification.valid_nonce(header):
-            header.nonce += 1
-
-        return header
+        while True:
+            nonce = Verification.find_nonce(header, header.nonce, header.nonce + 10000)
+            if nonce is not None:
+                header.nonce = nonce
+                return header
+            header.nonce += 10000
 
     @classmethod
     def verify_chain(cls, blockchain: List[Block]) -> bool:
@@ -91,8 +150,18 @@ class Verification:
         :param chain: List[Block] A Blockchain
         :return: <bool> True if valid, False if not
         """
+        return cls.verify_headers([block.header for block in blockchain])
+
+    @classmethod
+    def verify_headers(cls, headers: List[Header]) -> bool:
+        """
+        Determine if a chain of block headers is valid. Only the headers are needed to check
+        that every block follows the previous one and has a valid proof of work
+        :param headers: List[Header] Headers of consecutive blocks
+        :return: <bool> True if valid, False if not
+        """
 
-        for (index, block) in enumerate(blockchain):
+        for (index, header) in enumerate(headers):
             if index == 0:
                 continue
             logger.debug(
@@ -101,8 +170,8 @@ class Verification:
                 index - 1,
             )
 
-            computed_previous_hash = cls.hash_block_header(blockchain[index - 1].header)
-            if block.header.previous_hash != computed_previous_hash:
+            computed_previous_hash = cls.hash_block_header(headers[index - 1])
+            if header.previous_hash != computed_previous_hash:
                 logger.error(
                     "Previous block hashed not equal to previous hash stored in current block"
                 )
@@ -112,7 +181,7 @@ class Verification:
                 "Checking the Block hash for index %s is correct with the nonce attached",
                 index,
             )
-            if not cls.valid_nonce(block.header):
+            if not cls.valid_nonce(header):
                 logger.error("Proof of work is invalid")
                 return False
         logger.info("Chain is valid")
@@ -124,23 +193,39 @@ class Verification:
         get_balance: Callable,
         get_last_tx_nonce: Callable,
         check_funds: bool = True,
+        check_signature: bool = True,
     ) -> bool:
         """
         Verifies the transaction.
 
         If check_funds is True, ensure that the sender has enough coin (based on the
-        transactions on the chain). Also make sure that the signature is the expected
-        signature for the given transaction.
+        transactions on the chain, minus what all of the sender's open transactions
+        spend). Also make sure that the signature is the expected signature for the given
+        transaction.
 
         If check_funds is False, just check that the signature is the expected signature
-        for the given transaction
+        for the given transaction. check_signature can be turned off when the signature was
+        verified already
+
+        Raises ValueError if the amount isn't positive
         """
+        if transaction.details.amount <= 0:
+            raise ValueError("The amount must be positive")
+
         if check_funds:
             logger.debug(
                 "Checking the sender's balance can cover the amount being transferred"
             )
             sender_balance = get_balance(transaction.details.sender)
-            if sender_balance >= transaction.details.amount:
-                logger.info("Sender has enough coin to create this transaction")
+            if sender_balance < transaction.details.amount:
+                logger.warning(
+                    "Sender has %s coin, not enough to transfer %s",
+                    sender_balance,
+                    transaction.details.amount,
+                )
+                return False
+            logger.info("Sender has enough coin to create this transaction")
 
-        return Wallet.verify_transaction(transaction, get_last_tx_nonce)
+        return Wallet.verify_transaction(
+            transaction, get_last_tx_nonce, check_signature=check_signature
+        )
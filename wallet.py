@@ -4,6 +4,7 @@ NOTE 1: There still needs to be some work with respect to securty, but this at l
         doesn't use ssh RSA, which is deprecated
 NOTE 2: This library does not protect against side-channel attacks
 """
+import json
 import logging
 import hashlib
 import shutil
@@ -22,7 +23,7 @@ from Crypto.Random import get_random_bytes
 import ecdsa
 
 from custom_exceptions import InvalidNonceError
-from storage import Storage
+from storage import open_backend
 from transaction import Details, SignedRawTransaction
 
 logger = logging.getLogger(__name__)
@@ -45,7 +46,7 @@ class Wallet:
             except Exception:
                 pass
 
-        self.storage = Storage(Path(data_location))
+        self.storage = open_backend(Path(data_location))
 
         if test:
             self.create_login("test")
@@ -97,7 +98,7 @@ class Wallet:
             }
 
             if save:
-                if self.storage.save(Path(".keys"), output):
+                if self.storage.save_meta(".keys", json.dumps(output)):
                     logger.debug("Keys saved successfully")
                 else:
                     logger.warning("Failed to save keys")
@@ -124,9 +125,10 @@ class Wallet:
             return True
 
         try:
-            data = self.storage.read_json(Path(".keys"))
-            if not data:
+            raw = self.storage.read_meta(".keys")
+            if not raw:
                 raise FileNotFoundError("Tried to login, but no key was found")
+            data = json.loads(raw)
             salt = data["salt"]
             iv = data["initialization_vector"]
             ct = data["encrypted_private_key"]
@@ -197,11 +199,11 @@ class Wallet:
         logger.debug("Retreiving address from %s", Path(".address").absolute())
 
         try:
-            address = self.storage.read_json(Path(".address"))
-            if not address:
+            raw = self.storage.read_meta(".address")
+            if not raw:
                 raise ValueError("Failed to retrieve address")
             logger.debug("Address retreived")
-            return address["address"]
+            return json.loads(raw)["address"]
         except (IOError, IndexError, ValueError):
             logger.error("Retreiving address failed...")
         return None
@@ -211,19 +213,19 @@ class Wallet:
         Save a given address to the local saved location
         """
         logger.debug("Saving address to %s", Path(".address").absolute())
-        if self.storage.save(Path(".address"), {"address": address}):
+        if self.storage.save_meta(".address", json.dumps({"address": address})):
             logger.debug("Address saved")
         else:
             logger.error("Saving address failed...")
 
     def get_nonce(self) -> int:
-        nonce = self.storage.read_string(Path(".nonce"))
+        nonce = self.storage.read_meta(".nonce")
         if nonce is None:
             return 0
         return int(nonce)
 
     def save_new_nonce(self, nonce: int) -> None:
-        self.storage.save(Path(".nonce"), nonce + 1)
+        self.storage.save_meta(".nonce", str(nonce + 1))
 
     def sign_transaction(self, details: Details) -> SignedRawTransaction:
         """
@@ -258,11 +260,14 @@ class Wallet:
         tx: SignedRawTransaction,
         get_last_tx_nonce: Callable,
         exclude_from_open: bool = False,
+        check_signature: bool = True,
     ) -> bool:
         """
         Verify signature of transaction. A transaction's signature must always be able to be
         verified because the contents of the transaction can never change. Any change in the
         transaction, will be a sign of nefarious actions.
+
+        check_signature can be turned off when the signature was verified already
         """
         logger.info("Verifying transaction")
         logger.info("Verifying nonce")
@@ -281,8 +286,10 @@ class Wallet:
         elif (
             sender_last_nonce is not None
             and sender_open_nonce is not None
-            and sender_open_nonce == sender_last_nonce + 1
+            and sender_open_nonce > sender_last_nonce
         ):
+            # The open transactions are a chain of consecutive nonces following the
+            # last nonce on the chain, so a new one follows the end of that chain
             print(
                 "Sender only has open sent transactions with nonce %s",
                 sender_open_nonce,
@@ -299,6 +306,10 @@ class Wallet:
                 "The transaction nonce must be exactly 'Expected nonce' for a valid transaction",
             )
 
+        return not check_signature or Wallet.verify_signature(tx)
+
+    @staticmethod
+    def verify_signature(tx: SignedRawTransaction) -> bool:
         logger.info("Verifying Signature")
         message = tx.details.SerializeToString()
         signature = bytes.fromhex(tx.signature)